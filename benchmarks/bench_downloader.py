@@ -0,0 +1,177 @@
+"""
+Benchmark WeatherPDFDownloader.refresh_pdf() against the local JMA stand-in.
+
+Each measurement runs in a fresh subprocess so peak RSS and I/O counters
+belong to a single refresh. Scenarios:
+
+    cold            empty data dir, full download
+    unchanged-304   primed data dir, server answers the conditional GET with 304
+    unchanged-200   primed data dir, server ignores validators (same bytes again)
+    changed         primed data dir, server publishes a new chart version
+
+Results are printed (or written with --output) as JSON so they can be
+diffed between commits.
+
+Usage:
+    python -m benchmarks.bench_downloader --repeat 5 --size 1500000
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.jma_stub import JMAStubServer, make_fixture_pdf
+
+SCENARIOS = ["cold", "unchanged-304", "unchanged-200", "changed"]
+
+
+def _peak_rss_bytes() -> int:
+    """Peak RSS of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_worker(url: str, data_dir: Path) -> dict:
+    """Measure a single refresh_pdf() call in the current process."""
+    import psutil
+    from src.chart.downloader import WeatherPDFDownloader
+
+    proc = psutil.Process()
+    # io_counters() is not available on macOS
+    has_io = hasattr(proc, "io_counters")
+    io_before = proc.io_counters() if has_io else None
+    rss_before = proc.memory_info().rss
+
+    downloader = WeatherPDFDownloader(data_dir, url)
+    start = time.perf_counter()
+    updated, pdf_hash, pdf_path = downloader.refresh_pdf()
+    wall = time.perf_counter() - start
+
+    metrics = {
+        "wall_s": wall,
+        "updated": updated,
+        "rss_before_bytes": rss_before,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+    if has_io:
+        io_after = proc.io_counters()
+        metrics.update(
+            read_syscalls=io_after.read_count - io_before.read_count,
+            write_syscalls=io_after.write_count - io_before.write_count,
+            read_bytes=io_after.read_chars - io_before.read_chars,
+            write_bytes=io_after.write_chars - io_before.write_chars,
+        )
+    return metrics
+
+
+def _prime(url: str, data_dir: Path) -> None:
+    """Bring a data dir to steady state with one in-process refresh."""
+    from src.chart.downloader import WeatherPDFDownloader
+
+    WeatherPDFDownloader(data_dir, url).refresh_pdf()
+
+
+def _measure(url: str, data_dir: Path) -> dict:
+    """Run one refresh in a fresh interpreter and return its metrics."""
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_downloader",
+            "--worker",
+            "--url",
+            url,
+            "--data",
+            str(data_dir),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout)
+
+
+def run_scenario(server: JMAStubServer, scenario: str, size: int) -> dict:
+    """Set up the data dir and stub for a scenario, then measure one refresh."""
+    server.etag = True
+    server.set_pdf(make_fixture_pdf(size, variant=0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        if scenario != "cold":
+            _prime(server.url, data_dir)
+        if scenario == "unchanged-200":
+            server.etag = False
+        if scenario == "changed":
+            server.set_pdf(make_fixture_pdf(size, variant=1))
+
+        before = len(server.requests)
+        metrics = _measure(server.url, data_dir)
+        metrics["http_requests"] = len(server.requests) - before
+    return metrics
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Median of every numeric metric, plus min/max wall time."""
+    summary = {"runs": len(runs)}
+    for key, value in runs[0].items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            summary[key] = value
+            continue
+        summary[key] = statistics.median(r[key] for r in runs)
+    walls = [r["wall_s"] for r in runs]
+    summary["wall_s_min"] = min(walls)
+    summary["wall_s_max"] = max(walls)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PDF downloader")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=1_500_000, help="PDF bytes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--bandwidth", type=int, default=None, help="bytes/s")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--data", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.url, args.data)))
+        return
+
+    results = {
+        "benchmark": "downloader",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size_bytes": args.size,
+        "latency_s": args.latency,
+        "bandwidth_bps": args.bandwidth,
+        "scenarios": {},
+    }
+    with JMAStubServer(make_fixture_pdf(args.size)) as server:
+        server.latency = args.latency
+        server.bandwidth = args.bandwidth
+        for scenario in args.scenario or SCENARIOS:
+            runs = [
+                run_scenario(server, scenario, args.size) for _ in range(args.repeat)
+            ]
+            results["scenarios"][scenario] = summarize(runs)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
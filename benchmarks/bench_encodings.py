@@ -0,0 +1,112 @@
+"""
+Benchmark the image encodings in src/chart/processors/image_tools.py.
+
+Renders a chart at the pipeline's preview sizes and encodes it with every
+entry of IMAGE_ENCODINGS, reporting for each:
+
+    bytes       encoded size
+    encode_s    median encode time
+    mae         mean absolute error per channel (0-255) after decoding
+    max_error   largest per-channel error
+    psnr_db     peak signal-to-noise ratio (inf for lossless)
+
+Use it to pick PREVIEW_ENCODING in the pipeline: the smallest payload whose
+error keeps isobar labels legible.
+
+Usage:
+    python -m benchmarks.bench_encodings --repeat 5
+    python -m benchmarks.bench_encodings --pdf ASAS_COLOR.pdf --width 300
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageStat
+
+from benchmarks.jma_stub import make_chart_pdf
+
+
+def visual_error(original: Image.Image, data: bytes) -> dict:
+    """Error metrics of an encoded image against the original."""
+    decoded = Image.open(BytesIO(data)).convert(original.mode)
+    diff = ImageChops.difference(original, decoded)
+    stat = ImageStat.Stat(diff)
+
+    mae = statistics.mean(stat.mean)
+    mse = statistics.mean(rms**2 for rms in stat.rms)
+    return {
+        "mae": mae,
+        "max_error": max(high for _, high in diff.getextrema()),
+        "psnr_db": math.inf if mse == 0 else 10 * math.log10(255**2 / mse),
+    }
+
+
+def run(img: Image.Image, repeat: int) -> dict:
+    """Encode img with every encoding and collect the metrics."""
+    from src.chart.processors.image_tools import IMAGE_ENCODINGS, encode_image
+
+    results = {}
+    for encoding in IMAGE_ENCODINGS:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = encode_image(img, encoding)
+            times.append(time.perf_counter() - start)
+        results[encoding] = {
+            "bytes": len(data),
+            "encode_s": statistics.median(times),
+            **visual_error(img, data),
+        }
+    return results
+
+
+def main(argv=None):
+    from src.chart.processors.pdf_tools import render_pdf_page
+
+    parser = argparse.ArgumentParser(description="Benchmark image encodings")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pdf", type=Path, help="PDF to render (default: fixture)")
+    parser.add_argument(
+        "--width",
+        type=int,
+        action="append",
+        help="rendered widths to test (default: 300 and 1024)",
+    )
+    parser.add_argument("--backend", default="pdfium")
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    args = parser.parse_args(argv)
+
+    results = {
+        "benchmark": "encodings",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = args.pdf
+        if pdf is None:
+            pdf = Path(tmp) / "chart.pdf"
+            pdf.write_bytes(make_chart_pdf())
+
+        for width in args.width or [300, 1024]:
+            img = render_pdf_page(pdf, size=(width, None), backend=args.backend)
+            label = f"{img.width}x{img.height}"
+            results["sizes"][label] = run(img, args.repeat)
+
+    # inf is not valid JSON
+    text = json.dumps(results, indent=2).replace("Infinity", '"inf"')
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark WeatherVision model loading (WeatherVision.load_model) with each
+weight dtype and with and without direct-to-device placement.
+
+Configurations:
+
+    fp32-copy   float32, loaded on the CPU then moved with model.to()
+    fp32        float32, loaded straight onto the device
+    bf16        bfloat16, loaded straight onto the device
+    fp16        float16, loaded straight onto the device
+    auto        the dtype stored in the checkpoint
+
+Every configuration loads in a fresh subprocess, so its peak RSS is not
+polluted by the others. Reported per configuration:
+
+    load_s              wall time of load_model()
+    baseline_rss_bytes  RSS after importing torch and transformers
+    peak_rss_bytes      peak RSS of the whole process
+    weights_bytes       size of the loaded parameters
+
+Configurations that fail (e.g. bfloat16 on an old MPS) are reported with
+their error instead. By default the real model is loaded; --random-weights
+first saves an untrained model of the same architecture as float16
+safetensors, like the published checkpoint, so nothing is downloaded.
+
+Usage:
+    python -m benchmarks.bench_model_load
+    python -m benchmarks.bench_model_load --random-weights --config fp32 --config bf16
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_downloader import _peak_rss_bytes
+
+CONFIGS = {
+    "fp32-copy": {"dtype": "float32", "device_map": False},
+    "fp32": {"dtype": "float32", "device_map": True},
+    "bf16": {"dtype": "bfloat16", "device_map": True},
+    "fp16": {"dtype": "float16", "device_map": True},
+    "auto": {"dtype": "auto", "device_map": True},
+}
+
+
+def run_worker(config: str, model_name: str | None) -> dict:
+    """Load the model once with one configuration in the current process."""
+    import psutil
+    import torch
+
+    from src.forecast.generator import WeatherVision
+
+    if torch.backends.mps.is_available():
+        device = torch.device("mps")
+    else:
+        device = torch.device("cpu")
+    baseline = psutil.Process().memory_info().rss
+
+    start = time.perf_counter()
+    model = WeatherVision.load_model(device, model_name=model_name, **CONFIGS[config])
+    load_s = time.perf_counter() - start
+
+    return {
+        "device": device.type,
+        "dtype": str(model.dtype),
+        "load_s": load_s,
+        "baseline_rss_bytes": baseline,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "weights_bytes": sum(p.numel() * p.element_size() for p in model.parameters()),
+    }
+
+
+def save_random_weights(path: Path) -> None:
+    """Save an untrained model of the real architecture as float16."""
+    import torch
+    from transformers import LlavaForConditionalGeneration
+
+    from benchmarks.bench_prefix_cache import random_weights_config
+
+    config = random_weights_config()
+    model = LlavaForConditionalGeneration(config).to(torch.float16)
+    model.config.torch_dtype = torch.float16
+    model.save_pretrained(path, safe_serialization=True)
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    """Run this module in a fresh interpreter."""
+    command = [sys.executable, "-m", "benchmarks.bench_model_load", *args]
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def _measure(config: str, model_name: str | None) -> dict:
+    """Load one configuration in a fresh interpreter and return its metrics."""
+    args = ["--worker", "--config", config]
+    if model_name:
+        args += ["--model", model_name]
+
+    out = _run(*args)
+    if out.returncode != 0:
+        lines = out.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {out.returncode}"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark model loading")
+    parser.add_argument("--config", choices=list(CONFIGS), action="append")
+    parser.add_argument("--model", help="hub name or local directory")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--save-random", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.config[0], args.model)))
+        return
+    if args.save_random:
+        save_random_weights(args.save_random)
+        return
+
+    results = {
+        "benchmark": "model_load",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "random_weights": args.random_weights,
+        "configs": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        model_name = args.model
+        if args.random_weights:
+            # Saved in a subprocess so this process stays small
+            model_name = str(Path(tmp) / "model")
+            out = _run("--save-random", model_name)
+            if out.returncode != 0:
+                sys.exit(out.stderr)
+
+        for config in args.config or list(CONFIGS):
+            results["configs"][config] = _measure(config, model_name)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark time-to-first-token (TTFT) of WeatherVision with and without a
+registered prompt-prefix KV cache (WeatherVision.register_prefix).
+
+TTFT is the latency of generate_answers(..., max_tokens=1) once the chart's
+vision features are cached, so it covers tokenizing, prefilling the prompt
+and picking the first token. Reported per mode:
+
+    ttft_s      median TTFT
+    min_s       fastest run
+
+plus the time to build the prefix cache (register_s) and the prefix and
+prompt lengths in text tokens; each <image> adds its vision tokens (729
+for a 384x384 image) on top.
+
+By default the real model is loaded. --random-weights builds an untrained
+model with the llava-interleave-qwen-0.5b architecture (SigLIP vision tower,
+Qwen2-0.5B language model) and a stand-in tokenizer of about four characters
+per token, so prefill timings are representative without downloading the
+weights; the generated tokens are meaningless.
+
+Usage:
+    python -m benchmarks.bench_prefix_cache --repeat 5
+    python -m benchmarks.bench_prefix_cache --random-weights --repeat 3
+"""
+
+import argparse
+import json
+import platform
+import re
+import statistics
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from benchmarks.jma_stub import make_chart_pdf
+
+# A typical chat-formatted instruction prefix, shared by every prompt
+PREFIX = (
+    "<|im_start|>system\n"
+    "You are a meteorologist at the Japan Meteorological Agency. You read "
+    "surface analysis charts of the Asia-Pacific region: isobars every 4 hPa, "
+    "high (H) and low (L) pressure centres with their central pressure, "
+    "warm, cold, occluded and stationary fronts, and typhoon symbols. Write "
+    "for the general public in plain English. Start with a one-line title, "
+    "then describe the main pressure systems, their movement and the weather "
+    "they bring to Japan over the next 24 hours. Mention strong winds, heavy "
+    "rain or snow where the isobars or fronts suggest them. Do not invent "
+    "numbers that are not on the chart.<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+PROMPT = PREFIX + "<image>\nTitle and description<|im_end|>\n<|im_start|>assistant\n"
+
+
+class StubTokenizer:
+    """Tokenizer stand-in: about four characters per token, no vocabulary."""
+
+    eos_token_id = 0
+    padding_side = "right"
+
+    def __init__(self, image_token_id: int, vocab_size: int):
+        self.image_token_id = image_token_id
+        self.vocab_size = vocab_size
+
+    def __call__(self, text, return_tensors="pt"):
+        import torch
+
+        pieces = re.findall(r"<image>|(?:(?!<image>).){1,4}", text, flags=re.DOTALL)
+        ids = [
+            (
+                self.image_token_id
+                if piece == StubProcessor.image_token
+                else 1 + zlib.crc32(piece.encode()) % (self.vocab_size - 2)
+            )
+            for piece in pieces
+        ]
+        return {
+            "input_ids": torch.tensor([ids]),
+            "attention_mask": torch.ones(1, len(ids), dtype=torch.long),
+        }
+
+
+class StubProcessor:
+    """Processor stand-in for --random-weights."""
+
+    image_token = "<image>"
+
+    def __init__(self, image_token_id: int, vocab_size: int, image_size: int):
+        self.tokenizer = StubTokenizer(image_token_id, vocab_size)
+        self.image_size = image_size
+
+    def image_processor(self, images, return_tensors="pt"):
+        import torch
+
+        size = (self.image_size, self.image_size)
+        pixels = [
+            torch.frombuffer(bytearray(img.resize(size).tobytes()), dtype=torch.uint8)
+            .view(*size, 3)
+            .permute(2, 0, 1)
+            for img in images
+        ]
+        return {"pixel_values": torch.stack(pixels).float() / 127.5 - 1}
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return " ".join(str(t) for t in tokens.tolist())
+
+
+def random_weights_config():
+    """LlavaConfig of llava-interleave-qwen-0.5b (SigLIP + Qwen2-0.5B)."""
+    from transformers import LlavaConfig, Qwen2Config, SiglipVisionConfig
+
+    return LlavaConfig(
+        vision_config=SiglipVisionConfig(
+            hidden_size=1152,
+            intermediate_size=4304,
+            num_hidden_layers=26,
+            num_attention_heads=16,
+            image_size=384,
+            patch_size=14,
+        ),
+        text_config=Qwen2Config(
+            vocab_size=152000,
+            hidden_size=896,
+            intermediate_size=4864,
+            num_hidden_layers=24,
+            num_attention_heads=14,
+            num_key_value_heads=2,
+            rope_theta=1000000.0,
+            tie_word_embeddings=True,
+        ),
+        image_token_id=151646,
+        vision_feature_select_strategy="full",
+        vision_feature_layer=-1,
+    )
+
+
+def random_weights_vision():
+    """WeatherVision backed by an untrained model of the real architecture."""
+    from transformers import LlavaForConditionalGeneration
+
+    from src.forecast.generator import WeatherVision
+
+    model = LlavaForConditionalGeneration(random_weights_config()).eval()
+    processor = StubProcessor(151646, 152000, 384)
+
+    with (
+        patch("src.forecast.generator.AutoProcessor") as auto_processor,
+        patch("src.forecast.generator.AutoModelForImageTextToText") as auto_model,
+    ):
+        auto_processor.from_pretrained.return_value = processor
+        auto_model.from_pretrained.return_value = model
+        return WeatherVision()
+
+
+def measure_ttft(vision, img: Image.Image, repeat: int) -> dict:
+    """Median and fastest TTFT of PROMPT over repeat runs."""
+    vision.generate_answers(img, [PROMPT], max_tokens=1)  # warm up, cache features
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        vision.generate_answers(img, [PROMPT], max_tokens=1)
+        times.append(time.perf_counter() - start)
+    return {"ttft_s": statistics.median(times), "min_s": min(times)}
+
+
+def main(argv=None):
+    from src.chart.processors.pdf_tools import render_pdf_page
+
+    parser = argparse.ArgumentParser(description="Benchmark prefix KV caching")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    args = parser.parse_args(argv)
+
+    if args.random_weights:
+        vision = random_weights_vision()
+    else:
+        from src.forecast.generator import WeatherVision
+
+        vision = WeatherVision()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "chart.pdf"
+        pdf.write_bytes(make_chart_pdf())
+        img = render_pdf_page(pdf, size=(384, 384), backend="pdfium")
+
+    tokenizer = vision.processor.tokenizer
+    results = {
+        "benchmark": "prefix_cache",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "random_weights": args.random_weights,
+        "repeat": args.repeat,
+        "prefix_tokens": tokenizer(PREFIX, return_tensors="pt")["input_ids"].shape[1],
+        "text_tokens": tokenizer(PROMPT, return_tensors="pt")["input_ids"].shape[1],
+        "modes": {},
+    }
+
+    results["modes"]["no_prefix"] = measure_ttft(vision, img, args.repeat)
+
+    start = time.perf_counter()
+    vision.register_prefix(PREFIX)
+    results["register_s"] = time.perf_counter() - start
+
+    results["modes"]["prefix"] = measure_ttft(vision, img, args.repeat)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
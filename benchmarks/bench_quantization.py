@@ -0,0 +1,234 @@
+"""
+Quality-vs-speed report for WeatherVision's quantized CPU modes
+(QUANTIZATION in src/forecast/config.py) against the float32 baseline.
+
+Every mode writes a forecast for the same fixture charts with
+generate_answers(). Reported per mode:
+
+    texts           the generated forecasts
+    ttft_s          mean time to the first token: vision encoding and
+                    prompt prefill (~760 tokens per chart)
+    decode_tokens_per_s
+                    tokens after the first over their generation time
+    load_s          model load time, quantizing it if the saved quantized
+                    layers are missing. Quantized modes load the checkpoint
+                    in its own dtype ("auto") and only upcast what stays
+                    in full precision, so they never hold float32 weights
+                    for the quantized layers.
+    cached_load_s   load time in a second process, from the saved layers
+    peak_rss_bytes  peak RSS of the generating process
+    exact_match     fraction of charts with the same text as float32
+    similarity      mean difflib similarity ratio to the float32 text
+    prefill_speedup float32 ttft_s over this mode's ttft_s
+    decode_speedup  decode_tokens_per_s relative to float32
+
+Each mode runs in a fresh subprocess, so peak RSS is per mode. By default
+the real model is loaded. --random-weights saves an untrained model of the
+same architecture and uses a stand-in tokenizer (see bench_prefix_cache);
+speed is then representative, but the texts are meaningless and the text
+agreement is only a rough guide.
+
+Usage:
+    python -m benchmarks.bench_quantization --charts 3 --max-tokens 60
+    python -m benchmarks.bench_quantization --random-weights --mode int8
+"""
+
+import argparse
+import difflib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from benchmarks.bench_downloader import _peak_rss_bytes
+from benchmarks.jma_stub import make_chart_pdf
+
+BASELINE = "float32"
+MODES = (BASELINE, "dynamic-int8", "int8", "int4")
+
+
+def build_vision(
+    mode: str, model_name: str | None, random_weights: bool, quantized_dir: str
+):
+    """WeatherVision in the given mode, loaded through its own loader."""
+    from benchmarks.bench_prefix_cache import StubProcessor
+    from src.forecast.generator import WeatherVision
+
+    attributes = {"QUANTIZED_DIR": quantized_dir}
+    if model_name:
+        attributes["MODEL_NAME"] = model_name
+    vision_cls = type("BenchVision", (WeatherVision,), attributes)
+    if mode == BASELINE:
+        options = {"dtype": "float32"}
+    else:
+        options = {"dtype": "auto", "quantization": mode}
+
+    if not random_weights:
+        return vision_cls(**options)
+    with patch("src.forecast.generator.AutoProcessor") as auto_processor:
+        auto_processor.from_pretrained.return_value = StubProcessor(151646, 152000, 384)
+        return vision_cls(**options)
+
+
+def fixture_charts(count: int) -> list:
+    """Model inputs rendered from count synthetic charts."""
+    from src.chart.processors.pdf_tools import render_pdf_page
+
+    images = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant in range(count):
+            pdf = Path(tmp) / f"chart{variant}.pdf"
+            pdf.write_bytes(make_chart_pdf(variant=variant))
+            images.append(render_pdf_page(pdf, size=(384, 384), backend="pdfium"))
+    return images
+
+
+def run_worker(args) -> dict:
+    """Load one mode and, unless --load-only, generate for every chart."""
+    from src.orchestration.pipeline import MODEL_PROMPT
+
+    # Imported first, so that load_s does not include importing torch
+    import src.forecast.generator
+
+    start = time.perf_counter()
+    vision = build_vision(
+        args.mode[0], args.model, args.random_weights, args.quantized_dir
+    )
+    results = {"load_s": time.perf_counter() - start}
+    if args.load_only:
+        return results
+
+    # Each forward call of the model yields one token (batch of one)
+    token_times = []
+    vision.model.register_forward_hook(
+        lambda *_: token_times.append(time.perf_counter())
+    )
+
+    images = fixture_charts(args.charts)
+    vision.generate_answers(images[0], [MODEL_PROMPT], max_tokens=2)  # warm up
+    vision._features.clear()
+
+    texts, ttfts, decode_tokens, decode_s = [], [], 0, 0.0
+    for img in images:
+        token_times.clear()
+        start = time.perf_counter()
+        texts += vision.generate_answers(img, [MODEL_PROMPT], args.max_tokens)
+        ttfts.append(token_times[0] - start)
+        decode_tokens += len(token_times) - 1
+        decode_s += token_times[-1] - token_times[0]
+
+    results.update(
+        texts=texts,
+        ttft_s=sum(ttfts) / len(ttfts),
+        decode_tokens_per_s=decode_tokens / decode_s if decode_s else None,
+        peak_rss_bytes=_peak_rss_bytes(),
+    )
+    return results
+
+
+def _measure(mode: str, args, model_name: str | None, load_only=False) -> dict:
+    """Run one mode in a fresh interpreter and return its metrics."""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_quantization",
+        "--worker",
+        "--mode",
+        mode,
+        "--charts",
+        str(args.charts),
+        "--max-tokens",
+        str(args.max_tokens),
+        "--quantized-dir",
+        str(args.quantized_dir),
+    ]
+    if model_name:
+        command += ["--model", model_name]
+    if args.random_weights:
+        command.append("--random-weights")
+    if load_only:
+        command.append("--load-only")
+
+    out = subprocess.run(command, capture_output=True, text=True)
+    if out.returncode != 0:
+        lines = out.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {out.returncode}"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare(baseline: dict, result: dict) -> dict:
+    """Text agreement and speed of result relative to baseline."""
+    pairs = list(zip(baseline["texts"], result["texts"]))
+    decode = baseline["decode_tokens_per_s"], result["decode_tokens_per_s"]
+    return {
+        "exact_match": sum(a == b for a, b in pairs) / len(pairs),
+        "similarity": sum(difflib.SequenceMatcher(None, a, b).ratio() for a, b in pairs)
+        / len(pairs),
+        "prefill_speedup": baseline["ttft_s"] / result["ttft_s"],
+        "decode_speedup": decode[1] / decode[0] if all(decode) else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantization quality vs speed")
+    parser.add_argument("--mode", choices=MODES, action="append")
+    parser.add_argument("--charts", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=60)
+    parser.add_argument("--model", help="hub name or local directory")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--quantized-dir", type=Path, help="keep quantized layers here")
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--load-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    modes = args.mode or list(MODES)
+    if BASELINE not in modes:
+        modes.insert(0, BASELINE)
+
+    results = {
+        "benchmark": "quantization",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "random_weights": args.random_weights,
+        "charts": args.charts,
+        "max_tokens": args.max_tokens,
+        "modes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        model_name = args.model
+        if args.random_weights:
+            model_name = str(Path(tmp) / "model")
+            # Saved in a subprocess so this process stays small
+            command = [sys.executable, "-m", "benchmarks.bench_model_load"]
+            subprocess.run([*command, "--save-random", model_name], check=True)
+        args.quantized_dir = args.quantized_dir or Path(tmp) / "quantized"
+
+        for mode in modes:
+            result = _measure(mode, args, model_name)
+            if mode != BASELINE and "error" not in result:
+                cached = _measure(mode, args, model_name, load_only=True)
+                result["cached_load_s"] = cached.get("load_s", cached.get("error"))
+            results["modes"][mode] = result
+
+    baseline = results["modes"][BASELINE]
+    for mode, result in results["modes"].items():
+        if "error" not in result and "error" not in baseline:
+            result.update(compare(baseline, result))
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark the PDF rasterizer backends in src/chart/processors/pdf_tools.py.
+
+Each backend renders the pipeline's targets from the same fixture PDFs:
+
+    model       384x384 vision-model input
+    preview     300 px wide Salesforce thumbnail
+    full        whole page at 200 dpi
+
+Every backend runs in a fresh subprocess, so its peak RSS is not polluted by
+the other backends. Backends that cannot run here (e.g. poppler without
+pdftoppm installed) are reported with their error instead of timings.
+
+Usage:
+    python -m benchmarks.bench_rasterizers --repeat 10
+    python -m benchmarks.bench_rasterizers --pdf ASAS_COLOR.pdf --backend pdfium
+    python -m benchmarks.bench_rasterizers --pdf data/charts/*/chart.pdf
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_downloader import _peak_rss_bytes
+from benchmarks.jma_stub import make_chart_pdf
+
+TARGETS = {
+    "model": {"size": (384, 384)},
+    "preview": {"size": (300, None)},
+    "full": {"dpi": 200},
+}
+
+
+def run_worker(backend: str, pdfs: list[Path], repeat: int) -> dict:
+    """Time every target for one backend in the current process."""
+    from src.chart.processors.pdf_tools import render_pdf_page
+
+    results = {}
+    labels = _labels(pdfs)
+    for pdf in pdfs:
+        # One untimed render pays for imports and library initialisation
+        render_pdf_page(pdf, size=(64, None), backend=backend)
+
+        for target, options in TARGETS.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                image = render_pdf_page(pdf, backend=backend, **options)
+                times.append(time.perf_counter() - start)
+            results[f"{labels[pdf]}:{target}"] = {
+                "size": list(image.size),
+                "median_s": statistics.median(times),
+                "min_s": min(times),
+                "max_s": max(times),
+            }
+    return {"renders": results, "peak_rss_bytes": _peak_rss_bytes()}
+
+
+def _labels(pdfs: list[Path]) -> dict[Path, str]:
+    """File name of each PDF, with its directory when names repeat."""
+    names = [pdf.name for pdf in pdfs]
+    return {
+        pdf: pdf.name if names.count(pdf.name) == 1 else f"{pdf.parent.name}/{pdf.name}"
+        for pdf in pdfs
+    }
+
+
+def _measure(backend: str, pdfs: list[Path], repeat: int) -> dict:
+    """Run one backend in a fresh interpreter and return its metrics."""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_rasterizers",
+        "--worker",
+        "--backend",
+        backend,
+        "--repeat",
+        str(repeat),
+    ]
+    for pdf in pdfs:
+        command += ["--pdf", str(pdf)]
+
+    out = subprocess.run(command, capture_output=True, text=True)
+    if out.returncode != 0:
+        lines = out.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {out.returncode}"}
+    return json.loads(out.stdout)
+
+
+def main(argv=None):
+    from src.chart.processors.pdf_tools import RASTERIZERS
+
+    parser = argparse.ArgumentParser(description="Benchmark PDF rasterizers")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--pdf",
+        type=Path,
+        nargs="+",
+        action="extend",
+        help="PDFs to render (default: fixtures)",
+    )
+    parser.add_argument("--backend", choices=sorted(RASTERIZERS), action="append")
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.backend[0], args.pdf, args.repeat)))
+        return
+
+    results = {
+        "benchmark": "rasterizers",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "backends": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        pdfs = args.pdf
+        if not pdfs:
+            # A typical and a busy chart, standing in for ASAS_COLOR.pdf
+            pdfs = []
+            for name, isobars in (("chart.pdf", 150), ("busy_chart.pdf", 600)):
+                pdf = Path(tmp) / name
+                pdf.write_bytes(make_chart_pdf(isobars=isobars))
+                pdfs.append(pdf)
+
+        for backend in args.backend or sorted(RASTERIZERS):
+            results["backends"][backend] = _measure(backend, pdfs, args.repeat)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
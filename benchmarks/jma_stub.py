@@ -0,0 +1,288 @@
+"""
+Local stand-in for the JMA chart server.
+
+Serves fixture PDFs over HTTP with knobs for latency, bandwidth, ETag/304
+behaviour, truncated bodies and error codes, so WeatherPDFDownloader can be
+tested and benchmarked without touching the live site.
+
+Usage (standalone):
+    python -m benchmarks.jma_stub --pdf chart.pdf --port 8000 --latency 0.2
+"""
+
+import argparse
+import hashlib
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-$")
+
+
+def make_fixture_pdf(size: int = 1_500_000, variant: int = 0) -> bytes:
+    """
+    Build a valid single-page PDF of roughly `size` bytes.
+
+    Different variants produce different bytes (and hashes), which is all the
+    downloader cares about; the padding stream stands in for chart content.
+    """
+    header = (
+        b"%PDF-1.4\n"
+        b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+        b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n"
+        b"3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] >> endobj\n"
+    )
+    trailer = b"trailer << /Root 1 0 R >>\n%%EOF\n"
+    seed = hashlib.sha256(f"variant-{variant}".encode()).digest()
+    padding = max(0, size - len(header) - len(trailer) - 64)
+    body = (seed * (padding // len(seed) + 1))[:padding]
+    stream = b"4 0 obj << /Length %d >> stream\n" % len(body) + body
+    return header + stream + b"\nendstream endobj\n" + trailer
+
+
+def make_chart_pdf(variant: int = 0, isobars: int = 150, pages: int = 1) -> bytes:
+    """
+    Build a vector PDF that renders like a surface weather chart.
+
+    Closed bezier "isobars", a coastline-like polyline and pressure labels on
+    an A4 landscape page give rasterizers a realistic amount of path and text
+    work. Different variants move the isobars; in a multi-page PDF (a chart
+    set) page n uses variant + n.
+    """
+    contents = [_chart_content(variant + n, isobars) for n in range(pages)]
+    kids = b" ".join(b"%d 0 R" % (3 + 2 * n) for n in range(pages))
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages),
+    ]
+    font = 3 + 2 * pages
+    for n, content in enumerate(contents):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (font, 4 + 2 * n)
+        )
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        )
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer << /Size %d /Root 1 0 R >>\n" % (len(objects) + 1)
+    pdf += b"startxref\n%d\n%%%%EOF\n" % xref
+    return bytes(pdf)
+
+
+def _chart_content(variant: int, isobars: int) -> bytes:
+    """Content stream of one chart page."""
+    import random
+
+    rng = random.Random(variant)
+    ops = [b"0.2 0.3 0.8 RG 0.8 w"]
+    for _ in range(isobars):
+        cx, cy = rng.uniform(0, 842), rng.uniform(0, 595)
+        rx, ry = rng.uniform(20, 300), rng.uniform(20, 200)
+        k = 0.552  # bezier circle constant
+        ops.append(
+            b"%.1f %.1f m %.1f %.1f %.1f %.1f %.1f %.1f c "
+            b"%.1f %.1f %.1f %.1f %.1f %.1f c "
+            b"%.1f %.1f %.1f %.1f %.1f %.1f c "
+            b"%.1f %.1f %.1f %.1f %.1f %.1f c S"
+            % (
+                cx + rx, cy,
+                cx + rx, cy + k * ry, cx + k * rx, cy + ry, cx, cy + ry,
+                cx - k * rx, cy + ry, cx - rx, cy + k * ry, cx - rx, cy,
+                cx - rx, cy - k * ry, cx - k * rx, cy - ry, cx, cy - ry,
+                cx + k * rx, cy - ry, cx + rx, cy - k * ry, cx + rx, cy,
+            )
+        )  # fmt: skip
+    coast = [(x, 300 + 80 * rng.random()) for x in range(0, 843, 6)]
+    ops.append(b"0 0 0 RG 1.2 w %d %.1f m" % coast[0])
+    ops.extend(b"%d %.1f l" % point for point in coast[1:])
+    ops.append(b"S BT /F1 9 Tf 0 0 0 rg")
+    for _ in range(isobars // 3):
+        ops.append(
+            b"1 0 0 1 %.1f %.1f Tm (%d) Tj"
+            % (rng.uniform(0, 820), rng.uniform(0, 585), rng.randint(980, 1040))
+        )
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+class JMAStubServer:
+    """
+    Threaded HTTP server serving one PDF at every path.
+
+    All knobs can be changed while the server runs:
+        pdf: Bytes served as the chart.
+        latency: Seconds to wait before sending response headers.
+        bandwidth: Bytes per second for the body, or None for unlimited.
+        etag: Send ETag/Last-Modified and answer conditional requests with 304.
+        status: Error code to return instead of the PDF, or None.
+        error_count: How many requests get `status` (None = all of them).
+        truncate: Drop the connection after this many body bytes on full
+            (non-Range) GETs, or None to send the whole body.
+    """
+
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, pdf: bytes, host: str = "127.0.0.1", port: int = 0):
+        self.pdf = pdf
+        self.latency = 0.0
+        self.bandwidth = None
+        self.etag = True
+        self.status = None
+        self.error_count = None
+        self.truncate = None
+        self.requests = []  # (method, path, headers) of every request seen
+        self.last_modified = formatdate(time.time(), usegmt=True)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/ASAS_COLOR.pdf"
+
+    def set_pdf(self, pdf: bytes) -> None:
+        """Publish a new chart version."""
+        with self._lock:
+            self.pdf = pdf
+            self.last_modified = formatdate(time.time(), usegmt=True)
+
+    def start(self) -> "JMAStubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _take_error(self) -> int | None:
+        """Return the error status for this request, consuming error_count."""
+        with self._lock:
+            if self.status is None:
+                return None
+            if self.error_count is None:
+                return self.status
+            if self.error_count > 0:
+                self.error_count -= 1
+                return self.status
+            return None
+
+
+def _make_handler(server: JMAStubServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+        def log_message(self, format, *args):
+            pass  # keep benchmark output clean
+
+        def do_GET(self):
+            server.requests.append(("GET", self.path, dict(self.headers)))
+            if server.latency:
+                time.sleep(server.latency)
+
+            status = server._take_error()
+            if status is not None:
+                body = f"<html><body>{status} error</body></html>".encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            pdf = server.pdf
+            etag = '"%s"' % hashlib.sha256(pdf).hexdigest()[:16]
+            if server.etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            start = 0
+            match = RANGE_PATTERN.match(self.headers.get("Range", ""))
+            if_range = self.headers.get("If-Range")
+            partial = bool(match) and if_range in (None, etag)
+            if partial:
+                start = int(match.group(1))
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(pdf) - 1}/{len(pdf)}"
+                )
+            else:
+                self.send_response(200)
+
+            body = pdf[start:]
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Accept-Ranges", "bytes")
+            if server.etag:
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", server.last_modified)
+            self.end_headers()
+
+            if server.truncate is not None and not partial:
+                body = body[: server.truncate]
+                self.close_connection = True
+            self._send_body(body)
+
+        def _send_body(self, body: bytes) -> None:
+            for i in range(0, len(body), JMAStubServer.CHUNK_SIZE):
+                chunk = body[i : i + JMAStubServer.CHUNK_SIZE]
+                self.wfile.write(chunk)
+                if server.bandwidth:
+                    time.sleep(len(chunk) / server.bandwidth)
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local JMA chart stand-in")
+    parser.add_argument("--pdf", type=Path, help="PDF to serve (default: fixture)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=None, help="bytes/s")
+    parser.add_argument("--no-etag", action="store_true")
+    parser.add_argument("--status", type=int, default=None)
+    parser.add_argument("--truncate", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    pdf = args.pdf.read_bytes() if args.pdf else make_fixture_pdf()
+    server = JMAStubServer(pdf, port=args.port)
+    server.latency = args.latency
+    server.bandwidth = args.bandwidth
+    server.etag = not args.no_etag
+    server.status = args.status
+    server.truncate = args.truncate
+
+    print(f"Serving {len(pdf)} bytes at {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
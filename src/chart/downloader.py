@@ -1,83 +1,410 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
 from pathlib import Path
+from urllib.parse import urlsplit
 import hashlib
-import urllib.request  # or requests
-from pdf2image import convert_from_path
-from PIL import Image
+import json
+import logging
 import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from src.chart.processors.pdf_tools import PdfInspector
+from src.chart.store import ChartStore, RetentionPolicy
+
+logger = logging.getLogger(__name__)
 
 
 class WeatherPDFDownloader:
-    CURRENT_PDF = "current.pdf"
-    LAST_PDF = "last.pdf"
+    STORE_DIR = "charts"
+    VALIDATORS_JSON = "validators.json"
+    CHUNK_SIZE = 64 * 1024  # bytes held in memory while streaming
+    PART_SUFFIX = ".part"  # in-flight downloads never carry a .pdf name
+    LATENCY_JSON = "latency.json"
+    LATENCY_SAMPLES = 50  # time-to-first-byte samples kept for the p95
+    MIN_LATENCY_SAMPLES = 5  # below this, fall back to HEDGE_DELAY
+    HEDGE_DELAY = 2.0  # seconds before hedging while latency is unknown
+    QUARANTINE_DIR = "quarantine"
+    QUARANTINE_KEEP = 10  # invalid downloads kept for inspection
 
-    def __init__(self, data_path: Path, weather_pdf_url: str):
+    def __init__(
+        self,
+        data_path: Path,
+        weather_pdf_url: str,
+        retention: RetentionPolicy = RetentionPolicy(),
+        session: requests.Session | None = None,
+        mirrors: list[str] | None = None,
+        timeout: tuple[float, float] = (5.0, 30.0),
+        retries: int = 3,
+        backoff: float = 1.0,
+    ):
+        """
+        Args:
+            data_path: Directory for the chart store and sidecar files.
+            weather_pdf_url: Primary URL of the chart PDF.
+            retention: Limits for the chart store.
+            session: Shared HTTP session; a private one is created if None.
+            mirrors: Alternative URLs serving the same PDF, in preference order.
+                A request that has not answered within the learned p95 latency
+                is hedged to the next mirror.
+            timeout: (connect, read) timeouts in seconds for every request.
+            retries: Extra attempts after a failed request or broken stream.
+            backoff: Base delay in seconds; attempt n waits backoff * 2**n.
+        """
         self.data_path = data_path
         self.weather_pdf_url = weather_pdf_url
-        self.current_pdf_path = self.data_path / WeatherPDFDownloader.CURRENT_PDF
-        self.last_pdf_path = self.data_path / WeatherPDFDownloader.LAST_PDF
+        self.urls = [weather_pdf_url, *(mirrors or [])]
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session if session is not None else requests.Session()
+        self.store = ChartStore(
+            self.data_path / WeatherPDFDownloader.STORE_DIR, retention
+        )
+        self.validators_path = self.data_path / WeatherPDFDownloader.VALIDATORS_JSON
+        self.latency_path = self.data_path / WeatherPDFDownloader.LATENCY_JSON
+        self.previous_hash = None  # newest chart before the last refresh
+        self.part_path = self.store.root / ("download.pdf" + self.PART_SUFFIX)
 
-    # Core: manage renames + download + compare
+    # Core: conditional request + download to temp + verify + store
     def refresh_pdf(self):
-        current_exists = self._exists(self.current_pdf_path)
-        last_exists = self._exists(self.last_pdf_path)
-
-        # Case A: neither exists
-        if not last_exists and not current_exists:
-            self._download()
-            current_hash = WeatherPDFDownloader.hash_pdf(self.current_pdf_path)
-            return True, current_hash, self.current_pdf_path  # new file
-
-        # Case B: only current exists
-        if not last_exists and current_exists:
-            self._rename(self.current_pdf_path, self.last_pdf_path)
-            self._download()
-            return self._compare_and_cleanup()
-
-        # Case C: only last exists
-        if last_exists and not current_exists:
-            self._download()
-            return self._compare_and_cleanup()
-
-        # Case D: both exist
-        self._delete(self.last_pdf_path)
-        self._rename(self.current_pdf_path, self.last_pdf_path)
-        self._download()
-        return self._compare_and_cleanup()
+        """
+        Fetch the chart and file it in the content-addressed store.
+
+        Returns:
+            tuple: (updated, hash, path). `updated` is True only for a chart
+            version that has never been seen before; a version that flips back
+            to an earlier one is a cache hit and reported as unchanged.
+            hash and path are None when the download is invalid and no
+            earlier chart is stored.
+        """
+        response = self._request()
+
+        # Server confirmed our newest PDF is still current: nothing to do
+        if response.status_code == 304:
+            response.close()
+            return self._not_modified()
+
+        response.raise_for_status()
+        self.store.root.mkdir(parents=True, exist_ok=True)
+        current_hash, inspector = self._download(response)
+
+        head_hash = self._head_hash()
+        self.previous_hash = head_hash
+
+        # Truncated or non-PDF bodies never count as a new chart version
+        problem = self._validate(response.headers, inspector)
+        if problem:
+            self._quarantine(current_hash, problem)
+            head_path = self.store.pdf_path(head_hash) if head_hash else None
+            return False, head_hash, head_path  # treated as no change
+
+        if current_hash == head_hash:
+            self.part_path.unlink()
+            self.store.touch(current_hash)
+            updated = False  # no change
+        elif self.store.contains(current_hash):
+            self.part_path.unlink()
+            self.store.touch(current_hash)
+            logger.info("PDF matches a previously seen version (cache hit)")
+            updated = False  # flipped back to a stored version
+        else:
+            self.store.add(self.part_path, current_hash)
+            updated = True  # new version
+
+        self._save_validators(response.headers, current_hash)
+        self.store.evict(protect={current_hash})
+        return updated, current_hash, self.store.pdf_path(current_hash)
 
     # ------------------
     # Utility Methods
     # ------------------
 
-    def _exists(self, path: Path) -> bool:
-        """Check if the file exists."""
-        return path.exists()
+    def _head_hash(self) -> str | None:
+        """Hash of the newest chart, if it is still in the store."""
+        pdf_hash = self._load_validators().get("sha256")
+        return pdf_hash if self.store.contains(pdf_hash) else None
+
+    def _request(self) -> requests.Response:
+        """
+        Send a (conditional) GET for the weather PDF, retrying with backoff.
+
+        Each retry leads with the next mirror, so a dead primary does not
+        eat the whole retry budget.
+        """
+        headers = self._conditional_headers()
+
+        for attempt in range(self.retries + 1):
+            shift = attempt % len(self.urls)
+            urls = self.urls[shift:] + self.urls[:shift]
+            try:
+                response = self._hedged_get(urls, headers)
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning("PDF request failed (%s); retrying", e)
+                self._sleep_backoff(attempt)
+                continue
+
+            # Only hedging uses the samples, and a 304 must not write to disk
+            if len(self.urls) > 1 and response.status_code != 304:
+                self._record_latency(response.elapsed.total_seconds())
+            return response
+
+    def _get(self, url: str, headers: dict) -> requests.Response:
+        """Single streaming GET; server errors raise so they can be retried."""
+        response = self.session.get(
+            url, headers=headers, stream=True, timeout=self.timeout
+        )
+        if response.status_code >= 500:
+            response.close()
+            response.raise_for_status()
+        return response
+
+    def _hedged_get(self, urls: list[str], headers: dict) -> requests.Response:
+        """
+        GET the first URL and hedge to the next one if it is slow.
+
+        If no response headers (first byte) arrive within the learned p95
+        latency, the same request goes to the next mirror. The first success
+        wins and every other response is closed: at once if it has already
+        arrived, otherwise as soon as it does. A request still in flight
+        cannot be cancelled; it keeps its worker thread until it answers or
+        hits the request timeout, which bounds how long it can linger.
+        """
+        if len(urls) == 1:
+            return self._get(urls[0], headers)
+
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        queue = list(urls)
+        pending = {executor.submit(self._hedge_leg, queue.pop(0), headers)}
+        error = None
+        try:
+            while pending:
+                delay = self._hedge_delay() if queue else None
+                done, pending = wait(
+                    pending, timeout=delay, return_when=FIRST_COMPLETED
+                )
+
+                if not done:
+                    logger.info(
+                        "No response after %.2fs; hedging to %s", delay, queue[0]
+                    )
+                    pending.add(executor.submit(self._hedge_leg, queue.pop(0), headers))
+                    continue
+
+                for future in done:
+                    if future.exception() is None:
+                        # Callbacks run at once for responses that also arrived
+                        for loser in (done | pending) - {future}:
+                            loser.add_done_callback(_close_response)
+                        return future.result()
+                    error = future.exception()
+
+                # Every in-flight request failed: move on to the next mirror now
+                if not pending and queue:
+                    pending.add(executor.submit(self._hedge_leg, queue.pop(0), headers))
+
+            raise error
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _hedge_leg(self, url: str, headers: dict) -> requests.Response:
+        """
+        One leg of a hedged GET. Anything but a 2xx or 304 raises, so a fast
+        error page from one URL cannot beat a good answer from another.
+        """
+        response = self._get(url, headers)
+        if not (200 <= response.status_code < 300 or response.status_code == 304):
+            response.close()
+            raise requests.HTTPError(
+                f"{response.status_code} from {url}", response=response
+            )
+        return response
+
+    def _hedge_delay(self) -> float:
+        """p95 of recent time-to-first-byte samples, or HEDGE_DELAY if too few."""
+        samples = self._load_json(self.latency_path, [])
+        if len(samples) < WeatherPDFDownloader.MIN_LATENCY_SAMPLES:
+            return WeatherPDFDownloader.HEDGE_DELAY
+        samples = sorted(samples)
+        return samples[round(0.95 * (len(samples) - 1))]
+
+    def _record_latency(self, seconds: float) -> None:
+        """Remember a time-to-first-byte sample for the hedge delay."""
+        samples = self._load_json(self.latency_path, [])
+        samples.append(seconds)
+        self._write_json(
+            self.latency_path, samples[-WeatherPDFDownloader.LATENCY_SAMPLES :]
+        )
+
+    def _sleep_backoff(self, attempt: int) -> None:
+        """Wait before retry number `attempt` (exponential backoff)."""
+        time.sleep(self.backoff * (2**attempt))
+
+    def _resume(self, response: requests.Response, offset: int) -> requests.Response:
+        """
+        Ask for the rest of an interrupted body with a Range request.
+
+        If-Range makes the server send the full body (200) instead of a
+        partial one (206) when the PDF changed in the meantime.
+        """
+        headers = {"Range": f"bytes={offset}-"}
+        validator = response.headers.get("ETag") or response.headers.get(
+            "Last-Modified"
+        )
+        if validator:
+            headers["If-Range"] = validator
+
+        resumed = self._get(response.url, headers)
+        if resumed.status_code >= 400:
+            resumed.close()
+            resumed.raise_for_status()
+        return resumed
+
+    def _conditional_headers(self) -> dict:
+        """
+        Build If-None-Match / If-Modified-Since headers from saved validators.
 
-    def _delete(self, path: Path) -> None:
-        """Delete the file if it exists."""
-        if path.exists():
-            path.unlink()  # remove the file
+        Validators are only trusted while the PDF they describe is still in
+        the store; otherwise a 304 would leave us with nothing to return.
+        """
+        validators = self._load_validators()
+        if not self.store.contains(validators.get("sha256")):
+            return {}
 
-    def _download(self) -> None:
-        """Download the current PDF from the URL."""
-        data = urllib.request.urlopen(self.weather_pdf_url).read()
-        with self.current_pdf_path.open("wb") as f:
-            f.write(data)
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
 
-    def _rename(self, src: Path, dst: Path) -> None:
-        """Rename (move) a file from src to dst."""
-        if src.exists():
-            src.rename(dst)
+    def _load_validators(self) -> dict:
+        """Load persisted ETag/Last-Modified/Content-Length, if any."""
+        return self._load_json(self.validators_path, {})
 
-    def _compare_and_cleanup(self) -> bool:
-        """Compare current and last PDFs, clean up if unchanged."""
-        last_hash = WeatherPDFDownloader.hash_pdf(self.last_pdf_path)
-        current_hash = WeatherPDFDownloader.hash_pdf(self.current_pdf_path)
+    def _load_json(self, path: Path, default):
+        """Load a JSON sidecar, returning default if missing or corrupt."""
+        try:
+            return json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return default
 
-        if last_hash == current_hash:
-            self._delete(self.current_pdf_path)
-            return False, last_hash, self.last_pdf_path  # no change
+    def _write_json(self, path: Path, data) -> None:
+        """Atomically write a JSON sidecar."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part = path.with_name(path.name + WeatherPDFDownloader.PART_SUFFIX)
+        part.write_text(json.dumps(data))
+        os.replace(part, path)
 
-        return True, current_hash, self.current_pdf_path  # changed
+    def _save_validators(self, headers, pdf_hash: str) -> None:
+        """Atomically persist response validators with the newest PDF hash."""
+        validators = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_length": headers.get("Content-Length"),
+            "sha256": pdf_hash,
+        }
+        self._write_json(self.validators_path, validators)
+
+    def _not_modified(self):
+        """Report 'unchanged' for a 304 without touching the PDFs on disk."""
+        pdf_hash = self._load_validators()["sha256"]
+        logger.info("PDF not modified (304); skipping download")
+        self.store.touch(pdf_hash)
+        return False, pdf_hash, self.store.pdf_path(pdf_hash)  # no change
+
+    def _download(self, response: requests.Response) -> tuple[str, PdfInspector]:
+        """
+        Stream the PDF body to a temp file, hashing and inspecting while writing.
+
+        Only one chunk is held in memory, and the SHA256 is ready as soon as
+        the last chunk lands, so the new file never has to be read back.
+        The temp file is fsynced so a later rename cannot expose a partially
+        flushed PDF.
+
+        If the stream breaks, the remainder is fetched with a Range request
+        and appended, so a slow link does not restart from byte zero.
+
+        Returns:
+            tuple: SHA256 hash of the downloaded PDF and its PdfInspector.
+        """
+        h = hashlib.sha256()
+        inspector = PdfInspector()
+        written = 0
+        attempt = 0
+        source = response  # URL and validators for the Range requests
+        with self.part_path.open("wb") as f:
+            while True:
+                try:
+                    if response is None:
+                        # Inside the try, so a failed resume uses the retry budget
+                        response = self._resume(source, written)
+
+                        # Server ignored the range (or the PDF changed): start over
+                        if response.status_code != 206:
+                            f.seek(0)
+                            f.truncate()
+                            h = hashlib.sha256()
+                            inspector = PdfInspector()
+                            written = 0
+
+                    for chunk in response.iter_content(WeatherPDFDownloader.CHUNK_SIZE):
+                        h.update(chunk)
+                        inspector.update(chunk)
+                        f.write(chunk)
+                        written += len(chunk)
+                    break
+                except requests.RequestException as e:
+                    if response is not None:
+                        response.close()
+                        response = None
+                    if attempt == self.retries:
+                        raise
+                    logger.warning(
+                        "PDF stream broke after %d bytes (%s); resuming", written, e
+                    )
+                    self._sleep_backoff(attempt)
+                    attempt += 1
+            f.flush()
+            os.fsync(f.fileno())
+        return h.hexdigest(), inspector
+
+    def _validate(self, headers, inspector: PdfInspector) -> str | None:
+        """
+        Check the downloaded PDF for completeness.
+
+        Returns:
+            str | None: Reason the download is invalid, or None if it is fine.
+        """
+        expected = headers.get("Content-Length")
+        # requests transparently decodes gzip, so the length no longer applies
+        if expected is None or headers.get("Content-Encoding"):
+            expected = None
+        return inspector.problem(int(expected) if expected is not None else None)
+
+    def _quarantine(self, pdf_hash: str, reason: str) -> Path:
+        """
+        Move an invalid download aside for inspection, keeping the newest few.
+
+        Returns:
+            Path: Where the download was moved.
+        """
+        quarantine = self.data_path / WeatherPDFDownloader.QUARANTINE_DIR
+        quarantine.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        dst = quarantine / f"{stamp}-{pdf_hash[:12]}.pdf"
+        os.replace(self.part_path, dst)
+
+        logger.warning("Quarantined invalid PDF download (%s): %s", reason, dst)
+
+        for old in sorted(quarantine.iterdir())[
+            : -WeatherPDFDownloader.QUARANTINE_KEEP
+        ]:
+            old.unlink()
+        return dst
 
     @classmethod
     def hash_pdf(cls, path: Path) -> str:
@@ -87,3 +414,114 @@ class WeatherPDFDownloader:
             for chunk in iter(lambda: f.read(8192), b""):
                 h.update(chunk)
         return h.hexdigest()
+
+
+def _close_response(future) -> None:
+    """Done-callback that releases the connection of a hedged loser."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class MultiChartDownloader:
+    """
+    Refresh several charts concurrently over one pooled HTTP session.
+
+    Each chart gets its own WeatherPDFDownloader (and therefore its own store
+    and validators) under `data_path/<name>`. All of them share a keep-alive
+    connection pool, and requests to the same host, primary or mirror, are
+    capped by `max_per_host` so a dozen charts do not hammer a single server.
+    """
+
+    def __init__(
+        self,
+        data_path: Path,
+        chart_urls: dict[str, str],
+        max_per_host: int = 4,
+        retention: RetentionPolicy = RetentionPolicy(),
+        mirrors: dict[str, list[str]] | None = None,
+    ):
+        """
+        Args:
+            data_path: Directory holding one subdirectory per chart.
+            chart_urls: Chart name -> primary URL of its PDF.
+            max_per_host: Concurrent chart refreshes per host.
+            retention: Limits for each chart's store.
+            mirrors: Chart name -> mirror URLs, as for WeatherPDFDownloader.
+        """
+        self.data_path = data_path
+        self.chart_urls = chart_urls
+        self.max_per_host = max_per_host
+        self.mirrors = mirrors or {}
+        # urllib3 pools connections per host, so size and limit by host
+        self.hosts = {
+            urlsplit(url).netloc
+            for name, url in chart_urls.items()
+            for url in [url, *self.mirrors.get(name, [])]
+        }
+        self.session = self._create_session()
+        self.downloaders = {
+            name: WeatherPDFDownloader(
+                data_path / name,
+                url,
+                retention=retention,
+                session=self.session,
+                mirrors=self.mirrors.get(name),
+            )
+            for name, url in chart_urls.items()
+        }
+        self._host_slots = {
+            host: threading.BoundedSemaphore(max_per_host) for host in self.hosts
+        }
+        self.errors: dict[str, Exception] = {}
+
+    def _create_session(self) -> requests.Session:
+        """Session whose pool keeps up to max_per_host connections per host."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max(len(self.hosts), 1),
+            pool_maxsize=self.max_per_host,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def refresh_all(self) -> dict[str, tuple]:
+        """
+        Refresh every chart concurrently.
+
+        A failing chart does not affect the others; its exception is logged
+        and kept in `self.errors`.
+
+        Returns:
+            dict: chart name -> (updated, hash, path), as from refresh_pdf().
+        """
+        self.errors = {}
+        if not self.downloaders:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=len(self.downloaders)) as pool:
+            futures = {
+                name: pool.submit(self._refresh_one, name) for name in self.downloaders
+            }
+
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.exception("Failed to refresh chart %s", name)
+                self.errors[name] = e
+        return results
+
+    def _refresh_one(self, name: str):
+        """
+        Refresh a single chart while holding a slot on each host it may
+        contact (its primary and mirrors, since requests can be hedged).
+        """
+        downloader = self.downloaders[name]
+        hosts = sorted({urlsplit(url).netloc for url in downloader.urls})
+        with ExitStack() as stack:
+            # Acquired in sorted order, so two charts never deadlock
+            for host in hosts:
+                stack.enter_context(self._host_slots[host])
+            return downloader.refresh_pdf()
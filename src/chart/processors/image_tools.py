@@ -1,13 +1,270 @@
+from io import BytesIO
 from pathlib import Path
-from PIL import Image
+from typing import NamedTuple
+from PIL import Image, ImageChops
 
 
-def resize_png(src_path: Path, dst_path: Path, width: int = 300):
-    """Resize a PNG image to the specified width while maintaining aspect ratio."""
-    img = Image.open(src_path)
+class ImageEncoding(NamedTuple):
+    format: str  # Pillow format name
+    extension: str
+    options: dict  # passed to Image.save
+    colors: int | None = None  # quantize to a palette of this many colors first
+
+
+# Encoder settings by name. "png-best" trades a lot of CPU for a few percent
+# over "png"; the palette and WebP encodings suit the flat-colored JMA charts.
+IMAGE_ENCODINGS = {
+    "png-fast": ImageEncoding("PNG", ".png", {"compress_level": 1}),
+    "png": ImageEncoding("PNG", ".png", {"compress_level": 6}),
+    "png-best": ImageEncoding("PNG", ".png", {"optimize": True}),
+    "png-palette": ImageEncoding("PNG", ".png", {"optimize": True}, colors=64),
+    "webp-lossless": ImageEncoding("WEBP", ".webp", {"lossless": True, "method": 4}),
+    "webp": ImageEncoding("WEBP", ".webp", {"quality": 80, "method": 4}),
+}
+# Let resize() shrink by an integer factor with reduce() before resampling
+# whenever the image is at least this many times larger than the target.
+REDUCING_GAP = 2.0
+
+
+class ChartImage:
+    """
+    A rendered chart image passed between pipeline stages in memory.
+
+    Holds the decoded image and/or its encoding, producing each from the
+    other only when a stage asks for it: the model needs pixels, Salesforce
+    needs bytes, and disk is only touched by save() and load().
+
+    Attributes:
+        name: File name used for uploads and the on-disk copy.
+        path: Where the image was last saved or loaded from, if anywhere.
+        encoding: How the image is encoded, a key of IMAGE_ENCODINGS.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        image: Image.Image | None = None,
+        data: bytes | None = None,
+        path: Path | None = None,
+        encoding: str = "png-best",
+    ):
+        if image is None and data is None:
+            raise ValueError("ChartImage needs an image or encoded data")
+        if encoding not in IMAGE_ENCODINGS:
+            raise ValueError(f"Unknown image encoding {encoding!r}")
+        self.name = name
+        self.path = path
+        self.encoding = encoding
+        self._image = image
+        self._data = data
+
+    @classmethod
+    def load(cls, path: Path) -> "ChartImage":
+        """Read an encoded image from disk; it is decoded on first use."""
+        path = Path(path)
+        return cls(path.name, data=path.read_bytes(), path=path)
+
+    @property
+    def image(self) -> Image.Image:
+        """The decoded image."""
+        if self._image is None:
+            self._image = Image.open(BytesIO(self._data))
+            self._image.load()
+        return self._image
+
+    def encode(self) -> bytes:
+        """The encoded image, computed once."""
+        if self._data is None:
+            self._data = encode_image(self._image, self.encoding)
+        return self._data
+
+    def save(self, path: Path) -> Path:
+        """Write the encoded image to disk, for caching or debugging."""
+        path = Path(path)
+        path.write_bytes(self.encode())
+        self.path = path
+        return path
+
+
+def encode_image(img: Image.Image, encoding: str = "png-best") -> bytes:
+    """
+    Encode an image with one of the IMAGE_ENCODINGS.
+
+    Palette encodings quantize RGB images without dithering, which keeps the
+    flat areas and thin isobars of a chart clean and compresses far better.
+
+    Args:
+        img: Image to encode.
+        encoding: Key of IMAGE_ENCODINGS.
+    Returns:
+        bytes: The encoded file contents.
+    """
+    spec = IMAGE_ENCODINGS[encoding]
+    if spec.colors and img.mode in ("RGB", "RGBA"):
+        img = img.quantize(
+            spec.colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE
+        )
+
+    buffer = BytesIO()
+    img.save(buffer, format=spec.format, **spec.options)
+    return buffer.getvalue()
+
+
+def resize_image(img: Image.Image, width: int = 300) -> Image.Image:
+    """Resize an image to the specified width while maintaining aspect ratio."""
     w, h = img.size
     ratio = width / float(w)
     new_size = (width, int(h * ratio))
-    img = img.resize(new_size, Image.LANCZOS)
+    return img.resize(new_size, Image.LANCZOS)
+
+
+def resize_png(src_path: Path, dst_path: Path, width: int = 300):
+    """Resize a PNG image to the specified width while maintaining aspect ratio."""
+    img = resize_image(Image.open(src_path), width)
     img.save(dst_path, optimize=True)
     return dst_path
+
+
+def fit_size(
+    src_size: tuple[int, int], target: tuple[int | None, int | None]
+) -> tuple[int, int]:
+    """
+    Resolve a (width, height) target where None keeps the aspect ratio.
+
+    Examples: (300, None) on an 842x595 source gives (300, 212); (384, 384)
+    is returned as is.
+    """
+    w, h = src_size
+    width, height = target
+    if width is None and height is None:
+        return src_size
+    if height is None:
+        height = max(1, round(h * width / float(w)))
+    elif width is None:
+        width = max(1, round(w * height / float(h)))
+    return width, height
+
+
+def resize_pyramid(
+    img: Image.Image,
+    targets: dict[str, tuple[int | None, int | None]],
+    reducing_gap: float | None = REDUCING_GAP,
+) -> dict[str, Image.Image]:
+    """
+    Build several downscaled derivatives of one image in a single pass.
+
+    Targets are produced from largest to smallest, each one resampled from
+    the smallest image built so far that still covers it, instead of from
+    the full-size source every time. Large steps first shrink by an integer
+    factor with Image.reduce (via reducing_gap), and JPEG sources are
+    decoded at reduced scale with Image.draft.
+
+    Args:
+        img: Source image.
+        targets: Derivative name -> (width, height); None keeps the aspect.
+        reducing_gap: Passed to Image.resize; None always resamples fully.
+    Returns:
+        dict[str, Image.Image]: Derivatives keyed like targets. A target the
+        size of the source is the source itself.
+    """
+    sizes = {name: fit_size(img.size, target) for name, target in targets.items()}
+
+    largest = max(sizes.values(), key=lambda size: size[0] * size[1])
+    img.draft(img.mode, largest)  # no-op unless img is an undecoded JPEG
+
+    levels = [img]
+    derivatives = {}
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1][0] * item[1][1]):
+        # Smallest level at least as large as the target on both axes
+        source = min(
+            (lvl for lvl in levels if lvl.width >= size[0] and lvl.height >= size[1]),
+            key=lambda lvl: lvl.width * lvl.height,
+            default=img,
+        )
+        if source.size == size:
+            derivatives[name] = source
+            continue
+        derivative = source.resize(size, Image.LANCZOS, reducing_gap=reducing_gap)
+        levels.append(derivative)
+        derivatives[name] = derivative
+
+    return {name: derivatives[name] for name in targets}
+
+
+def tile_image(img: Image.Image, rows: int, cols: int) -> list[Image.Image]:
+    """
+    Split an image into a rows x cols grid of equal tiles, row by row.
+
+    Edge pixels that do not divide evenly are dropped.
+    """
+    tile_w, tile_h = img.width // cols, img.height // rows
+    return [
+        img.crop((col * tile_w, row * tile_h, (col + 1) * tile_w, (row + 1) * tile_h))
+        for row in range(rows)
+        for col in range(cols)
+    ]
+
+
+class ImageDiff(NamedTuple):
+    phash_distance: int  # differing bits between the two perceptual hashes
+    pixel_diff: float  # fraction of pixels that changed noticeably (0.0-1.0)
+
+
+def perceptual_hash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    Compute a difference hash (dHash) of an image.
+
+    The image is reduced to (hash_size + 1) x hash_size grayscale pixels and
+    each bit records whether a pixel is brighter than its right neighbour, so
+    re-encodings of the same picture produce the same hash.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def compare_images(
+    a_path: Path | Image.Image,
+    b_path: Path | Image.Image,
+    size: int = 512,
+    tolerance: int = 32,
+) -> ImageDiff:
+    """
+    Score how much two rendered charts differ.
+
+    Args:
+        a_path: First image, as a path or an already decoded image.
+        b_path: Second image, as a path or an already decoded image.
+        size: Both images are compared at this width (aspect preserved).
+        tolerance: Grayscale delta (0-255) below which a pixel counts as equal,
+            absorbing anti-aliasing noise between renders.
+    Returns:
+        ImageDiff: perceptual hash distance and changed-pixel fraction.
+    """
+    a = _open_image(a_path).convert("L")
+    b = _open_image(b_path).convert("L")
+
+    phash_distance = (perceptual_hash(a) ^ perceptual_hash(b)).bit_count()
+
+    w, h = a.size
+    common = (size, max(1, int(h * size / float(w))))
+    a = a.resize(common, Image.LANCZOS)
+    b = b.resize(common, Image.LANCZOS)
+
+    histogram = ImageChops.difference(a, b).histogram()
+    changed = sum(histogram[tolerance + 1 :])
+    pixel_diff = changed / float(common[0] * common[1])
+
+    return ImageDiff(phash_distance, pixel_diff)
+
+
+def _open_image(src: Path | Image.Image) -> Image.Image:
+    """Return src itself if it is already an image, else open it from disk."""
+    return src if isinstance(src, Image.Image) else Image.open(src)
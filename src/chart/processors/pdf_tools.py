@@ -1,9 +1,565 @@
+import functools
+import os
+import re
+import subprocess
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
 from pathlib import Path
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
 
+PDF_HEADER = b"%PDF-"
+PDF_EOF = b"%%EOF"
+EDGE_BYTES = 1024  # header and %%EOF must sit within this many bytes of the edges
+PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+FULL_PAGE = (0.0, 0.0, 1.0, 1.0)  # crop box as (left, top, right, bottom)
 
-def pdf_to_png(pdf_path: Path, output_path: Path):
-    """Convert the first page of a PDF to a PNG image."""
-    pages = convert_from_path(pdf_path)
-    pages[0].save(output_path)
+
+class Rasterizer:
+    """
+    Base class for PDF rasterizer backends.
+
+    Backends turn a page range into PIL images, scaling while they render so
+    no full-resolution intermediate is produced. Register new backends in
+    RASTERIZERS.
+    """
+
+    NAME = ""
+
+    @property
+    def version(self) -> str:
+        """Backend and library versions, for keying cached renders."""
+        return self.NAME
+
+    def render(
+        self,
+        pdf_path: Path,
+        first_page: int,
+        last_page: int,
+        dpi: int | None,
+        size: tuple[int | None, int | None] | int | None,
+        grayscale: bool,
+        thread_count: int,
+        crop: tuple[float, float, float, float] | None = None,
+    ) -> list[Image.Image]:
+        """
+        Render pages first_page..last_page (1-based, inclusive).
+
+        With crop, only that region of each page is returned, and dpi/size
+        apply to the region rather than to the whole page.
+        """
+        raise NotImplementedError
+
+    def page_count(self, pdf_path: Path) -> int:
+        """Number of pages in the PDF."""
+        raise NotImplementedError
+
+
+class PopplerRasterizer(Rasterizer):
+    """
+    Renders with poppler's pdftoppm through pdf2image.
+
+    Each call spawns pdftoppm processes and parses their PPM output.
+    """
+
+    NAME = "poppler"
+
+    @property
+    def version(self) -> str:
+        return (
+            f"{self.NAME}-{_pdftoppm_version()}"
+            f"/pdf2image-{metadata.version('pdf2image')}"
+        )
+
+    def render(
+        self,
+        pdf_path,
+        first_page,
+        last_page,
+        dpi,
+        size,
+        grayscale,
+        thread_count,
+        crop=None,
+    ):
+        options = {}
+        if dpi is not None:
+            options["dpi"] = dpi
+        if crop is not None and isinstance(size, int):
+            # An int is the region's longest edge, as with PDFium, so it is
+            # resolved against the region's shape rather than the page's
+            left, top, right, bottom = crop
+            page_w, page_h = self._page_size(pdf_path)
+            wide = page_w * (right - left) >= page_h * (bottom - top)
+            size = (size, None) if wide else (None, size)
+        if size is not None:
+            # pdf2image cannot render a region, so render the whole page at
+            # the scale that gives the region the requested size, then crop
+            options["size"] = size if crop is None else _page_size_for_crop(size, crop)
+
+        pages = convert_from_path(
+            pdf_path,
+            first_page=first_page,
+            last_page=last_page,
+            grayscale=grayscale,
+            thread_count=thread_count,
+            **options,
+        )
+        if crop is None:
+            return pages
+
+        regions = []
+        for page in pages:
+            region = page.crop(_crop_box(page.size, crop))
+            if isinstance(size, tuple) and None not in size and region.size != size:
+                region = region.resize(size, Image.LANCZOS)  # rounding only
+            regions.append(region)
+        return regions
+
+    def page_count(self, pdf_path):
+        return pdfinfo_from_path(pdf_path)["Pages"]
+
+    @staticmethod
+    def _page_size(pdf_path) -> tuple[float, float]:
+        """(width, height) in points of the first page, from pdfinfo."""
+        # e.g. "841.89 x 595.276 pts (A4)"
+        width, _, height = pdfinfo_from_path(pdf_path)["Page size"].split()[:3]
+        return float(width), float(height)
+
+
+class PdfiumRasterizer(Rasterizer):
+    """
+    Renders in-process with PDFium (pypdfium2) straight into a bitmap buffer.
+
+    No subprocess or temp files are involved. thread_count is ignored because
+    PDFium is not thread-safe; parallelize across processes instead.
+    """
+
+    NAME = "pdfium"
+    DEFAULT_DPI = 200  # same default as pdf2image
+
+    @property
+    def version(self) -> str:
+        from pypdfium2 import version
+
+        return f"{self.NAME}-{version.PDFIUM_INFO}/pypdfium2-{version.PYPDFIUM_INFO}"
+
+    def render(
+        self,
+        pdf_path,
+        first_page,
+        last_page,
+        dpi,
+        size,
+        grayscale,
+        thread_count,
+        crop=None,
+    ):
+        import pypdfium2 as pdfium
+        import pypdfium2.raw as pdfium_c
+
+        flags = pdfium_c.FPDF_ANNOT | (pdfium_c.FPDF_GRAYSCALE if grayscale else 0)
+        bitmap_format = (
+            pdfium_c.FPDFBitmap_Gray if grayscale else pdfium_c.FPDFBitmap_BGR
+        )
+
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            images = []
+            for index in range(first_page - 1, min(last_page, len(pdf))):
+                page = pdf[index]
+                page_w, page_h = page.get_size()
+                left, top, right, bottom = crop = crop or FULL_PAGE
+
+                # Size the bitmap for the region and scale the whole page so
+                # the region fills it; PDFium only rasterizes what is visible.
+                if size is None:
+                    full_w, full_h = self._pixel_size((page_w, page_h), dpi, None)
+                    x0, y0, x1, y1 = _crop_box((full_w, full_h), crop)
+                    width, height = x1 - x0, y1 - y0
+                else:
+                    width, height = self._pixel_size(
+                        (page_w * (right - left), page_h * (bottom - top)), dpi, size
+                    )
+                    full_w = round(width / (right - left))
+                    full_h = round(height / (bottom - top))
+                    x0, y0 = round(left * full_w), round(top * full_h)
+
+                bitmap = pdfium.PdfBitmap.new_native(width, height, bitmap_format)
+                bitmap.fill_rect((255, 255, 255, 255), 0, 0, width, height)
+                # The raw call scales each axis independently, like pdftoppm's
+                # -scale-to-x/-scale-to-y; page.render() only takes one scale.
+                pdfium_c.FPDF_RenderPageBitmap(
+                    bitmap,
+                    page,
+                    -x0,
+                    -y0,
+                    full_w,
+                    full_h,
+                    0,
+                    flags,
+                )
+                # Copy out of the PDFium buffer before it is released
+                images.append(bitmap.to_pil().copy())
+                page.close()
+            return images
+        finally:
+            pdf.close()
+
+    def page_count(self, pdf_path):
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    @classmethod
+    def _pixel_size(
+        cls,
+        page_size: tuple[float, float],
+        dpi: int | None,
+        size: tuple[int | None, int | None] | int | None,
+    ) -> tuple[int, int]:
+        """Output size in pixels, following pdf2image's dpi/size semantics."""
+        page_w, page_h = page_size
+
+        if size is None:
+            scale = (dpi or cls.DEFAULT_DPI) / 72.0
+            return max(1, round(page_w * scale)), max(1, round(page_h * scale))
+
+        if isinstance(size, int):  # longest side
+            scale = size / max(page_w, page_h)
+            return max(1, round(page_w * scale)), max(1, round(page_h * scale))
+
+        width, height = size
+        if width is None and height is None:
+            return cls._pixel_size(page_size, dpi, None)
+        if height is None:
+            height = round(page_h * width / page_w)
+        elif width is None:
+            width = round(page_w * height / page_h)
+        return max(1, width), max(1, height)
+
+
+@functools.cache
+def _pdftoppm_version() -> str:
+    """Version reported by `pdftoppm -v`, looked up once per process."""
+    try:
+        out = subprocess.run(
+            ["pdftoppm", "-v"], capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    # Printed to stderr, e.g. "pdftoppm version 24.02.0"
+    match = re.search(r"version (\S+)", out.stderr + out.stdout)
+    return match.group(1) if match else "unknown"
+
+
+def _page_size_for_crop(
+    size: tuple[int | None, int | None],
+    crop: tuple[float, float, float, float],
+) -> tuple[int | None, int | None]:
+    """Whole-page size that renders the crop region at the given size."""
+    left, top, right, bottom = crop
+    width, height = size
+    return (
+        None if width is None else round(width / (right - left)),
+        None if height is None else round(height / (bottom - top)),
+    )
+
+
+def _crop_box(
+    image_size: tuple[int, int], crop: tuple[float, float, float, float]
+) -> tuple[int, int, int, int]:
+    """Pixel box of a fractional (left, top, right, bottom) crop."""
+    w, h = image_size
+    left, top, right, bottom = crop
+    return round(left * w), round(top * h), round(right * w), round(bottom * h)
+
+
+RASTERIZERS = {
+    PopplerRasterizer.NAME: PopplerRasterizer,
+    PdfiumRasterizer.NAME: PdfiumRasterizer,
+}
+DEFAULT_RASTERIZER = PopplerRasterizer.NAME
+
+
+def get_rasterizer(backend: str | Rasterizer = DEFAULT_RASTERIZER) -> Rasterizer:
+    """
+    Resolve a backend name (see RASTERIZERS) or pass a Rasterizer through.
+
+    Raises:
+        ValueError: If the backend name is unknown.
+    """
+    if isinstance(backend, Rasterizer):
+        return backend
+    if backend not in RASTERIZERS:
+        raise ValueError(
+            f"Unknown rasterizer {backend!r}, expected one of {sorted(RASTERIZERS)}"
+        )
+    return RASTERIZERS[backend]()
+
+
+def render_pdf_pages(
+    pdf_path: Path,
+    first_page: int = 1,
+    last_page: int | None = None,
+    dpi: int | None = None,
+    size: tuple[int | None, int | None] | None = None,
+    grayscale: bool = False,
+    thread_count: int = 1,
+    backend: str | Rasterizer = DEFAULT_RASTERIZER,
+    crop: tuple[float, float, float, float] | None = None,
+) -> list[Image.Image]:
+    """
+    Rasterize a page range of a PDF into PIL images.
+
+    Only the requested pages are rendered, and the backend scales them while
+    rendering, so no full-resolution intermediate is ever decoded.
+
+    Args:
+        pdf_path: PDF to render.
+        first_page: First page to render (1-based).
+        last_page: Last page to render; defaults to first_page only.
+        dpi: Render resolution. Ignored when size is given.
+        size: Exact output size (width, height); use None for one side to
+            keep the aspect ratio, e.g. (300, None). An int sets the longest
+            side, of the crop region when cropping.
+        grayscale: Render in grayscale instead of RGB.
+        thread_count: Poppler processes to split the page range across.
+        backend: Rasterizer name from RASTERIZERS, or a Rasterizer instance.
+        crop: Region to render as fractions of the page (left, top, right,
+            bottom), origin top left; dpi and size then apply to the region.
+    Returns:
+        list[Image.Image]: Rendered pages in order.
+    """
+    _check_crop(crop)
+    rasterizer = get_rasterizer(backend)
+    return rasterizer.render(
+        pdf_path,
+        first_page,
+        last_page if last_page is not None else first_page,
+        dpi,
+        size,
+        grayscale,
+        thread_count,
+        crop=crop,
+    )
+
+
+def iter_pdf_pages(
+    pdf_path: Path,
+    first_page: int = 1,
+    last_page: int | None = None,
+    dpi: int | None = None,
+    size: tuple[int | None, int | None] | None = None,
+    grayscale: bool = False,
+    backend: str | Rasterizer = DEFAULT_RASTERIZER,
+    crop: tuple[float, float, float, float] | None = None,
+    workers: int | None = None,
+    pages_per_task: int = 1,
+    max_in_flight: int | None = None,
+) -> Iterator[Image.Image]:
+    """
+    Rasterize a page range across a process pool, yielding pages in order.
+
+    The range is split into shards of pages_per_task pages that worker
+    processes render concurrently. Pages are yielded as soon as they and all
+    earlier pages are done, so the caller can process page 1 while later
+    pages are still rendering. At most max_in_flight pages are submitted or
+    waiting to be consumed at any time, which bounds peak memory however
+    long the PDF is.
+
+    Args:
+        pdf_path: PDF to render.
+        first_page: First page to render (1-based).
+        last_page: Last page to render; defaults to the last page of the PDF.
+        dpi, size, grayscale, backend, crop: As for render_pdf_pages().
+        workers: Worker processes; defaults to the CPUs available to this
+            process. With one worker (or one shard) pages are rendered in
+            this process without a pool.
+        pages_per_task: Pages rendered per worker task. Larger shards cut
+            per-task overhead but delay the first page.
+        max_in_flight: Pages allowed in flight; defaults to two per worker.
+    Yields:
+        Image.Image: Rendered pages in page order.
+    """
+    _check_crop(crop)
+    rasterizer = get_rasterizer(backend)
+    if last_page is None:
+        last_page = rasterizer.page_count(pdf_path)
+
+    shards = [
+        (start, min(start + pages_per_task - 1, last_page))
+        for start in range(first_page, last_page + 1, pages_per_task)
+    ]
+    workers = min(workers or available_cpus(), len(shards))
+    options = (dpi, size, grayscale, 1)
+
+    if workers <= 1:
+        for start, end in shards:
+            yield from rasterizer.render(pdf_path, start, end, *options, crop=crop)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers * pages_per_task
+    window = max(1, max_in_flight // pages_per_task)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        shards = iter(shards)
+        while True:
+            for start, end in shards:
+                pending.append(
+                    pool.submit(
+                        rasterizer.render, pdf_path, start, end, *options, crop=crop
+                    )
+                )
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            # Refill the window once the oldest shard has been handed over
+            yield from pending.popleft().result()
+    finally:
+        # Also reached when the caller stops iterating early
+        pool.shutdown(cancel_futures=True)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respecting affinity where supported)."""
+    return getattr(os, "process_cpu_count", os.cpu_count)() or 1
+
+
+def _check_crop(crop: tuple[float, float, float, float] | None) -> None:
+    """Raise ValueError unless crop is None or a valid fractional box."""
+    if crop is not None:
+        left, top, right, bottom = crop
+        if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise ValueError(f"Invalid crop {crop!r}, expected fractions of the page")
+
+
+def render_pdf_page(
+    pdf_path: Path,
+    page: int = 1,
+    dpi: int | None = None,
+    size: tuple[int | None, int | None] | None = None,
+    grayscale: bool = False,
+    backend: str | Rasterizer = DEFAULT_RASTERIZER,
+    crop: tuple[float, float, float, float] | None = None,
+    thread_count: int = 1,
+) -> Image.Image:
+    """
+    Rasterize a single PDF page (the first by default) into a PIL image.
+
+    See render_pdf_pages() for the rendering options.
+    """
+    pages = render_pdf_pages(
+        pdf_path,
+        first_page=page,
+        dpi=dpi,
+        size=size,
+        grayscale=grayscale,
+        thread_count=thread_count,
+        backend=backend,
+        crop=crop,
+    )
+    return pages[0]
+
+
+def pdf_to_png(
+    pdf_path: Path,
+    output_path: Path,
+    page: int = 1,
+    dpi: int | None = None,
+    size: tuple[int | None, int | None] | None = None,
+    grayscale: bool = False,
+    backend: str | Rasterizer = DEFAULT_RASTERIZER,
+    thread_count: int = 1,
+):
+    """
+    Convert a single PDF page (the first by default) to a PNG image.
+
+    See render_pdf_pages() for the rendering options.
+    """
+    image = render_pdf_page(
+        pdf_path,
+        page=page,
+        dpi=dpi,
+        size=size,
+        grayscale=grayscale,
+        backend=backend,
+        thread_count=thread_count,
+    )
+    image.save(output_path)
     return output_path
+
+
+class PdfInspector:
+    """
+    Cheap, incremental completeness check for a PDF byte stream.
+
+    Feed it chunks while downloading (no extra file read) and ask for
+    problem() at the end. It checks the size, the %PDF- header, the %%EOF
+    trailer and counts page objects with a regex instead of parsing.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.head = b""
+        self.tail = b""
+        self.page_count = 0
+        self.has_object_streams = False
+
+    def update(self, chunk: bytes) -> None:
+        """Inspect the next chunk of the PDF."""
+        if len(self.head) < EDGE_BYTES:
+            self.head += chunk[: EDGE_BYTES - len(self.head)]
+
+        # Search tail + chunk so matches spanning two chunks are not missed,
+        # counting only those that end inside the new chunk.
+        window = self.tail + chunk
+        overlap = len(self.tail)
+        self.page_count += sum(
+            1 for m in PAGE_PATTERN.finditer(window) if m.end() > overlap
+        )
+        if not self.has_object_streams and b"/ObjStm" in window:
+            self.has_object_streams = True
+
+        self.tail = window[-EDGE_BYTES:]
+        self.size += len(chunk)
+
+    def problem(self, expected_length: int | None = None) -> str | None:
+        """
+        Return why the PDF looks incomplete or invalid, or None if it is fine.
+
+        Args:
+            expected_length: Content-Length announced by the server, if any.
+        """
+        if expected_length is not None and self.size != expected_length:
+            return f"size {self.size} does not match Content-Length {expected_length}"
+        if PDF_HEADER not in self.head:
+            return "missing %PDF- header (not a PDF, e.g. an HTML error page)"
+        if PDF_EOF not in self.tail:
+            return "missing %%EOF trailer (truncated)"
+        # Pages packed into compressed object streams are invisible to the regex
+        if self.page_count == 0 and not self.has_object_streams:
+            return "no page objects found"
+        return None
+
+
+def validate_pdf(pdf_path: Path, expected_length: int | None = None) -> str | None:
+    """
+    Check a PDF file on disk for completeness.
+
+    Returns:
+        str | None: Reason the PDF is invalid, or None if it looks complete.
+    """
+    inspector = PdfInspector()
+    with Path(pdf_path).open("rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            inspector.update(chunk)
+    return inspector.problem(expected_length)
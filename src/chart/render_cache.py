@@ -0,0 +1,78 @@
+import hashlib
+from pathlib import Path
+from typing import NamedTuple
+
+from src.chart.processors.image_tools import ChartImage
+from src.chart.store import KeyedCache
+
+
+class RenderKey(NamedTuple):
+    """
+    Everything that determines the bytes of a set of rendered derivatives.
+
+    pdf_hash: SHA256 of the source PDF.
+    page: Rendered page (1-based).
+    dpi: Render resolution, or None when only target sizes are used.
+    derivatives: Sorted (key, file name stem, size, encoding) tuples.
+    backend: Rasterizer version string, e.g. Rasterizer.version.
+    model_input: Region of interest and tile grid of the model input.
+    """
+
+    pdf_hash: str
+    page: int
+    dpi: int | None
+    derivatives: tuple
+    backend: str
+    model_input: tuple | None = None
+
+
+class RenderCache(KeyedCache):
+    """
+    Cache of rendered chart derivatives, keyed by RenderKey.
+
+    Each entry holds the encoded images and a manifest with their SHA256, so
+    a truncated or altered file is detected and re-rendered instead of
+    being served.
+    """
+
+    RECORD_JSON = "manifest.json"
+    LABEL = "render"
+
+    def get(self, key: RenderKey) -> dict[str, ChartImage] | None:
+        """Return the cached derivatives for key, or None on a miss."""
+        return super().get(key)
+
+    def put(self, key: RenderKey, images: dict[str, ChartImage]) -> Path:
+        """
+        Store derivatives under key and apply the retention policy.
+
+        The images' paths are set to their files in the cache.
+        """
+        entry = super().put(key, images)
+        for image in images.values():
+            image.path = entry / image.name
+        return entry
+
+    def _encode(self, directory: Path, images: dict[str, ChartImage]) -> dict:
+        files = {}
+        for name, image in images.items():
+            data = image.encode()
+            (directory / image.name).write_bytes(data)
+            files[name] = {
+                "file": image.name,
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "encoding": image.encoding,
+            }
+        return {"files": files}
+
+    def _decode(self, entry: Path, record: dict) -> dict[str, ChartImage]:
+        images = {}
+        for name, info in record["files"].items():
+            path = entry / info["file"]
+            data = path.read_bytes()
+            if hashlib.sha256(data).hexdigest() != info["sha256"]:
+                raise ValueError(f"{info['file']} does not match its checksum")
+            images[name] = ChartImage(
+                info["file"], data=data, path=path, encoding=info["encoding"]
+            )
+        return images
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    Limits for a store. None disables a limit.
+
+    keep: maximum number of entries kept on disk.
+    max_bytes: maximum total size of all entries.
+    max_age: maximum seconds since an entry was last used.
+    """
+
+    keep: int | None = 48
+    max_bytes: int | None = 256 * 1024 * 1024
+    max_age: float | None = 14 * 24 * 3600
+
+
+class StoreEntry(NamedTuple):
+    name: str
+    path: Path
+    size: int
+    last_used: float
+
+
+class LRUDirectoryStore:
+    """
+    Directory of entries, one subdirectory each, evicted least recently used
+    first under a RetentionPolicy.
+
+    The entry directory's mtime records its last use. Subdirectories ending
+    in PART_SUFFIX are entries still being written and are not listed.
+    """
+
+    LABEL = "entry"  # what an entry holds, for log messages
+    PART_SUFFIX = ".part"
+
+    def __init__(self, root: Path, policy: RetentionPolicy = RetentionPolicy()):
+        self.root = root
+        self.policy = policy
+
+    def entry_path(self, name: str) -> Path:
+        """Directory of the entry with the given name."""
+        return self.root / name
+
+    def touch(self, name: str) -> None:
+        """Mark an entry as recently used."""
+        os.utime(self.entry_path(name))
+
+    def entries(self) -> list[StoreEntry]:
+        """List stored entries, least recently used first."""
+        if not self.root.exists():
+            return []
+
+        entries = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or entry.name.endswith(self.PART_SUFFIX):
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+            entries.append(StoreEntry(entry.name, entry, size, entry.stat().st_mtime))
+        return sorted(entries, key=lambda e: e.last_used)
+
+    def evict(self, protect: set[str] = frozenset()) -> list[str]:
+        """
+        Apply the retention policy, removing least recently used entries.
+
+        Args:
+            protect: Names of entries that must survive (e.g. the current chart).
+        Returns:
+            list[str]: Names of the evicted entries.
+        """
+        entries = self.entries()
+        count = len(entries)
+        total = sum(e.size for e in entries)
+        now = time.time()
+        policy = self.policy
+
+        evicted = []
+        for entry in entries:
+            too_many = policy.keep is not None and count > policy.keep
+            too_big = policy.max_bytes is not None and total > policy.max_bytes
+            too_old = (
+                policy.max_age is not None and now - entry.last_used > policy.max_age
+            )
+            if not (too_many or too_big or too_old):
+                continue
+            if entry.name in protect:
+                continue
+
+            shutil.rmtree(entry.path, ignore_errors=True)
+            count -= 1
+            total -= entry.size
+            evicted.append(entry.name)
+
+        if evicted:
+            logger.info("Evicted %d %s(s) from %s", len(evicted), self.LABEL, self.root)
+        return evicted
+
+
+class KeyedCache(LRUDirectoryStore):
+    """
+    Cache of values keyed by a NamedTuple of everything that determines them.
+
+    Each key gets a directory named after digest(key) holding RECORD_JSON,
+    a record of the key and the value's metadata, plus any files the value
+    needs. Subclasses implement _encode() and _decode(). Entries are written
+    to a temporary directory renamed into place, so readers never see a
+    half-written entry, and an entry that cannot be read back is removed
+    and counts as a miss.
+    """
+
+    RECORD_JSON = "record.json"
+    LABEL = "cached value"
+
+    @staticmethod
+    def digest(key: NamedTuple) -> str:
+        """Stable directory name for a key."""
+        encoded = json.dumps(key._asdict(), sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()[:32]
+
+    def get(self, key: NamedTuple):
+        """Return the cached value for key, or None on a miss."""
+        digest = self.digest(key)
+        entry = self.entry_path(digest)
+        record_path = entry / self.RECORD_JSON
+        if not record_path.exists():
+            return None
+
+        try:
+            record = json.loads(record_path.read_text())
+            # Compared as JSON, which turns the key's tuples into lists
+            if record["key"] != json.loads(json.dumps(key._asdict())):
+                raise ValueError("entry is for a different key")
+            value = self._decode(entry, record)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(
+                "Discarding corrupt %s cache entry %s: %s", self.LABEL, entry, e
+            )
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        self.touch(digest)
+        return value
+
+    def put(self, key: NamedTuple, value) -> Path:
+        """
+        Store a value under key and apply the retention policy.
+
+        Returns:
+            Path: The entry directory.
+        """
+        digest = self.digest(key)
+        entry = self.entry_path(digest)
+        tmp = self.root / f"{digest}{self.PART_SUFFIX}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        record = {"key": key._asdict(), **self._encode(tmp, value)}
+        (tmp / self.RECORD_JSON).write_text(json.dumps(record, indent=2))
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        self.evict(protect={digest})
+        return entry
+
+    def _encode(self, directory: Path, value) -> dict:
+        """Write value's files into directory; return its record fields."""
+        raise NotImplementedError
+
+    def _decode(self, entry: Path, record: dict):
+        """
+        Rebuild a value from its entry directory and record. Raise OSError,
+        ValueError or KeyError if the entry is incomplete or corrupt.
+        """
+        raise NotImplementedError
+
+
+class ChartStore(LRUDirectoryStore):
+    """
+    Content-addressed store for chart PDFs.
+
+    Every chart version lives in its own directory named after the SHA256 of
+    the PDF, e.g. `charts/<sha256>/chart.pdf`, so a version seen before is
+    recognized without downloading it again. Images derived from a chart are
+    kept separately, in the RenderCache.
+    """
+
+    CHART_PDF = "chart.pdf"
+    LABEL = "chart"
+
+    def pdf_path(self, pdf_hash: str) -> Path:
+        """Path of the PDF stored under the given hash."""
+        return self.entry_path(pdf_hash) / ChartStore.CHART_PDF
+
+    def contains(self, pdf_hash: str | None) -> bool:
+        """Check whether a complete PDF is stored under the given hash."""
+        return bool(pdf_hash) and self.pdf_path(pdf_hash).exists()
+
+    def add(self, src: Path, pdf_hash: str) -> Path:
+        """
+        Move a verified PDF into the store under its hash.
+
+        Args:
+            src: Fully written PDF on the same filesystem as the store.
+            pdf_hash: SHA256 of src.
+        Returns:
+            Path: Location of the stored PDF.
+        """
+        entry = self.entry_path(pdf_hash)
+        entry.mkdir(parents=True, exist_ok=True)
+        dst = self.pdf_path(pdf_hash)
+        os.replace(src, dst)
+        self.touch(pdf_hash)
+        return dst
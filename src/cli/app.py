@@ -36,4 +36,11 @@ def parse_args(argv=None):
         help="Simulate the run without posting to Salesforce.",
     )
 
+    parser.add_argument(
+        "--refresh-forecast",
+        action="store_true",
+        default=False,
+        help="Bypass the forecast cache and run the model; updates the cache.",
+    )
+
     return parser.parse_args(argv)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from PIL import Image
+
+from src.chart.store import KeyedCache
+
+
+class ForecastKey(NamedTuple):
+    """
+    Everything that determines a generated forecast.
+
+    image_hashes: pixel_hash() of each model image, in order.
+    prompt: Prompt including its <image> placeholders.
+    model: Model name, revision, dtype and quantization, e.g.
+        "llava-hf/...@main:float32:none".
+    max_tokens: Maximum number of generated tokens.
+    generation: Sorted (name, value) generation parameters.
+    """
+
+    image_hashes: tuple
+    prompt: str
+    model: str
+    max_tokens: int
+    generation: tuple
+
+
+def pixel_hash(img: Image.Image) -> str:
+    """
+    SHA256 of an image's decoded pixels.
+
+    Unlike a file hash this does not change when the same rendering is
+    re-encoded, e.g. with another PNG compression level.
+    """
+    digest = hashlib.sha256(f"{img.mode}:{img.width}x{img.height}:".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+class ForecastCache(KeyedCache):
+    """
+    Persistent cache of generated forecast texts, keyed by ForecastKey.
+
+    Generation is deterministic for a given key, so a hit is returned as is
+    instead of running the model. Hit and miss counts are kept across runs
+    in METRICS_JSON.
+    """
+
+    RECORD_JSON = "forecast.json"
+    METRICS_JSON = "metrics.json"
+    LABEL = "forecast"
+
+    def get(self, key: ForecastKey) -> str | None:
+        """Return the cached forecast for key, or None on a miss."""
+        text = super().get(key)
+        self._count("misses" if text is None else "hits")
+        return text
+
+    def put(self, key: ForecastKey, text: str) -> Path:
+        """Store a forecast under key and apply the retention policy."""
+        return super().put(key, text)
+
+    def metrics(self) -> dict:
+        """Hit and miss counts since the cache was created."""
+        try:
+            counts = json.loads((self.root / ForecastCache.METRICS_JSON).read_text())
+        except (OSError, ValueError):
+            counts = {}
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def _count(self, name: str) -> None:
+        """Increment a persistent lookup counter."""
+        metrics = self.metrics()
+        metrics[name] += 1
+        self.root.mkdir(parents=True, exist_ok=True)
+        counts = {"hits": metrics["hits"], "misses": metrics["misses"]}
+        # Replaced atomically, so a crash never leaves a truncated file
+        path = self.root / ForecastCache.METRICS_JSON
+        tmp = path.with_name(path.name + self.PART_SUFFIX)
+        tmp.write_text(json.dumps(counts))
+        os.replace(tmp, path)
+
+    def _encode(self, directory: Path, text: str) -> dict:
+        return {"text": text}
+
+    def _decode(self, entry: Path, record: dict) -> str:
+        return record["text"]
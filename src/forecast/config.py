@@ -0,0 +1,23 @@
+"""
+Model and generation settings of WeatherVision.
+
+These also make up the forecast cache key, so they live apart from
+generator.py: the pipeline reads them without importing torch and
+transformers on a cache hit.
+"""
+
+MODEL_NAME = "llava-hf/llava-interleave-qwen-0.5b-hf"
+MODEL_REVISION = "main"  # Hugging Face branch, tag or commit
+MAX_TOKENS = 150
+# Greedy decoding: the same inputs always give the same forecast, which
+# is what lets the pipeline cache forecasts
+GENERATION_PARAMS = {"do_sample": False}
+# Weight dtype: "float32", "bfloat16", "float16", or "auto" for the dtype
+# the checkpoint was saved in. Half precision halves the memory the
+# weights need; bfloat16 on MPS needs macOS 14 or later.
+DTYPE = "float32"
+# Quantize the language model for CPU inference: "dynamic-int8", "int8"
+# or "int4" (see src/forecast/quantize.py), or None for full precision.
+# Quantized models always run on the CPU; pair with DTYPE = "auto" so the
+# layers being quantized are never upcast to float32 first.
+QUANTIZATION = None
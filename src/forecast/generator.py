@@ -1,18 +1,65 @@
-from transformers import AutoProcessor, AutoModelForImageTextToText
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+import transformers
+from transformers import AutoProcessor, AutoModelForImageTextToText, DynamicCache
 from PIL import Image
 import torch
 
+from src.forecast import config
+from src.forecast.cache import pixel_hash
+from src.forecast.quantize import INT4_GROUP_SIZE, QUANTIZATIONS, quantize_model
+
 
 class WeatherVision:
     """
     Image-to-text forecaster optimized for M1/M2 Mac (MPS backend).
     """
 
-    MODEL_NAME = "llava-hf/llava-interleave-qwen-0.5b-hf"
+    # Model and generation settings; see src/forecast/config.py
+    MODEL_NAME = config.MODEL_NAME
+    MODEL_REVISION = config.MODEL_REVISION
+    MAX_TOKENS = config.MAX_TOKENS
+    GENERATION_PARAMS = config.GENERATION_PARAMS
+    DTYPE = config.DTYPE
+    QUANTIZATION = config.QUANTIZATION
+    # Items per model.generate call in generate_forecasts(); each image adds
+    # ~730 vision tokens to the KV cache, so keep this small on 8 GB machines.
+    MAX_BATCH_SIZE = 4
+    # Projected vision features kept in memory by generate_answers(), per image
+    FEATURE_CACHE_SIZE = 32
+    # Accepted DTYPE values
+    DTYPES = ("auto", "float32", "bfloat16", "float16")
+    # Load the weights straight onto an MPS device (uses accelerate) instead
+    # of loading them on the CPU and copying them over with model.to(). On
+    # the CPU there is no copy to save and a device map only adds overhead.
+    DEVICE_MAP = True
+    # Only accept .safetensors weights: they are memory-mapped and copied into
+    # the model tensor by tensor, while pickled .bin files are read whole
+    USE_SAFETENSORS = True
+    # Quantized layers are saved here, so each model is quantized only once
+    QUANTIZED_DIR = "./data/quantized"
+
+    def __init__(
+        self,
+        dtype: str | None = None,
+        device_map: bool | None = None,
+        quantization: str | None = None,
+    ):
+        """
+        Args:
+            dtype (str | None): Weight dtype, one of DTYPES; defaults to DTYPE.
+            device_map (bool | None): Load weights directly onto an MPS
+                device; defaults to DEVICE_MAP.
+            quantization (str | None): One of QUANTIZATIONS; defaults to
+                QUANTIZATION.
+        """
+        self.quantization = quantization or self.QUANTIZATION
 
-    def __init__(self):
-        # Detect MPS
-        if torch.backends.mps.is_available():
+        # Detect MPS; the quantized kernels are CPU only
+        if torch.backends.mps.is_available() and not self.quantization:
             # Using MPS backend (Apple Silicon).
             self.device = torch.device("mps")
         else:
@@ -20,44 +67,427 @@ class WeatherVision:
             self.device = torch.device("cpu")
 
         # Load model + processor
-        self.processor = AutoProcessor.from_pretrained(self.MODEL_NAME, use_fast=True)
-        self.model = AutoModelForImageTextToText.from_pretrained(self.MODEL_NAME)
-        self.model.to(self.device)
-        self.model.eval()
+        self.processor = AutoProcessor.from_pretrained(
+            self.MODEL_NAME, revision=self.MODEL_REVISION, use_fast=True
+        )
+        self.model = self.load_model(
+            self.device,
+            dtype,
+            device_map,
+            quantization=self.quantization,
+            quantized_dir=self.QUANTIZED_DIR,
+        )
+
+        # pixel_hash(image) -> projected vision features, least recent first
+        self._features = OrderedDict()
+        # Registered prompt prefix -> (token ids, per-layer (keys, values))
+        self._prefixes = {}
+
+    @classmethod
+    def load_model(
+        cls,
+        device: torch.device,
+        dtype: str | None = None,
+        device_map: bool | None = None,
+        model_name: str | None = None,
+        quantization: str | None = None,
+        quantized_dir: str | Path | None = QUANTIZED_DIR,
+    ):
+        """
+        Loads the vision-language model for inference.
+
+        Args:
+            device (torch.device): Device to run the model on.
+            dtype (str | None): Weight dtype, one of DTYPES; defaults to DTYPE.
+            device_map (bool | None): Load weights directly onto an MPS
+                device; defaults to DEVICE_MAP.
+            model_name (str | None): Hub name or local directory; defaults to
+                MODEL_NAME at MODEL_REVISION.
+            quantization (str | None): One of QUANTIZATIONS, or None to keep
+                full precision. Needs a CPU device.
+            quantized_dir (str | Path | None): Where quantized layers are
+                saved and loaded from; None quantizes on every load.
+        Returns:
+            The model, on device and in eval mode.
+        """
+        dtype = dtype or cls.DTYPE
+        if dtype not in cls.DTYPES:
+            raise ValueError(f"dtype must be one of {cls.DTYPES}, got {dtype!r}")
+        if device_map is None:
+            device_map = cls.DEVICE_MAP
+        if quantization is not None:
+            if quantization not in QUANTIZATIONS:
+                raise ValueError(
+                    f"quantization must be one of {QUANTIZATIONS}, "
+                    f"got {quantization!r}"
+                )
+            if device.type != "cpu":
+                raise ValueError("Quantized models run on the CPU only")
+
+        kwargs = {
+            "dtype": dtype if dtype == "auto" else getattr(torch, dtype),
+            "use_safetensors": cls.USE_SAFETENSORS,
+        }
+        revision = None
+        if model_name is None:
+            model_name, revision = cls.MODEL_NAME, cls.MODEL_REVISION
+            kwargs["revision"] = revision
+        device_map = device_map and device.type != "cpu"
+        if device_map:
+            kwargs["device_map"] = device.type
+
+        model = AutoModelForImageTextToText.from_pretrained(model_name, **kwargs)
+        if not device_map:
+            model.to(device)
+        model.eval()
+
+        if quantization is not None:
+            path = None
+            if quantized_dir is not None:
+                key = [
+                    model_name,
+                    revision,
+                    dtype,
+                    quantization,
+                    INT4_GROUP_SIZE,
+                    torch.__version__,
+                    transformers.__version__,
+                ]
+                digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()[:32]
+                path = Path(quantized_dir) / f"{digest}.pt"
+            quantize_model(model, quantization, path)
+        return model
 
     def generate_forecast(
-        self, file_path: str, prompt: str, max_tokens: int = 150
+        self,
+        file_path: str | Image.Image | list[str | Image.Image],
+        prompt: str,
+        max_tokens: int = MAX_TOKENS,
     ) -> str:
         """
-        Generates weather analysis or description from a PNG.
+        Generates weather analysis or description from chart images.
+
+        Several images (e.g. a region overview and its tiles) are encoded
+        together in one vision-encoder forward pass, and the model writes one
+        forecast from all of them.
 
         Args:
-            file_path (str): Path to the PNG image file.
-            prompt (str): Text prompt to guide the generation.
+            file_path (str | Image.Image | list): Path to a PNG file, or an
+                image that is already decoded in memory, or a list of these.
+            prompt (str): Text prompt to guide the generation, with one
+                <image> placeholder per image.
             max_tokens (int): Maximum number of tokens to generate.
         Returns:
             str: Generated text forecast.
         """
 
-        # Load image
-        img = Image.open(file_path).convert("RGB")
+        # Prompts with a registered prefix take the prefix-cached path
+        if any(prompt.startswith(prefix) for prefix in self._prefixes):
+            return self.generate_answers(file_path, [prompt], max_tokens)[0]
+
+        # Load images (in-memory images skip the disk round trip)
+        images = file_path if isinstance(file_path, list) else [file_path]
+        images = [self._load_image(img) for img in images]
 
-        # Prepare inputs
-        inputs = self.processor(text=prompt, images=img, return_tensors="pt")
+        # Prepare inputs; the processor stacks all images into one batch
+        inputs = self.processor(
+            text=prompt,
+            images=images[0] if len(images) == 1 else images,
+            return_tensors="pt",
+        )
 
         # Move tensors to MPS/CPU
-        for k in inputs:
-            if isinstance(inputs[k], torch.Tensor):
-                inputs[k] = inputs[k].to(self.device)
+        self._to_device(inputs)
 
         # Generate
         with torch.no_grad():
             out = self.model.generate(
                 **inputs,
                 pad_token_id=self.processor.tokenizer.eos_token_id,
-                max_new_tokens=max_tokens
+                max_new_tokens=max_tokens,
+                **self.GENERATION_PARAMS,
             )
 
         # Decode result
         text = self.processor.decode(out[0], skip_special_tokens=True)
         return text
+
+    def generate_forecasts(
+        self,
+        items: list[tuple[str | Image.Image | list, str, int]],
+        max_batch_size: int | None = None,
+    ) -> list[str]:
+        """
+        Generates forecasts for many (image, prompt, max_tokens) items.
+
+        Items are bucketed by image count and prompt length so each batch
+        needs little padding, then every batch of up to max_batch_size items
+        is left-padded, collated by the processor and run through a single
+        model.generate call. A batch generates up to its largest max_tokens
+        and each output is cut back to its own item's limit.
+
+        Args:
+            items (list): (image, prompt, max_tokens) tuples, where image is
+                anything generate_forecast() accepts.
+            max_batch_size (int | None): Items per generate call; defaults to
+                MAX_BATCH_SIZE. Lower it if batches run out of memory.
+        Returns:
+            list[str]: Generated texts, in the order of items.
+        """
+        max_batch_size = max_batch_size or self.MAX_BATCH_SIZE
+        tokenizer = self.processor.tokenizer
+
+        prepared = []
+        for image, prompt, max_tokens in items:
+            images = image if isinstance(image, list) else [image]
+            images = [self._load_image(img) for img in images]
+            length = len(tokenizer(prompt).input_ids)
+            prepared.append((images, prompt, max_tokens, length))
+
+        # Bucket: similar lengths end up in the same batch
+        order = sorted(
+            range(len(prepared)),
+            key=lambda i: (len(prepared[i][0]), prepared[i][3]),
+        )
+
+        texts = [None] * len(prepared)
+        padding_side = tokenizer.padding_side
+        tokenizer.padding_side = "left"  # generation continues from the right
+        try:
+            for start in range(0, len(order), max_batch_size):
+                batch = order[start : start + max_batch_size]
+                inputs = self.processor(
+                    text=[prepared[i][1] for i in batch],
+                    images=[img for i in batch for img in prepared[i][0]],
+                    padding=True,
+                    return_tensors="pt",
+                )
+                self._to_device(inputs)
+                input_length = inputs["input_ids"].shape[1]
+
+                with torch.no_grad():
+                    out = self.model.generate(
+                        **inputs,
+                        pad_token_id=tokenizer.eos_token_id,
+                        max_new_tokens=max(prepared[i][2] for i in batch),
+                        **self.GENERATION_PARAMS,
+                    )
+
+                for row, i in enumerate(batch):
+                    tokens = out[row][: input_length + prepared[i][2]]
+                    texts[i] = self.processor.decode(tokens, skip_special_tokens=True)
+        finally:
+            tokenizer.padding_side = padding_side
+
+        return texts
+
+    def generate_answers(
+        self,
+        image: str | Image.Image | list[str | Image.Image],
+        prompts: list[str],
+        max_tokens: int = MAX_TOKENS,
+    ) -> list[str]:
+        """
+        Answers several prompts about the same chart images.
+
+        The vision tower and projector run once per image and their output
+        is cached by image hash, so N prompts cost one vision forward pass
+        plus N decodes, and images seen before skip the vision pass
+        entirely. Each prompt is embedded with the cached features placed
+        at its image tokens and decoded without pixel_values.
+
+        Args:
+            image (str | Image.Image | list): Images as for generate_forecast().
+            prompts (list[str]): Prompts, each with one <image> placeholder
+                per image.
+            max_tokens (int): Maximum number of tokens to generate per prompt.
+        Returns:
+            list[str]: Generated texts, one per prompt.
+        """
+        images = image if isinstance(image, list) else [image]
+        features = self._image_features([self._load_image(img) for img in images])
+        image_token = self.processor.image_token
+        image_token_id = self.model.config.image_token_id
+        embed_tokens = self.model.get_input_embeddings()
+
+        texts = []
+        for prompt in prompts:
+            # Expand each placeholder to its image's feature length
+            parts = prompt.split(image_token)
+            if len(parts) != len(features) + 1:
+                raise ValueError(
+                    f"Prompt has {len(parts) - 1} {image_token} placeholders "
+                    f"for {len(features)} images"
+                )
+            expanded = parts[0]
+            for feature, part in zip(features, parts[1:]):
+                expanded += image_token * feature.shape[0] + part
+
+            inputs = self.processor.tokenizer(expanded, return_tensors="pt")
+            self._to_device(inputs)
+
+            with torch.no_grad():
+                input_ids = inputs["input_ids"]
+                embeds = embed_tokens(input_ids)
+                image_mask = input_ids == image_token_id
+                embeds[image_mask] = torch.cat(features).to(embeds.dtype)
+                out = self._generate_from_embeds(input_ids, embeds, max_tokens)
+
+            texts.append(self.processor.decode(out[0], skip_special_tokens=True))
+        return texts
+
+    def register_prefix(self, prefix: str, cache_dir: Path | None = None) -> None:
+        """
+        Precomputes the KV cache of a static prompt prefix, e.g. the system
+        and instruction text that every prompt starts with.
+
+        generate_forecast() and generate_answers() calls whose prompt starts
+        with a registered prefix only prefill the rest of the prompt (the
+        images and the variable text). Requires greedy decoding.
+
+        Args:
+            prefix (str): Prompt text up to the first <image>.
+            cache_dir (Path | None): If given, the KV cache is saved there
+                per model revision and loaded instead of recomputed on the
+                next model load.
+        """
+        ids = self.processor.tokenizer(prefix, return_tensors="pt")["input_ids"]
+        ids = ids.to(self.device)
+
+        path = None
+        if cache_dir is not None:
+            path = Path(cache_dir) / f"{self._prefix_digest(prefix)}.pt"
+
+        if path is not None and path.exists():
+            layers = torch.load(path, map_location=self.device, weights_only=True)
+        else:
+            with torch.no_grad():
+                cache = self.model(input_ids=ids, use_cache=True).past_key_values
+            layers = [(layer.keys, layer.values) for layer in cache.layers]
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".part")
+                torch.save(layers, tmp)
+                os.replace(tmp, path)
+
+        self._prefixes[prefix] = (ids, layers)
+
+    def _prefix_digest(self, prefix: str) -> str:
+        """File name of a persisted prefix KV cache."""
+        key = [
+            self.MODEL_NAME,
+            self.MODEL_REVISION,
+            str(self.model.dtype),
+            self.quantization,
+            transformers.__version__,
+            prefix,
+        ]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()[:32]
+
+    def _generate_from_embeds(
+        self, input_ids: torch.Tensor, embeds: torch.Tensor, max_tokens: int
+    ) -> torch.Tensor:
+        """
+        Runs model.generate on prompt embeddings, starting from a registered
+        prefix's KV cache when the prompt begins with its tokens.
+        """
+        eos_token_id = self.processor.tokenizer.eos_token_id
+        options = dict(pad_token_id=eos_token_id, **self.GENERATION_PARAMS)
+        length = input_ids.shape[1]
+
+        prefix = None
+        if not self.GENERATION_PARAMS.get("do_sample"):
+            for ids, layers in self._prefixes.values():
+                # Compare tokens: the prefix must tokenize the same in context
+                if ids.shape[1] < length and torch.equal(
+                    input_ids[:, : ids.shape[1]], ids
+                ):
+                    prefix = (ids.shape[1], layers)
+                    break
+
+        if prefix is None:
+            return self.model.generate(
+                input_ids=input_ids,
+                inputs_embeds=embeds,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_tokens,
+                **options,
+            )
+
+        # generate() cannot start from a cache that stops before image
+        # embeddings, so prefill the rest of the prompt here, take the first
+        # token greedily, and let generate() continue from there.
+        cached, layers = prefix
+        cache = DynamicCache()
+        for index, (keys, values) in enumerate(layers):
+            cache.update(keys.clone(), values.clone(), index)
+
+        logits = self.model(
+            inputs_embeds=embeds[:, cached:],
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=cache,
+            cache_position=torch.arange(cached, length, device=self.device),
+            use_cache=True,
+        ).logits
+        first = logits[:, -1:].argmax(dim=-1)
+        out = torch.cat([input_ids, first], dim=1)
+        if max_tokens == 1 or first.item() == eos_token_id:
+            return out
+
+        return self.model.generate(
+            input_ids=out,
+            attention_mask=torch.ones_like(out),
+            past_key_values=cache,
+            max_new_tokens=max_tokens - 1,
+            **options,
+        )
+
+    def _image_features(self, images: list[Image.Image]) -> list[torch.Tensor]:
+        """
+        Projected vision features of each image, one (tokens, hidden) tensor
+        per image, from the cache or from one vision forward pass over all
+        images not cached yet.
+        """
+        keys = [pixel_hash(img) for img in images]
+        missing = list(dict.fromkeys(k for k in keys if k not in self._features))
+
+        if missing:
+            pending = [images[keys.index(key)] for key in missing]
+            processed = self.processor.image_processor(pending, return_tensors="pt")
+            pixel_values = processed["pixel_values"].to(self.device, self.model.dtype)
+
+            config = self.model.config
+            with torch.no_grad():
+                output = self.model.get_image_features(
+                    pixel_values=pixel_values,
+                    vision_feature_layer=config.vision_feature_layer,
+                    vision_feature_select_strategy=config.vision_feature_select_strategy,
+                )
+            # transformers 5 wraps the per-image features in a model output
+            output = getattr(output, "pooler_output", output)
+
+            for key, feature in zip(missing, output):
+                self._features[key] = feature
+
+        features = []
+        for key in keys:
+            self._features.move_to_end(key)
+            features.append(self._features[key])
+        # Trimmed only now, so this call's images are the most recent
+        while len(self._features) > self.FEATURE_CACHE_SIZE:
+            self._features.popitem(last=False)
+        return features
+
+    def _to_device(self, inputs) -> None:
+        """Move the tensors of processor inputs to MPS/CPU, in place."""
+        for k in inputs:
+            if isinstance(inputs[k], torch.Tensor):
+                inputs[k] = inputs[k].to(self.device)
+
+    @staticmethod
+    def _load_image(image: str | Image.Image) -> Image.Image:
+        """Open an image path, or pass a decoded image through, as RGB."""
+        img = image if isinstance(image, Image.Image) else Image.open(image)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        return img
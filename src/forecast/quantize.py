@@ -0,0 +1,260 @@
+"""
+Weight quantization of WeatherVision's language model for CPU inference.
+
+Modes (QUANTIZATIONS):
+
+    dynamic-int8  int8 weights, activations quantized on the fly per call
+                  (torch.ao dynamic quantization, fbgemm/x86 kernels)
+    int8          int8 weights with one scale per output channel
+    int4          4-bit weights with a scale and zero point per group of
+                  INT4_GROUP_SIZE inputs
+
+The weight-only modes (int8, int4) use torch's CPU weight-only kernels,
+which are fast with bfloat16 activations only, so these layers compute in
+bfloat16. They speed up decoding, where each step reads every weight once,
+but prefill is about twice as slow as float32. dynamic-int8 speeds up both.
+
+Only the decoder's linear layers and the output head are quantized; the
+vision tower, projector, embeddings and norms stay in float32. The
+quantized layers' state dicts can be saved so a model is quantized once and
+later loads only swap the saved layers in.
+"""
+
+import os
+from pathlib import Path
+
+import torch
+from torch import nn
+
+QUANTIZATIONS = ("dynamic-int8", "int8", "int4")
+# Inputs sharing an int4 scale; smaller groups are more accurate but slower.
+# The CPU kernel supports 32, 64, 128 and 256.
+INT4_GROUP_SIZE = 32
+# Output rows quantized at a time, bounding the float32 temporaries (the
+# output head has 152k rows)
+QUANTIZE_ROWS = 4096
+
+
+class Int8WeightOnlyLinear(nn.Module):
+    """Linear layer with int8 weights and per-output-channel scales."""
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer(
+            "weight", torch.zeros(out_features, in_features, dtype=torch.int8)
+        )
+        # bfloat16 bits, stored as int16 so that model.float() leaves them
+        self.register_buffer("scales", torch.zeros(out_features, dtype=torch.int16))
+        self.register_buffer("bias", torch.zeros(out_features) if bias else None)
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear) -> "Int8WeightOnlyLinear":
+        """Quantize a float linear layer symmetrically, per output channel."""
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None)
+        for rows in _row_chunks(linear.weight):
+            weight = linear.weight[rows].detach().float()
+            scales = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+            module.weight[rows] = torch.round(weight / scales[:, None])
+            module.scales[rows] = scales.to(torch.bfloat16).view(torch.int16)
+        if linear.bias is not None:
+            module.bias = linear.bias.detach().float()
+        return module
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = torch._weight_int8pack_mm(
+            x.reshape(-1, self.in_features).to(torch.bfloat16).contiguous(),
+            self.weight,
+            self.scales.view(torch.bfloat16),
+        )
+        out = out.to(x.dtype)
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*x.shape[:-1], self.out_features)
+
+
+class Int4WeightOnlyLinear(nn.Module):
+    """
+    Linear layer with 4-bit weights, packed two per byte in the layout of
+    torch's CPU int4 kernel, and a scale and zero point per group of inputs.
+    """
+
+    def __init__(
+        self,
+        in_features: int,
+        out_features: int,
+        bias: bool = True,
+        group_size: int = INT4_GROUP_SIZE,
+    ):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer(
+            "weight", torch.zeros(out_features, in_features // 2, dtype=torch.uint8)
+        )
+        # bfloat16 bits, stored as int16 so that model.float() leaves them
+        self.register_buffer(
+            "scales_and_zeros",
+            torch.zeros(in_features // group_size, out_features, 2, dtype=torch.int16),
+        )
+        self.register_buffer("bias", torch.zeros(out_features) if bias else None)
+
+    @classmethod
+    def from_linear(
+        cls, linear: nn.Linear, group_size: int = INT4_GROUP_SIZE
+    ) -> "Int4WeightOnlyLinear":
+        """Quantize a float linear layer asymmetrically, per group of inputs."""
+        out_features, in_features = linear.weight.shape
+        module = cls(in_features, out_features, linear.bias is not None, group_size)
+
+        for rows in _row_chunks(linear.weight):
+            groups = linear.weight[rows].detach().float()
+            groups = groups.reshape(groups.shape[0], -1, group_size)
+            low, high = groups.amin(dim=-1), groups.amax(dim=-1)
+            scales = (high - low).clamp(min=1e-8) / 15
+            levels = (groups - low[..., None]) / scales[..., None]
+            levels = levels.round_().clamp_(0, 15).to(torch.int32)
+            module.weight[rows] = torch._convert_weight_to_int4pack_for_cpu(
+                levels.reshape(-1, in_features), 1
+            )
+            # The kernel computes (level - 8) * scale + zero
+            zeros = low + 8 * scales
+            scales_and_zeros = torch.stack([scales, zeros], dim=-1).transpose(0, 1)
+            module.scales_and_zeros[:, rows] = scales_and_zeros.to(torch.bfloat16).view(
+                torch.int16
+            )
+        if linear.bias is not None:
+            module.bias = linear.bias.detach().float()
+        return module
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = torch._weight_int4pack_mm_for_cpu(
+            x.reshape(-1, self.in_features).to(torch.bfloat16).contiguous(),
+            self.weight,
+            self.group_size,
+            self.scales_and_zeros.view(torch.bfloat16),
+        )
+        out = out.to(x.dtype)
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*x.shape[:-1], self.out_features)
+
+
+def quantize_model(
+    model: nn.Module, quantization: str, path: Path | None = None
+) -> nn.Module:
+    """
+    Quantizes the language model of a vision-language model in place.
+
+    The layers left in full precision are converted to float32, and the
+    model should run on the CPU.
+
+    Args:
+        model: Model with get_decoder() and get_output_embeddings(), e.g. a
+            LlavaForConditionalGeneration.
+        quantization: One of QUANTIZATIONS.
+        path: If given and it exists, the quantized layers are loaded from it
+            instead of being quantized; otherwise they are saved to it.
+    Returns:
+        The model.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(
+            f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}"
+        )
+
+    saved = None
+    if path is not None and Path(path).exists():
+        saved = torch.load(path, weights_only=True)
+
+    quantized = {}
+    for name, parent, attr in _quantizable_linears(model, quantization):
+        linear = getattr(parent, attr)
+        if saved is not None:
+            layer = _empty_layer(linear, quantization)
+            layer.load_state_dict(saved[name])
+        else:
+            layer = _quantize_layer(linear, quantization)
+            quantized[name] = layer.state_dict()
+        setattr(parent, attr, layer)  # frees the float weights
+    model.float()
+
+    if saved is None and path is not None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".part")
+        torch.save(quantized, tmp)
+        os.replace(tmp, path)
+    return model
+
+
+def _quantizable_linears(
+    model: nn.Module, quantization: str
+) -> list[tuple[str, nn.Module, str]]:
+    """(name, parent, attribute) of each linear layer to quantize."""
+    targets = []
+    for prefix, root in (
+        ("decoder", model.get_decoder()),
+        ("output", model.get_output_embeddings()),
+    ):
+        if isinstance(root, nn.Linear):
+            targets.append((prefix, model, _child_name(model, root)))
+            continue
+        for name, module in root.named_modules():
+            for attr, child in module.named_children():
+                if isinstance(child, nn.Linear):
+                    full_name = ".".join(filter(None, (prefix, name, attr)))
+                    targets.append((full_name, module, attr))
+
+    if quantization == "int4":
+        # The int4 kernel needs whole groups of inputs and tiles of 16 outputs
+        targets = [
+            (name, parent, attr)
+            for name, parent, attr in targets
+            if getattr(parent, attr).in_features % INT4_GROUP_SIZE == 0
+            and getattr(parent, attr).out_features % 16 == 0
+        ]
+    return targets
+
+
+def _row_chunks(weight: torch.Tensor):
+    """Slices of at most QUANTIZE_ROWS output rows of a weight matrix."""
+    for start in range(0, weight.shape[0], QUANTIZE_ROWS):
+        yield slice(start, start + QUANTIZE_ROWS)
+
+
+def _child_name(parent: nn.Module, child: nn.Module) -> str:
+    """Attribute name of a direct child module."""
+    return next(name for name, module in parent.named_children() if module is child)
+
+
+def _quantize_layer(linear: nn.Linear, quantization: str) -> nn.Module:
+    """Quantized copy of a float linear layer."""
+    if quantization == "dynamic-int8":
+        from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+        from torch.ao.quantization import default_dynamic_qconfig
+
+        linear = linear.float()
+        linear.qconfig = default_dynamic_qconfig
+        return DynamicLinear.from_float(linear)
+    if quantization == "int8":
+        return Int8WeightOnlyLinear.from_linear(linear)
+    return Int4WeightOnlyLinear.from_linear(linear)
+
+
+def _empty_layer(linear: nn.Linear, quantization: str) -> nn.Module:
+    """Quantized layer of the same shape as linear, to load saved state into."""
+    bias = linear.bias is not None
+    if quantization == "dynamic-int8":
+        from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+
+        # Built 1x1: the constructor packs a zero weight of the given shape,
+        # and load_state_dict() packs the saved weight again anyway
+        layer = DynamicLinear(1, 1, bias_=bias, dtype=torch.qint8)
+        layer.in_features, layer.out_features = linear.in_features, linear.out_features
+        return layer
+    if quantization == "int8":
+        return Int8WeightOnlyLinear(linear.in_features, linear.out_features, bias)
+    return Int4WeightOnlyLinear(linear.in_features, linear.out_features, bias)
@@ -0,0 +1,389 @@
+"""
+Local inference service that keeps WeatherVision loaded across runs.
+
+Loading the processor and model and moving them to the device dominates a
+pipeline run, and the hourly cron job starts a fresh process every time.
+This service loads the model once and answers generate requests over HTTP
+on localhost; the pipeline uses it when it is running and falls back to
+in-process inference otherwise.
+
+Run it with:
+
+    python -m src.forecast.service [--host 127.0.0.1] [--port 8765]
+
+Endpoints:
+    GET  /health    Model status and request count.
+    POST /generate  {"images": [base64 PNG, ...], "prompt": str,
+                    "max_tokens": int} -> {"text": str}
+    POST /answers   {"images": [...], "prompts": [str, ...], "max_tokens": int}
+                    -> {"texts": [str, ...]}; image features stay cached
+                    in the service between requests
+    POST /reload    Load a fresh model and swap it in (also on SIGHUP).
+
+SIGTERM and SIGINT stop accepting connections and let in-flight requests
+finish before exiting.
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from typing import Callable
+
+import requests
+from PIL import Image
+
+from src.chart.processors.image_tools import encode_image
+from src.forecast.config import MAX_TOKENS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Overrides the service address for clients, e.g. http://127.0.0.1:9000
+SERVICE_URL_ENV = "FORECAST_SERVICE_URL"
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastServiceError(RuntimeError):
+    """The inference service could not be reached or failed a request."""
+
+
+class ForecastService:
+    """
+    Holds a loaded WeatherVision and serializes inference on it.
+
+    The model is not safe to run concurrently, so generate() takes a lock;
+    health checks do not, and are answered while a forecast is running.
+    """
+
+    def __init__(
+        self,
+        model_factory: Callable | None = None,
+        prefixes: list[str] = (),
+        prefix_cache_dir: Path | None = None,
+    ):
+        """
+        Args:
+            model_factory: Builds the model; defaults to WeatherVision().
+            prefixes: Prompt prefixes whose KV cache is precomputed on every
+                model load (see WeatherVision.register_prefix).
+            prefix_cache_dir: Where prefix KV caches are persisted, if at all.
+        """
+        self._model_factory = model_factory or _load_weather_vision
+        self.prefixes = list(prefixes)
+        self.prefix_cache_dir = prefix_cache_dir
+        self._generate_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.vision = None
+        self.loaded_at = None
+        self.served = 0
+        self.reloading = False
+
+    def load(self) -> None:
+        """
+        Load a model and swap it in.
+
+        The new model is loaded while the current one keeps serving, and
+        only the swap waits for an in-flight request to finish. Concurrent
+        reloads are collapsed into one.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            logger.info("Reload already in progress")
+            return
+        try:
+            self.reloading = True
+            started = time.monotonic()
+            vision = self._model_factory()
+            for prefix in self.prefixes:
+                vision.register_prefix(prefix, self.prefix_cache_dir)
+            with self._generate_lock:
+                self.vision = vision
+                self.loaded_at = time.time()
+            logger.info("Model loaded in %.1fs", time.monotonic() - started)
+        finally:
+            self.reloading = False
+            self._reload_lock.release()
+
+    def generate(
+        self, images: list[Image.Image], prompt: str, max_tokens: int = MAX_TOKENS
+    ) -> str:
+        """Run WeatherVision.generate_forecast() on the loaded model."""
+        with self._generate_lock:
+            if self.vision is None:
+                raise ForecastServiceError("Model is not loaded")
+            text = self.vision.generate_forecast(
+                images[0] if len(images) == 1 else images, prompt, max_tokens
+            )
+            self.served += 1
+        return text
+
+    def answer(
+        self,
+        images: list[Image.Image],
+        prompts: list[str],
+        max_tokens: int = MAX_TOKENS,
+    ) -> list[str]:
+        """Run WeatherVision.generate_answers() on the loaded model."""
+        with self._generate_lock:
+            if self.vision is None:
+                raise ForecastServiceError("Model is not loaded")
+            texts = self.vision.generate_answers(images, prompts, max_tokens)
+            self.served += 1
+        return texts
+
+    def health(self) -> dict:
+        """Status reported by GET /health."""
+        return {
+            "status": "ok" if self.vision is not None else "loading",
+            "loaded_at": self.loaded_at,
+            "reloading": self.reloading,
+            "served": self.served,
+        }
+
+
+class ForecastRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a ForecastService (self.server.service)."""
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.service.health())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            if self.path == "/generate":
+                body = self._read_json()
+                images = [_decode_image(data) for data in body["images"]]
+                text = service.generate(
+                    images, body["prompt"], body.get("max_tokens", MAX_TOKENS)
+                )
+                self._send_json(200, {"text": text})
+            elif self.path == "/answers":
+                body = self._read_json()
+                images = [_decode_image(data) for data in body["images"]]
+                texts = service.answer(
+                    images, body["prompts"], body.get("max_tokens", MAX_TOKENS)
+                )
+                self._send_json(200, {"texts": texts})
+            elif self.path == "/reload":
+                service.load()
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+        except (KeyError, ValueError, OSError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+        except ForecastServiceError as e:
+            self._send_json(503, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Request to %s failed", self.path)
+            self._send_json(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ForecastServer(ThreadingHTTPServer):
+    """Threaded HTTP server that waits for in-flight requests on close."""
+
+    daemon_threads = False
+
+    def __init__(self, address: tuple[str, int], service: ForecastService):
+        super().__init__(address, ForecastRequestHandler)
+        self.service = service
+
+
+class ForecastServiceClient:
+    """
+    Client for a running ForecastService, with WeatherVision's interface.
+    """
+
+    HEALTH_TIMEOUT = 1.0  # seconds; a missing service fails fast
+    GENERATE_TIMEOUT = 600.0  # CPU inference can take minutes
+
+    def __init__(self, url: str | None = None):
+        """
+        Args:
+            url: Service base URL; defaults to $FORECAST_SERVICE_URL or
+                http://DEFAULT_HOST:DEFAULT_PORT.
+        """
+        default = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+        self.url = (url or os.getenv(SERVICE_URL_ENV, default)).rstrip("/")
+
+    def is_available(self) -> bool:
+        """Whether the service is up and has a model loaded."""
+        try:
+            response = requests.get(
+                f"{self.url}/health", timeout=ForecastServiceClient.HEALTH_TIMEOUT
+            )
+            return response.ok and response.json().get("status") == "ok"
+        except (requests.RequestException, ValueError):
+            return False
+
+    def generate_forecast(
+        self,
+        image: str | Image.Image | list[str | Image.Image],
+        prompt: str,
+        max_tokens: int = MAX_TOKENS,
+    ) -> str:
+        """
+        Generate a forecast on the service; see WeatherVision.generate_forecast.
+
+        Images are sent as lossless PNG, so the model sees the same pixels
+        as in-process inference.
+
+        Raises:
+            ForecastServiceError: If the service is unreachable or fails.
+        """
+        images = image if isinstance(image, list) else [image]
+        payload = {
+            "images": [_encode_image(img) for img in images],
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+        }
+        return self._post("/generate", payload)["text"]
+
+    def generate_answers(
+        self,
+        image: str | Image.Image | list[str | Image.Image],
+        prompts: list[str],
+        max_tokens: int = MAX_TOKENS,
+    ) -> list[str]:
+        """
+        Answer several prompts on the service; see WeatherVision.generate_answers.
+
+        Raises:
+            ForecastServiceError: If the service is unreachable or fails.
+        """
+        images = image if isinstance(image, list) else [image]
+        payload = {
+            "images": [_encode_image(img) for img in images],
+            "prompts": prompts,
+            "max_tokens": max_tokens,
+        }
+        return self._post("/answers", payload)["texts"]
+
+    def _post(self, path: str, payload: dict) -> dict:
+        """POST JSON to the service and return the JSON response."""
+        try:
+            response = requests.post(
+                f"{self.url}{path}",
+                json=payload,
+                timeout=ForecastServiceClient.GENERATE_TIMEOUT,
+            )
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ForecastServiceError(f"Forecast service request failed: {e}") from e
+        if not response.ok:
+            raise ForecastServiceError(
+                f"Forecast service returned {response.status_code}: "
+                f"{body.get('error')}"
+            )
+        return body
+
+
+def _load_weather_vision():
+    """Default model factory; imported lazily so clients never load torch."""
+    from src.forecast.generator import WeatherVision
+
+    return WeatherVision()
+
+
+def _encode_image(image: str | Image.Image) -> str:
+    """Base64 PNG of an image path or decoded image."""
+    img = image if isinstance(image, Image.Image) else Image.open(image)
+    return base64.b64encode(encode_image(img, "png-fast")).decode("ascii")
+
+
+def _decode_image(data: str) -> Image.Image:
+    """Inverse of _encode_image()."""
+    img = Image.open(BytesIO(base64.b64decode(data)))
+    img.load()
+    return img
+
+
+def serve(
+    service: ForecastService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> None:
+    """
+    Serve until SIGTERM/SIGINT; SIGHUP reloads the model.
+
+    Args:
+        service: Service with its model already loaded.
+        host: Interface to bind; keep it on loopback, there is no auth.
+        port: TCP port.
+    """
+    server = ForecastServer((host, port), service)
+
+    def stop(signum, frame):
+        logger.info("Received signal %d, shutting down", signum)
+        # shutdown() blocks until serve_forever() returns, so not on this thread
+        threading.Thread(target=server.shutdown).start()
+
+    def reload(signum, frame):
+        threading.Thread(target=service.load).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+
+    logger.info("Forecast service listening on http://%s:%d", host, port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()  # waits for in-flight requests
+        logger.info("Forecast service stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WeatherVision inference service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--prefix",
+        action="append",
+        default=[],
+        help="Static prompt prefix to KV-cache on every model load; repeatable.",
+    )
+    parser.add_argument(
+        "--prefix-cache-dir",
+        type=Path,
+        help="Persist prefix KV caches here, per model revision.",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+    )
+
+    service = ForecastService(
+        prefixes=args.prefix, prefix_cache_dir=args.prefix_cache_dir
+    )
+    service.load()
+    serve(service, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
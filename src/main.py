@@ -34,7 +34,7 @@ def main():
     if args.dryrun:
         logger.info("--dryrun enabled (logic not yet implemented)")
 
-    pipeline = WeatherPipeline(force=args.force)
+    pipeline = WeatherPipeline(force=args.force, refresh_forecast=args.refresh_forecast)
 
     try:
         result = pipeline.run()
@@ -1,15 +1,94 @@
 import logging
 from pathlib import Path
+from typing import TYPE_CHECKING
 from src.chart.downloader import WeatherPDFDownloader
-from src.chart.processors.image_tools import resize_png
-from src.chart.processors.pdf_tools import pdf_to_png
-from src.forecast.generator import WeatherVision
-from src.salesforce.weather import ReportUpsertResult, SFWeatherClient
+from src.chart.processors.image_tools import (
+    IMAGE_ENCODINGS,
+    ChartImage,
+    compare_images,
+    resize_pyramid,
+    tile_image,
+)
+from src.chart.processors.pdf_tools import get_rasterizer, render_pdf_page
+from src.chart.render_cache import RenderCache, RenderKey
+from src.chart.store import RetentionPolicy
+from src.forecast import config as model_config
+from src.forecast.cache import ForecastCache, ForecastKey, pixel_hash
+from src.forecast.service import ForecastServiceClient, ForecastServiceError
+
+# WeatherVision (torch, transformers) and the Salesforce client are imported
+# where they are used: the hourly "chart unchanged" exit must stay fast, and
+# tests/test_import_time.py keeps it that way.
+if TYPE_CHECKING:
+    from src.salesforce.weather import ReportUpsertResult
 
 WEATHER_PDF_URL = "https://www.data.jma.go.jp/yoho/data/wxchart/quick/ASAS_COLOR.pdf"
 DATA_DIR = "./data"
-WEATHER_PNG = "weather.png"
-WEATHER_SMALL_PNG = "weather_small.png"
+WEATHER_IMAGE = "weather"
+WEATHER_MEDIUM_IMAGE = "weather_medium"
+WEATHER_SMALL_IMAGE = "weather_small"
+# The vision model's processor squashes every image to 384x384, so the model
+# image is produced at exactly that size; previews keep the page aspect ratio.
+MODEL_IMAGE_SIZE = (384, 384)
+DASHBOARD_WIDTH = 1024
+PREVIEW_WIDTH = 300
+# Salesforce preview encoding (see IMAGE_ENCODINGS and
+# benchmarks/bench_encodings.py). A 64-color palette PNG is about a quarter
+# of the size of a full-color PNG and stays legible.
+PREVIEW_ENCODING = "png-palette"
+# Derived images: key -> (file name stem, size, encoding). The largest is
+# rendered from the PDF and the others are downscaled from it in one pass.
+# The model image is only encoded for the cache, so it gets the fast encoder;
+# the Salesforce preview is uploaded every run, so it gets the smallest file.
+IMAGE_DERIVATIVES = {
+    "medium": (WEATHER_MEDIUM_IMAGE, (DASHBOARD_WIDTH, None), "png"),
+    "regular": (WEATHER_IMAGE, MODEL_IMAGE_SIZE, "png-fast"),
+    "small": (WEATHER_SMALL_IMAGE, (PREVIEW_WIDTH, None), PREVIEW_ENCODING),
+}
+# Region of the chart the model looks at, as fractions of the page (left,
+# top, right, bottom) with the origin top left; None uses the whole page.
+# Cropping spends the model's fixed 384x384 input on the area of interest
+# instead of downsampling the whole Asia-Pacific chart.
+MODEL_ROI = None
+# Optionally split the region into rows x cols tiles. The tiles go to the
+# model together with a region overview in one batch, each costing the same
+# vision tokens as the overview, so (1, 1) keeps the single-image budget.
+MODEL_TILES = (1, 1)
+MODEL_PROMPT = "Title and description\n<image>"
+# In-process PDFium avoids spawning pdftoppm for every render
+RASTERIZER = "pdfium"
+# Keep rendered derivatives in a render cache so a chart version is only
+# rendered once, also across --force runs; images are passed between stages
+# in memory either way.
+CACHE_RENDERS = True
+RENDER_CACHE_DIR = "renders"
+RENDER_CACHE_RETENTION = RetentionPolicy(
+    keep=96,  # current and previous chart for two days, with headroom
+    max_bytes=128 * 1024 * 1024,
+    max_age=14 * 24 * 3600,
+)
+CHART_RETENTION = RetentionPolicy(
+    keep=48,  # two days of hourly charts
+    max_bytes=256 * 1024 * 1024,
+    max_age=14 * 24 * 3600,
+)
+# A re-issued PDF only counts as a new chart if its rendering differs by more
+# than this fraction of pixels or this many perceptual-hash bits.
+PIXEL_DIFF_THRESHOLD = 0.001
+PHASH_DISTANCE_THRESHOLD = 4
+# Generate forecasts on the inference service (python -m src.forecast.service)
+# when it is running, so the model is not reloaded on every cron run;
+# otherwise the model is loaded in-process.
+USE_FORECAST_SERVICE = True
+# Cache generated forecasts by model input, model and generation settings so
+# --force re-runs and redeploys reuse the forecast instead of re-generating.
+CACHE_FORECASTS = True
+FORECAST_CACHE_DIR = "forecasts"
+FORECAST_CACHE_RETENTION = RetentionPolicy(
+    keep=512,  # forecasts are a few hundred bytes each
+    max_bytes=8 * 1024 * 1024,
+    max_age=30 * 24 * 3600,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +110,16 @@ class WeatherPipeline:
 
     Intended for controlled re-runs, recovery scenarios, and MVP testing.
     Use with caution.
+
+    refresh_forecast (bool):
+        When True, the forecast cache is bypassed and the model runs even
+        for inputs it has seen; the new forecast replaces the cached one.
     """
 
-    def __init__(self, force: bool = False):
+    def __init__(self, force: bool = False, refresh_forecast: bool = False):
         """Initialize the pipeline execution mode."""
         self.force = force
+        self.refresh_forecast = refresh_forecast
 
     def run(self) -> bool:
         """
@@ -52,6 +136,11 @@ class WeatherPipeline:
             logger.info("Pipeline execution skipped (should_process=False)")
             return False
 
+        # An invalid first download leaves no chart to process, even on --force
+        if chart["path"] is None:
+            logger.warning("No valid chart available; pipeline execution skipped")
+            return False
+
         logger.info("Preparing images")
         images = self._prepare_images(chart)
 
@@ -75,16 +164,23 @@ class WeatherPipeline:
         Download the weather chart and return its status.
 
         Returns:
-            dict: A dictionary containing 'updated' (bool), 'hash' (str), and 'path' (Path).
+            dict: A dictionary containing 'updated' (bool), 'hash' (str),
+            'path' (Path), 'previous' (Path of the prior chart, or None) and
+            'previous_hash' (str or None).
         """
-        downloader = WeatherPDFDownloader(Path(DATA_DIR), WEATHER_PDF_URL)
+        downloader = WeatherPDFDownloader(
+            Path(DATA_DIR), WEATHER_PDF_URL, retention=CHART_RETENTION
+        )
 
         updated, pdf_hash, pdf_path = downloader.refresh_pdf()
 
+        previous = downloader.previous_hash
         return {
             "updated": updated,
             "hash": pdf_hash,
             "path": pdf_path,
+            "previous": downloader.store.pdf_path(previous) if previous else None,
+            "previous_hash": previous,
         }
 
     def _should_process(self, chart: dict) -> bool:
@@ -100,6 +196,9 @@ class WeatherPipeline:
         if not chart.get("updated", False):
             return False
 
+        if chart.get("previous") and not self._is_material_change(chart):
+            return False
+
         # future:
         # if self.force:
         #     return True
@@ -110,29 +209,153 @@ class WeatherPipeline:
 
         return True
 
+    def _is_material_change(self, chart: dict) -> bool:
+        """
+        Second-stage change check for PDFs whose bytes differ.
+
+        Renders both charts (the renders are cached, so the new one is reused
+        by _prepare_images) and compares them visually.
+        Metadata-only re-issues score zero and skip inference.
+
+        Args:
+            chart (dict): Output from _download_chart() with a 'previous' path
+        Returns:
+            bool: True if the rendered chart changed materially
+        """
+        current = self._prepare_images(chart)
+        previous = self._prepare_images(
+            {"hash": chart["previous_hash"], "path": chart["previous"]}
+        )
+
+        diff = compare_images(previous["regular"].image, current["regular"].image)
+        material = (
+            diff.pixel_diff > PIXEL_DIFF_THRESHOLD
+            or diff.phash_distance > PHASH_DISTANCE_THRESHOLD
+        )
+
+        logger.info(
+            "Render change check: pixel_diff=%.5f phash_distance=%d material=%s",
+            diff.pixel_diff,
+            diff.phash_distance,
+            material,
+        )
+        return material
+
     def _prepare_images(self, chart: dict) -> dict:
         """
-        Prepare PNG images from the downloaded PDF for further processing.
+        Render the downloaded PDF into in-memory images for further processing.
+
+        With CACHE_RENDERS the encoded images are kept in the render cache,
+        keyed by the PDF hash and every render parameter, so a chart version
+        that was rendered before is returned without touching the PDF.
 
         Args:
             chart (dict): Output from _download_chart()
         Returns:
-            dict: Paths to prepared images
+            dict: ChartImage objects keyed like IMAGE_DERIVATIVES ('regular'
+            for the model, 'small' for Salesforce, 'medium' for dashboards),
+            plus 'tile_NN' model tiles when MODEL_TILES is set
         """
-        # Convert to PNG for AI and Salesforce
-        regular_png_path = pdf_to_png(chart["path"], Path(DATA_DIR) / WEATHER_PNG)
-
-        # Create resized 300px PNG for Salesforce (lightweight)
-        small_png_path = resize_png(
-            regular_png_path, Path(DATA_DIR) / WEATHER_SMALL_PNG, width=300
+        render_key = self._render_key(chart)
+        cache = None
+        if CACHE_RENDERS:
+            cache = RenderCache(
+                Path(DATA_DIR) / RENDER_CACHE_DIR, RENDER_CACHE_RETENTION
+            )
+            images = cache.get(render_key)
+            if images is not None:
+                logger.info("Reusing cached images for chart %s", chart["hash"])
+                return images
+
+        # Render the first page once, at the largest derivative's size; a
+        # None side keeps the aspect, and (None, None) is the full page
+        largest = max(
+            (size for _, size, _ in IMAGE_DERIVATIVES.values()),
+            key=lambda size: max((side for side in size if side), default=float("inf")),
+        )
+        page = render_pdf_page(
+            chart["path"], page=render_key.page, size=largest, backend=RASTERIZER
         )
 
-        images = {
-            "regular": regular_png_path,
-            "small": small_png_path,
-        }
+        # Model input, dashboard and 300px Salesforce previews in one pass
+        cropped = MODEL_ROI is not None or MODEL_TILES != (1, 1)
+        derived = resize_pyramid(
+            page,
+            {
+                key: size
+                for key, (_, size, _) in IMAGE_DERIVATIVES.items()
+                if not (cropped and key == "regular")
+            },
+        )
+        if cropped:
+            derived.update(self._render_model_inputs(chart["path"], render_key.page))
+
+        images = {}
+        for key, (stem, _, encoding) in IMAGE_DERIVATIVES.items():
+            file_name = stem + IMAGE_ENCODINGS[encoding].extension
+            images[key] = ChartImage(file_name, derived[key], encoding=encoding)
+        # Tiles are stored like the model image they belong to
+        stem, _, encoding = IMAGE_DERIVATIVES["regular"]
+        for key in sorted(k for k in derived if k.startswith("tile_")):
+            file_name = f"{stem}_{key}{IMAGE_ENCODINGS[encoding].extension}"
+            images[key] = ChartImage(file_name, derived[key], encoding=encoding)
+        if cache is not None:
+            cache.put(render_key, images)
         return images
 
+    def _render_model_inputs(self, pdf_path: Path, page: int) -> dict:
+        """
+        Render the model's region of interest, optionally as tiles.
+
+        The region is rendered once at the size of the whole tile grid, so
+        every tile has full model resolution; the overview is downscaled
+        from the same frame.
+
+        Args:
+            pdf_path (Path): Chart PDF
+            page (int): Page to render
+        Returns:
+            dict: 'regular' overview image plus 'tile_NN' images, row by row
+        """
+        rows, cols = MODEL_TILES
+        tile_w, tile_h = MODEL_IMAGE_SIZE
+        region = render_pdf_page(
+            pdf_path,
+            page=page,
+            size=(cols * tile_w, rows * tile_h),
+            crop=MODEL_ROI,
+            backend=RASTERIZER,
+        )
+        if (rows, cols) == (1, 1):
+            return {"regular": region}
+
+        inputs = resize_pyramid(region, {"regular": MODEL_IMAGE_SIZE})
+        for index, tile in enumerate(tile_image(region, rows, cols)):
+            inputs[f"tile_{index:02d}"] = tile
+        return inputs
+
+    def _render_key(self, chart: dict) -> RenderKey:
+        """
+        Cache key covering everything that affects the rendered images.
+
+        Args:
+            chart (dict): Output from _download_chart()
+        Returns:
+            RenderKey: Key for the render cache
+        """
+        derivatives = tuple(
+            (key, stem, tuple(size), encoding)
+            for key, (stem, size, encoding) in sorted(IMAGE_DERIVATIVES.items())
+        )
+        return RenderKey(
+            pdf_hash=chart["hash"],
+            page=1,
+            dpi=None,
+            derivatives=derivatives,
+            backend=get_rasterizer(RASTERIZER).version,
+            model_input=(MODEL_ROI, MODEL_TILES),
+        )
+
     def _generate_forecast(self, images):
         """
         Generate AI-based weather forecast from the images.
@@ -142,10 +365,31 @@ class WeatherPipeline:
         Returns:
             dict: Generated forecast with 'title' and 'content'
         """
-        wv = WeatherVision()
-        ai_forecast = wv.generate_forecast(
-            images["regular"], "Title and description\n<image>"
-        )
+        # The region overview, followed by its tiles when tiling is enabled
+        tiles = [images[key] for key in sorted(images) if key.startswith("tile_")]
+        model_images = [images["regular"].image] + [tile.image for tile in tiles]
+        prompt = MODEL_PROMPT.replace("<image>", "<image>" * len(model_images))
+
+        cache = key = ai_forecast = None
+        if CACHE_FORECASTS:
+            cache = ForecastCache(
+                Path(DATA_DIR) / FORECAST_CACHE_DIR, FORECAST_CACHE_RETENTION
+            )
+            key = self._forecast_key(model_images, prompt)
+            if not self.refresh_forecast:
+                ai_forecast = cache.get(key)
+                logger.info(
+                    "Forecast cache %s (%s)",
+                    "miss" if ai_forecast is None else "hit",
+                    cache.metrics(),
+                )
+
+        if ai_forecast is None:
+            ai_forecast = self._run_model(
+                model_images[0] if len(model_images) == 1 else model_images, prompt
+            )
+            if cache is not None:
+                cache.put(key, ai_forecast)
 
         lines = ai_forecast.split("\n", 1)  # Split into at most 2 parts
         title = lines[0]
@@ -157,9 +401,48 @@ class WeatherPipeline:
         }
         return forecast
 
+    @staticmethod
+    def _forecast_key(model_images: list, prompt: str) -> ForecastKey:
+        """Cache key of a forecast for the given model input."""
+        return ForecastKey(
+            image_hashes=tuple(pixel_hash(img) for img in model_images),
+            prompt=prompt,
+            model=(
+                f"{model_config.MODEL_NAME}@{model_config.MODEL_REVISION}"
+                f":{model_config.DTYPE}:{model_config.QUANTIZATION or 'none'}"
+            ),
+            max_tokens=model_config.MAX_TOKENS,
+            generation=tuple(sorted(model_config.GENERATION_PARAMS.items())),
+        )
+
+    def _run_model(self, image, prompt: str) -> str:
+        """
+        Run WeatherVision on the inference service, or in-process if it is
+        not running or fails.
+        """
+        if USE_FORECAST_SERVICE:
+            client = ForecastServiceClient()
+            if client.is_available():
+                try:
+                    return client.generate_forecast(
+                        image, prompt, max_tokens=model_config.MAX_TOKENS
+                    )
+                except ForecastServiceError as e:
+                    logger.warning(
+                        "Forecast service failed, running the model in-process: %s",
+                        e,
+                    )
+            else:
+                logger.info("Forecast service not available, loading the model")
+
+        from src.forecast.generator import WeatherVision
+
+        wv = WeatherVision()
+        return wv.generate_forecast(image, prompt, max_tokens=model_config.MAX_TOKENS)
+
     def _publish_salesforce(
         self, chart: dict, images: dict, forecast: dict
-    ) -> ReportUpsertResult:
+    ) -> "ReportUpsertResult":
         """
         Publish the forecast and images to Salesforce.
 
@@ -169,9 +452,12 @@ class WeatherPipeline:
         Returns:
             str: Salesforce record ID
         """
+        from src.salesforce.weather import SFWeatherClient
+
         sf = SFWeatherClient()
         report = sf.upsert_report(chart["hash"], forecast["content"])
 
-        sf.ensure_preview_image(report.record_id, images["small"])
+        small = images["small"]
+        sf.ensure_preview_image(report.record_id, small.name, data=small.encode())
 
         return report
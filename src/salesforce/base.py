@@ -15,13 +15,13 @@ import requests
 from simple_salesforce import Salesforce
 from dotenv import load_dotenv
 
-load_dotenv()  # Load environment variables from .env file
-
 
 class SalesforceBaseClient:
     """Base Salesforce client using JWT Bearer OAuth2 flow."""
 
     def __init__(self):
+        load_dotenv()  # Load environment variables from .env file
+
         self.client_id = os.getenv("SF_CLIENT_ID")
         self.username = os.getenv("SF_USERNAME")
         self.audience = os.getenv("SF_AUDIENCE", "https://login.salesforce.com")
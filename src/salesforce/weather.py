@@ -46,14 +46,18 @@ class SFWeatherClient(SalesforceBaseClient):
             created=result["created"],
         )
 
-    def ensure_preview_image(self, record_id: str, file_path: str) -> str | None:
+    def ensure_preview_image(
+        self, record_id: str, file_path: str, data: bytes | None = None
+    ) -> str | None:
         """
         Ensures that a ContentVersion with the given file is linked to the record.
         If such a ContentVersion already exists (by Title), does nothing.
 
         Args:
             record_id: The Id of the Weather_Report__c record.
-            file_path: Path to the PNG file to upload.
+            file_path: Path to the PNG file to upload. When data is given this
+                only names the file and is never read.
+            data: Encoded PNG bytes already in memory.
 
         Returns:
             The new ContentVersion Id if uploaded, else None.
@@ -90,8 +94,11 @@ class SFWeatherClient(SalesforceBaseClient):
                     return None
 
         # 3. File not found -> upload a new ContentVersion
-        with open(file_path, "rb") as f:
-            raw = f.read()
+        if data is not None:
+            raw = data
+        else:
+            with open(file_path, "rb") as f:
+                raw = f.read()
 
         b64_data = base64.b64encode(raw).decode()
 
@@ -5,3 +5,9 @@ def test_cli_run_flag():
     """Test that the --run flag is parsed correctly."""
     args = parse_args(["--run"])
     assert args.run is True
+
+
+def test_cli_refresh_forecast_flag():
+    """The forecast cache is used unless --refresh-forecast is given."""
+    assert parse_args(["--run"]).refresh_forecast is False
+    assert parse_args(["--run", "--refresh-forecast"]).refresh_forecast is True
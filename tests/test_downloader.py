@@ -1,102 +1,594 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import wait as real_wait
+from datetime import timedelta
 import pytest
+import requests
 from pathlib import Path
 from unittest.mock import patch, MagicMock
-from src.chart.downloader import WeatherPDFDownloader
+from src.chart.downloader import MultiChartDownloader, WeatherPDFDownloader
+from src.chart.store import RetentionPolicy
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, content=b"", status_code=200, headers=None, url="dummy"):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = url
+        self.elapsed = timedelta(milliseconds=10)
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class BrokenResponse(FakeResponse):
+    """Response whose stream dies after the first `cut` bytes."""
+
+    def __init__(self, content, cut, headers=None):
+        super().__init__(content, headers=headers)
+        self.cut = cut
+
+    def iter_content(self, chunk_size):
+        yield self.content[: self.cut]
+        raise requests.ConnectionError("connection reset")
 
 
 class DummyDL(WeatherPDFDownloader):
     """Extending a class and override methods for testing."""
 
-    def __init__(self, data_path, contents):
+    def __init__(self, data_path, contents, status_code=200, headers=None):
         super().__init__(data_path, weather_pdf_url="dummy")
         self.fake_contents = contents
+        self.status_code = status_code
+        self.headers = headers or {}
         self.calls = 0
 
-    def _download(self):
-        """Simulate downloading by writing predefined content."""
+    def _request(self):
+        """Simulate the HTTP request by returning predefined content."""
         self.calls += 1
-        with self.current_pdf_path.open("wb") as f:
-            f.write(self.fake_contents[self.calls - 1])
+        contents = self.fake_contents
+        content = contents[self.calls - 1] if self.calls <= len(contents) else b""
+        return FakeResponse(content, self.status_code, self.headers)
 
 
-def test_case_A(tmp_path):
-    """Case A: neither exists"""
-    # tmp_path is a pytest fixture providing a temporary directory
-    dl = DummyDL(tmp_path, [b"PDF-A"])
+def make_pdf(body: bytes) -> bytes:
+    """Smallest byte string that passes the PDF completeness checks."""
+    return b"%PDF-1.4\n1 0 obj << /Type /Page >> endobj\n" + body + b"\n%%EOF\n"
 
-    changed, pdf_hash, pdf_path = dl.refresh_pdf()
 
-    assert changed is True
-    assert dl._exists(dl.current_pdf_path)
-    assert not dl._exists(dl.last_pdf_path)
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
 
 
-def test_case_B(tmp_path):
-    """Case B: only current exists"""
+def test_first_download(tmp_path):
+    """Empty store: the download is filed under its hash."""
     # tmp_path is a pytest fixture providing a temporary directory
-    current_pdf_path = tmp_path / WeatherPDFDownloader.CURRENT_PDF
-    current_pdf_path.write_bytes(b"OLD")
+    dl = DummyDL(tmp_path, [make_pdf(b"PDF-A")])
 
-    dl = DummyDL(tmp_path, [b"NEW"])
     changed, pdf_hash, pdf_path = dl.refresh_pdf()
 
-    # After rename: last.pdf=OLD, current.pdf=NEW
-    assert (tmp_path / WeatherPDFDownloader.LAST_PDF).read_bytes() == b"OLD"
-    assert (tmp_path / WeatherPDFDownloader.CURRENT_PDF).read_bytes() == b"NEW"
     assert changed is True
+    assert pdf_hash == sha(make_pdf(b"PDF-A"))
+    assert pdf_path == dl.store.pdf_path(pdf_hash)
+    assert pdf_path.read_bytes() == make_pdf(b"PDF-A")
+    assert not dl.part_path.exists()
 
 
-def test_case_C_no_change(tmp_path):
-    """Case C: only last exists. New download is the same as last."""
-    last = tmp_path / WeatherPDFDownloader.LAST_PDF
-    last.write_bytes(b"SAME")
+def test_no_change(tmp_path):
+    """Same content as the newest chart: reported unchanged."""
+    dl = DummyDL(tmp_path, [make_pdf(b"SAME"), make_pdf(b"SAME")])
+    dl.refresh_pdf()
 
-    dl = DummyDL(tmp_path, [b"SAME"])
     changed, pdf_hash, pdf_path = dl.refresh_pdf()
 
     assert changed is False
-    assert (tmp_path / WeatherPDFDownloader.LAST_PDF).read_bytes() == b"SAME"
-    assert not (tmp_path / WeatherPDFDownloader.CURRENT_PDF).exists()
+    assert pdf_hash == sha(make_pdf(b"SAME"))
+    assert pdf_path.read_bytes() == make_pdf(b"SAME")
+    assert not dl.part_path.exists()
 
 
-def test_case_C_change(tmp_path):
-    """Case C: only last exists. New download is different from last."""
-    last = tmp_path / WeatherPDFDownloader.LAST_PDF
-    last.write_bytes(b"OLD")
+def test_change(tmp_path):
+    """New content is stored next to the previous version."""
+    dl = DummyDL(tmp_path, [make_pdf(b"OLD"), make_pdf(b"NEW")])
+    _, old_hash, old_path = dl.refresh_pdf()
 
-    dl = DummyDL(tmp_path, [b"NEW"])
     changed, pdf_hash, pdf_path = dl.refresh_pdf()
 
     assert changed is True
-    assert (tmp_path / WeatherPDFDownloader.LAST_PDF).read_bytes() == b"OLD"
-    assert (tmp_path / WeatherPDFDownloader.CURRENT_PDF).read_bytes() == b"NEW"
+    assert pdf_hash == sha(make_pdf(b"NEW"))
+    assert pdf_path.read_bytes() == make_pdf(b"NEW")
+    assert old_path.read_bytes() == make_pdf(b"OLD")
 
 
-def test_case_D_no_change(tmp_path):
-    """Case D: both exists. New download is the same as current."""
-    last = tmp_path / WeatherPDFDownloader.LAST_PDF
-    last.write_bytes(b"LAST")
-    current = tmp_path / WeatherPDFDownloader.CURRENT_PDF
-    current.write_bytes(b"CURRENT")
+def test_previous_hash_recorded(tmp_path):
+    """The newest chart before the refresh is exposed for change detection."""
+    dl = DummyDL(tmp_path, [make_pdf(b"OLD"), make_pdf(b"NEW")])
+    dl.refresh_pdf()
+    assert dl.previous_hash is None
+
+    dl.refresh_pdf()
+    assert dl.previous_hash == sha(make_pdf(b"OLD"))
+
+
+def test_flip_back_is_cache_hit(tmp_path):
+    """A chart returning to a previously seen version is not reprocessed."""
+    dl = DummyDL(tmp_path, [make_pdf(b"A"), make_pdf(b"B"), make_pdf(b"A")])
+    dl.refresh_pdf()
+    dl.refresh_pdf()
 
-    dl = DummyDL(tmp_path, [b"CURRENT"])
     changed, pdf_hash, pdf_path = dl.refresh_pdf()
 
     assert changed is False
-    assert (tmp_path / WeatherPDFDownloader.LAST_PDF).read_bytes() == b"CURRENT"
-    assert not (tmp_path / WeatherPDFDownloader.CURRENT_PDF).exists()
+    assert pdf_hash == sha(make_pdf(b"A"))
+    assert pdf_path == dl.store.pdf_path(sha(make_pdf(b"A")))
+    assert dl._load_validators()["sha256"] == sha(make_pdf(b"A"))
+
 
+def test_retention_applied_after_download(tmp_path):
+    """Old versions are evicted but the current one always survives."""
+    dl = DummyDL(tmp_path, [make_pdf(b"A"), make_pdf(b"B"), make_pdf(b"C")])
+    dl.store.policy = RetentionPolicy(keep=1, max_bytes=None, max_age=None)
 
-def test_case_D_change(tmp_path):
-    """Case D: both exists. New download is different from current."""
-    last = tmp_path / WeatherPDFDownloader.LAST_PDF
-    last.write_bytes(b"LAST")
-    current = tmp_path / WeatherPDFDownloader.CURRENT_PDF
-    current.write_bytes(b"CURRENT")
+    for _ in range(3):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert [e.name for e in dl.store.entries()] == [sha(make_pdf(b"C"))]
+    assert pdf_path.read_bytes() == make_pdf(b"C")
+
+
+def test_truncated_download_is_quarantined(tmp_path):
+    """A body shorter than Content-Length is set aside and reported unchanged."""
+    dl = DummyDL(
+        tmp_path,
+        [make_pdf(b"OLD"), make_pdf(b"NEW")],
+        headers={"Content-Length": str(len(make_pdf(b"OLD")))},
+    )
+    _, old_hash, old_path = dl.refresh_pdf()
+    dl.headers = {"Content-Length": "1000", "ETag": '"new"'}
+
+    changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert changed is False
+    assert pdf_hash == old_hash
+    assert pdf_path == old_path
+    assert [e.name for e in dl.store.entries()] == [old_hash]
+    assert not dl.part_path.exists()
+    assert len(list((tmp_path / "quarantine").iterdir())) == 1
+    # Validators of the bad response are not kept, so no 304 can pin it
+    assert dl._load_validators()["etag"] is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"<!DOCTYPE html><html>503 Service Unavailable</html>",
+        make_pdf(b"x" * 10)[:-8],  # cut before %%EOF
+        b"%PDF-1.4\n<< /Type /Pages /Count 0 >>\n%%EOF\n",
+    ],
+)
+def test_invalid_first_download_is_quarantined(tmp_path, content):
+    dl = DummyDL(tmp_path, [content])
 
-    dl = DummyDL(tmp_path, [b"NEWER"])
     changed, pdf_hash, pdf_path = dl.refresh_pdf()
 
+    assert (changed, pdf_hash, pdf_path) == (False, None, None)
+    assert dl.store.entries() == []
+    assert len(list((tmp_path / "quarantine").iterdir())) == 1
+
+
+def test_quarantine_keeps_newest(tmp_path):
+    dl = WeatherPDFDownloader(tmp_path, "dummy")
+
+    with patch.object(WeatherPDFDownloader, "QUARANTINE_KEEP", 2):
+        for i in range(3):
+            dl.part_path.parent.mkdir(parents=True, exist_ok=True)
+            dl.part_path.write_bytes(b"bad")
+            dl._quarantine(f"{i:012d}", "test")
+
+    kept = sorted(p.name for p in (tmp_path / "quarantine").iterdir())
+    assert len(kept) == 2
+    assert kept[-1].endswith("000000000002.pdf")
+
+
+def test_stale_part_file_is_overwritten(tmp_path):
+    """A .part file left by a killed run never leaks into the result."""
+    dl = DummyDL(tmp_path, [make_pdf(b"FRESH")])
+    dl.part_path.parent.mkdir(parents=True)
+    dl.part_path.write_bytes(b"TRUNCATED-GARBAGE")
+
+    changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert changed is True
+    assert pdf_path.read_bytes() == make_pdf(b"FRESH")
+    assert not dl.part_path.exists()
+
+
+def test_validators_saved(tmp_path):
+    """ETag/Last-Modified/Content-Length are persisted with the new hash."""
+    headers = {
+        "ETag": '"abc"',
+        "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT",
+        "Content-Length": str(len(make_pdf(b"PDF-A"))),
+    }
+    dl = DummyDL(tmp_path, [make_pdf(b"PDF-A")], headers=headers)
+    changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    validators = dl._load_validators()
+    assert validators["etag"] == '"abc"'
+    assert validators["last_modified"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert validators["content_length"] == headers["Content-Length"]
+    assert validators["sha256"] == pdf_hash
+
+
+def test_not_modified_short_circuits(tmp_path):
+    """A 304 reports no change without downloading or storing anything."""
+    dl = DummyDL(tmp_path, [make_pdf(b"CURRENT")])
+    _, current_hash, current_path = dl.refresh_pdf()
+
+    dl.status_code = 304
+    with patch.object(dl, "_download") as mock_download:
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    mock_download.assert_not_called()
+    assert changed is False
+    assert pdf_hash == current_hash
+    assert pdf_path == current_path
+    assert current_path.read_bytes() == make_pdf(b"CURRENT")
+
+
+def test_conditional_headers_sent(tmp_path):
+    """Saved validators are sent as If-None-Match / If-Modified-Since."""
+    dl = WeatherPDFDownloader(tmp_path, "https://example.com/chart.pdf")
+    dl.store.entry_path("hash-last").mkdir(parents=True)
+    dl.store.pdf_path("hash-last").write_bytes(b"LAST")
+    dl._save_validators(
+        {"ETag": '"abc"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"},
+        "hash-last",
+    )
+
+    with patch.object(
+        dl.session, "get", return_value=FakeResponse(status_code=304)
+    ) as mock_get:
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    mock_get.assert_called_once_with(
+        "https://example.com/chart.pdf",
+        headers={
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT",
+        },
+        stream=True,
+        timeout=(5.0, 30.0),
+    )
+    assert changed is False
+    assert pdf_path == dl.store.pdf_path("hash-last")
+
+
+def test_no_conditional_headers_without_pdf(tmp_path):
+    """Validators are ignored when the PDF they describe is gone."""
+    dl = WeatherPDFDownloader(tmp_path, "dummy")
+    dl._save_validators({"ETag": '"abc"'}, "hash-gone")
+
+    assert dl._conditional_headers() == {}
+
+
+def test_download_hashes_while_streaming(tmp_path):
+    """The hash returned by _download matches the file written in chunks."""
+    content = make_pdf(b"x" * (WeatherPDFDownloader.CHUNK_SIZE * 2 + 7))
+    dl = WeatherPDFDownloader(tmp_path, "dummy")
+    dl.part_path.parent.mkdir(parents=True)
+
+    pdf_hash, inspector = dl._download(FakeResponse(content))
+
+    assert dl.part_path.read_bytes() == content
+    assert pdf_hash == WeatherPDFDownloader.hash_pdf(dl.part_path)
+    assert inspector.size == len(content)
+    assert inspector.page_count == 1
+
+
+def test_stored_pdf_not_rehashed(tmp_path):
+    """The previous hash comes from the sidecar, not from re-reading the PDF."""
+    dl = DummyDL(tmp_path, [make_pdf(b"CURRENT"), make_pdf(b"CURRENT")])
+    dl.refresh_pdf()
+
+    with patch.object(WeatherPDFDownloader, "hash_pdf") as mock_hash:
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    mock_hash.assert_not_called()
+    assert changed is False
+
+
+def test_multi_chart_refresh_all(tmp_path):
+    """Every chart gets its own store and a per-chart result."""
+    charts = {
+        "ASAS": "https://example.com/ASAS.pdf",
+        "FSAS24": "https://example.com/FSAS24.pdf",
+    }
+    multi = MultiChartDownloader(tmp_path, charts)
+
+    def fake_get(url, **kwargs):
+        return FakeResponse(make_pdf(url.encode()))
+
+    with patch.object(multi.session, "get", side_effect=fake_get):
+        results = multi.refresh_all()
+
+    assert set(results) == {"ASAS", "FSAS24"}
+    for name, (updated, pdf_hash, pdf_path) in results.items():
+        assert updated is True
+        assert pdf_path.read_bytes() == make_pdf(charts[name].encode())
+        assert pdf_path.is_relative_to(tmp_path / name)
+
+
+def test_multi_chart_shares_session(tmp_path):
+    multi = MultiChartDownloader(tmp_path, {"A": "https://a/1", "B": "https://b/2"})
+
+    assert all(dl.session is multi.session for dl in multi.downloaders.values())
+
+
+def test_multi_chart_pools_and_limits_mirror_hosts(tmp_path):
+    """Mirror hosts count for the pool size and the per-host limit."""
+    charts = {"A": "https://a/1.pdf", "B": "https://b/2.pdf"}
+    mirrors = {"A": ["https://m/1.pdf"], "B": ["https://m/2.pdf"]}
+    multi = MultiChartDownloader(tmp_path, charts, max_per_host=1, mirrors=mirrors)
+
+    assert multi.hosts == {"a", "b", "m"}
+    assert multi.session.adapters["https://"]._pool_connections == 3
+    assert multi.downloaders["A"].urls == ["https://a/1.pdf", "https://m/1.pdf"]
+
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def fake_refresh():
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return False, None, None
+
+    with patch.object(WeatherPDFDownloader, "refresh_pdf", side_effect=fake_refresh):
+        multi.refresh_all()
+
+    assert peak == 1  # both charts may hedge to host m
+
+
+def test_multi_chart_limits_per_host_and_isolates_errors(tmp_path):
+    """Requests to one host never exceed max_per_host; failures are isolated."""
+    charts = {f"C{i}": f"https://example.com/{i}.pdf" for i in range(6)}
+    charts["BAD"] = "https://example.com/bad.pdf"
+    multi = MultiChartDownloader(tmp_path, charts, max_per_host=2)
+
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def fake_get(url, **kwargs):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        if url.endswith("bad.pdf"):
+            raise ConnectionError("boom")
+        return FakeResponse(make_pdf(url.encode()))
+
+    with patch.object(multi.session, "get", side_effect=fake_get):
+        results = multi.refresh_all()
+
+    assert peak == 2
+    assert set(results) == {f"C{i}" for i in range(6)}
+    assert isinstance(multi.errors["BAD"], ConnectionError)
+
+
+def test_request_retries_with_backoff(tmp_path):
+    dl = WeatherPDFDownloader(tmp_path, "https://example.com/a.pdf", retries=2)
+    responses = [requests.ConnectionError("down"), FakeResponse(make_pdf(b"PDF"))]
+
+    with (
+        patch.object(dl.session, "get", side_effect=responses),
+        patch.object(dl, "_sleep_backoff") as mock_sleep,
+    ):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    mock_sleep.assert_called_once_with(0)
     assert changed is True
-    assert (tmp_path / WeatherPDFDownloader.LAST_PDF).read_bytes() == b"CURRENT"
-    assert (tmp_path / WeatherPDFDownloader.CURRENT_PDF).read_bytes() == b"NEWER"
+    assert pdf_path.read_bytes() == make_pdf(b"PDF")
+
+
+def test_request_gives_up_after_retries(tmp_path):
+    dl = WeatherPDFDownloader(tmp_path, "https://example.com/a.pdf", retries=1)
+
+    with (
+        patch.object(dl.session, "get", side_effect=requests.ConnectionError("down")),
+        patch.object(dl, "_sleep_backoff"),
+    ):
+        with pytest.raises(requests.ConnectionError):
+            dl.refresh_pdf()
+
+
+def test_mirror_used_when_primary_fails(tmp_path):
+    dl = WeatherPDFDownloader(
+        tmp_path, "https://primary/a.pdf", mirrors=["https://mirror/a.pdf"]
+    )
+
+    def fake_get(url, **kwargs):
+        if "primary" in url:
+            raise requests.ConnectionError("down")
+        return FakeResponse(make_pdf(b"FROM-MIRROR"), url=url)
+
+    with patch.object(dl.session, "get", side_effect=fake_get):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert pdf_path.read_bytes() == make_pdf(b"FROM-MIRROR")
+
+
+def test_latency_recorded_only_for_hedged_downloads(tmp_path):
+    single = WeatherPDFDownloader(tmp_path / "single", "https://primary/a.pdf")
+    mirrored = WeatherPDFDownloader(
+        tmp_path / "mirrored", "https://primary/a.pdf", mirrors=["https://m/a.pdf"]
+    )
+    ok = FakeResponse(make_pdf(b"A"))
+    not_modified = FakeResponse(status_code=304)
+
+    with patch.object(single.session, "get", return_value=ok):
+        single._request()
+    with patch.object(mirrored.session, "get", return_value=not_modified):
+        mirrored._request()
+    assert not single.latency_path.exists()
+    assert not mirrored.latency_path.exists()
+
+    with patch.object(mirrored.session, "get", return_value=ok):
+        mirrored._request()
+    assert mirrored.latency_path.exists()
+
+
+def test_slow_primary_is_hedged_to_mirror(tmp_path):
+    dl = WeatherPDFDownloader(
+        tmp_path, "https://primary/a.pdf", mirrors=["https://mirror/a.pdf"]
+    )
+    slow = FakeResponse(make_pdf(b"FROM-PRIMARY"), url="https://primary/a.pdf")
+
+    def fake_get(url, **kwargs):
+        if "primary" in url:
+            time.sleep(0.3)
+            return slow
+        return FakeResponse(make_pdf(b"FROM-MIRROR"), url=url)
+
+    with (
+        patch.object(dl.session, "get", side_effect=fake_get),
+        patch.object(dl, "_hedge_delay", return_value=0.01),
+    ):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert pdf_path.read_bytes() == make_pdf(b"FROM-MIRROR")
+    time.sleep(0.5)
+    assert slow.closed  # loser is released once it finally answers
+
+
+def test_hedged_responses_arriving_together_are_all_closed(tmp_path):
+    dl = WeatherPDFDownloader(
+        tmp_path, "https://primary/a.pdf", mirrors=["https://mirror/a.pdf"]
+    )
+    responses = {
+        name: FakeResponse(make_pdf(name.encode()), url=f"https://{name}/a.pdf")
+        for name in ("primary", "mirror")
+    }
+    waits = []
+
+    def fake_wait(futures, timeout=None, return_when=None):
+        waits.append(timeout)
+        if len(waits) == 1:
+            return set(), set(futures)  # the primary is slow: hedge
+        return real_wait(futures)  # both answer before the next check
+
+    with (
+        patch.object(
+            dl.session,
+            "get",
+            side_effect=lambda url, **kw: responses[url.split("/")[2]],
+        ),
+        patch("src.chart.downloader.wait", side_effect=fake_wait),
+    ):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    winner = next(r for r in responses.values() if pdf_path.read_bytes() == r.content)
+    loser = next(r for r in responses.values() if r is not winner)
+    assert loser.closed
+
+
+def test_fast_error_from_primary_does_not_beat_mirror(tmp_path):
+    dl = WeatherPDFDownloader(
+        tmp_path, "https://primary/a.pdf", mirrors=["https://mirror/a.pdf"]
+    )
+    error_page = FakeResponse(b"<html>busy</html>", status_code=429)
+
+    def fake_get(url, **kwargs):
+        if "primary" in url:
+            return error_page
+        time.sleep(0.05)
+        return FakeResponse(make_pdf(b"FROM-MIRROR"), url=url)
+
+    with patch.object(dl.session, "get", side_effect=fake_get):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert pdf_path.read_bytes() == make_pdf(b"FROM-MIRROR")
+    assert error_page.closed
+
+
+def test_hedge_delay_learns_p95(tmp_path):
+    dl = WeatherPDFDownloader(tmp_path, "dummy")
+    assert dl._hedge_delay() == WeatherPDFDownloader.HEDGE_DELAY
+
+    for i in range(1, 21):
+        dl._record_latency(i / 10)
+
+    assert dl._hedge_delay() == pytest.approx(1.9)
+
+
+def test_broken_stream_resumes_with_range(tmp_path):
+    content = make_pdf(b"x" * 100)
+    headers = {"ETag": '"v1"', "Content-Length": str(len(content))}
+    dl = WeatherPDFDownloader(tmp_path, "https://example.com/a.pdf")
+    first = BrokenResponse(content, cut=40, headers=headers)
+    rest = FakeResponse(content[40:], status_code=206)
+
+    with (
+        patch.object(dl.session, "get", side_effect=[first, rest]) as mock_get,
+        patch.object(dl, "_sleep_backoff"),
+    ):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    resume_headers = mock_get.call_args_list[1].kwargs["headers"]
+    assert resume_headers == {"Range": "bytes=40-", "If-Range": '"v1"'}
+    assert pdf_path.read_bytes() == content
+    assert pdf_hash == sha(content)
+
+
+def test_resume_restarts_when_range_ignored(tmp_path):
+    content = make_pdf(b"y" * 100)
+    dl = WeatherPDFDownloader(tmp_path, "https://example.com/a.pdf")
+    first = BrokenResponse(content, cut=40)
+    full = FakeResponse(content, status_code=200)
+
+    with (
+        patch.object(dl.session, "get", side_effect=[first, full]),
+        patch.object(dl, "_sleep_backoff"),
+    ):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert pdf_path.read_bytes() == content
+    assert pdf_hash == sha(content)
+
+
+def test_failed_resume_is_retried(tmp_path):
+    content = make_pdf(b"z" * 100)
+    dl = WeatherPDFDownloader(tmp_path, "https://example.com/a.pdf")
+    first = BrokenResponse(content, cut=40)
+    rest = FakeResponse(content[40:], status_code=206)
+    reset = requests.ConnectionError("connection reset")
+
+    with (
+        patch.object(dl.session, "get", side_effect=[first, reset, rest]) as mock_get,
+        patch.object(dl, "_sleep_backoff"),
+    ):
+        changed, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert mock_get.call_args_list[2].kwargs["headers"]["Range"] == "bytes=40-"
+    assert pdf_path.read_bytes() == content
@@ -0,0 +1,48 @@
+from io import BytesIO
+
+from PIL import Image
+
+from src.forecast.cache import ForecastCache, ForecastKey, pixel_hash
+
+
+def make_key(image_hash="abc"):
+    return ForecastKey(
+        image_hashes=(image_hash,),
+        prompt="Title and description\n<image>",
+        model="llava-hf/llava-interleave-qwen-0.5b-hf@main",
+        max_tokens=150,
+        generation=(("do_sample", False),),
+    )
+
+
+def test_put_then_get_round_trip(tmp_path):
+    cache = ForecastCache(tmp_path)
+
+    assert cache.get(make_key()) is None
+    cache.put(make_key(), "Sunny\nClear skies")
+
+    assert cache.get(make_key()) == "Sunny\nClear skies"
+    assert cache.metrics() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert not list(tmp_path.glob("**/*.part"))
+
+
+def test_metrics_persist_across_instances(tmp_path):
+    ForecastCache(tmp_path).get(make_key())
+    ForecastCache(tmp_path).get(make_key())
+
+    assert ForecastCache(tmp_path).metrics()["misses"] == 2
+
+
+def test_pixel_hash_ignores_encoding():
+    img = Image.new("RGB", (40, 30), "red")
+    buffers = []
+    for level in (1, 9):
+        buffer = BytesIO()
+        img.save(buffer, format="PNG", compress_level=level)
+        buffers.append(buffer.getvalue())
+
+    assert buffers[0] != buffers[1]
+    decoded = [Image.open(BytesIO(data)) for data in buffers]
+    assert pixel_hash(decoded[0]) == pixel_hash(decoded[1]) == pixel_hash(img)
+    assert pixel_hash(img) != pixel_hash(Image.new("RGB", (40, 30), "blue"))
+    assert pixel_hash(img) != pixel_hash(img.convert("L"))
@@ -1,8 +1,11 @@
+import re
 import torch
+from pathlib import Path
 import pytest
 from PIL import Image
 from unittest.mock import MagicMock, patch
 
+from src.forecast.cache import pixel_hash
 from src.forecast.generator import WeatherVision
 
 
@@ -39,10 +42,68 @@ def test_weather_vision_init_cpu(
         assert wv.device.type == "cpu"
         mock_processor_cls.from_pretrained.assert_called_once()
         mock_model_cls.from_pretrained.assert_called_once()
+        kwargs = mock_model_cls.from_pretrained.call_args.kwargs
+        assert kwargs["dtype"] == torch.float32
+        assert kwargs["use_safetensors"] is True
+        assert "device_map" not in kwargs
         model.to.assert_called_once_with(wv.device)
         model.eval.assert_called_once()
 
 
+@patch("src.forecast.generator.AutoProcessor")
+@patch("src.forecast.generator.AutoModelForImageTextToText")
+def test_weather_vision_load_options(mock_model_cls, mock_processor_cls):
+    """
+    dtype is passed to from_pretrained, and on MPS the weights are loaded
+    in place instead of being copied over after loading.
+    """
+    model = mock_model_cls.from_pretrained.return_value
+
+    with patch("torch.backends.mps.is_available", return_value=True):
+        WeatherVision(dtype="bfloat16")
+        kwargs = mock_model_cls.from_pretrained.call_args.kwargs
+        assert kwargs["dtype"] == torch.bfloat16
+        assert kwargs["device_map"] == "mps"
+        model.to.assert_not_called()
+
+        wv = WeatherVision(dtype="auto", device_map=False)
+        kwargs = mock_model_cls.from_pretrained.call_args.kwargs
+        assert kwargs["dtype"] == "auto"
+        assert "device_map" not in kwargs
+        model.to.assert_called_once_with(wv.device)
+
+        with pytest.raises(ValueError):
+            WeatherVision(dtype="int4")
+
+
+@patch("src.forecast.generator.quantize_model")
+@patch("src.forecast.generator.AutoProcessor")
+@patch("src.forecast.generator.AutoModelForImageTextToText")
+def test_weather_vision_quantized_runs_on_cpu(
+    mock_model_cls, mock_processor_cls, mock_quantize
+):
+    """
+    A quantized model is loaded on the CPU even when MPS is available, and
+    its quantized layers are cached per quantization mode.
+    """
+    with patch("torch.backends.mps.is_available", return_value=True):
+        wv = WeatherVision(quantization="int8")
+        WeatherVision(quantization="int4")
+
+    assert wv.device.type == "cpu"
+    assert "device_map" not in mock_model_cls.from_pretrained.call_args.kwargs
+    (model, mode, int8_path), (_, _, int4_path) = [
+        c.args for c in mock_quantize.call_args_list
+    ]
+    assert model is mock_model_cls.from_pretrained.return_value
+    assert mode == "int8"
+    assert int8_path.parent == Path(WeatherVision.QUANTIZED_DIR)
+    assert int8_path != int4_path
+
+    with pytest.raises(ValueError):
+        WeatherVision.load_model(torch.device("mps"), quantization="int8")
+
+
 @patch("src.forecast.generator.AutoProcessor")
 @patch("src.forecast.generator.AutoModelForImageTextToText")
 def test_generate_forecast(
@@ -84,3 +145,303 @@ def test_generate_forecast(
     model.generate.assert_called_once()
     processor.decode.assert_called_once()
     assert text == "Sunny with scattered clouds."
+
+
+@patch("src.forecast.generator.AutoProcessor")
+@patch("src.forecast.generator.AutoModelForImageTextToText")
+def test_generate_forecast_from_in_memory_image(
+    mock_model_cls,
+    mock_processor_cls,
+):
+    """
+    A decoded RGB image is handed to the processor as is.
+    """
+
+    processor = MagicMock()
+    processor.return_value = {"input_ids": torch.tensor([[1, 2, 3]])}
+    model = MagicMock()
+    model.generate.return_value = torch.tensor([[1, 2, 3]])
+
+    mock_processor_cls.from_pretrained.return_value = processor
+    mock_model_cls.from_pretrained.return_value = model
+
+    img = Image.new("RGB", (64, 64), color="blue")
+
+    with patch("torch.backends.mps.is_available", return_value=False):
+        wv = WeatherVision()
+        with patch("src.forecast.generator.Image.open") as mock_open:
+            wv.generate_forecast(img, "Describe the weather.")
+
+    mock_open.assert_not_called()
+    assert processor.call_args.kwargs["images"] is img
+
+
+@patch("src.forecast.generator.AutoProcessor")
+@patch("src.forecast.generator.AutoModelForImageTextToText")
+def test_generate_forecast_batches_several_images(
+    mock_model_cls,
+    mock_processor_cls,
+    fake_image,
+):
+    """
+    Several images go to the processor in one call (one vision batch).
+    """
+
+    processor = MagicMock()
+    processor.return_value = {"input_ids": torch.tensor([[1, 2, 3]])}
+    model = MagicMock()
+    model.generate.return_value = torch.tensor([[1, 2, 3]])
+
+    mock_processor_cls.from_pretrained.return_value = processor
+    mock_model_cls.from_pretrained.return_value = model
+
+    tile = Image.new("L", (64, 64))
+
+    with patch("torch.backends.mps.is_available", return_value=False):
+        wv = WeatherVision()
+        wv.generate_forecast([str(fake_image), tile], "<image><image>")
+
+    processor.assert_called_once()
+    images = processor.call_args.kwargs["images"]
+    assert [img.mode for img in images] == ["RGB", "RGB"]
+    model.generate.assert_called_once()
+
+
+@patch("src.forecast.generator.AutoProcessor")
+@patch("src.forecast.generator.AutoModelForImageTextToText")
+def test_generate_forecasts_batches_bucketed_items(
+    mock_model_cls,
+    mock_processor_cls,
+):
+    """
+    Items are grouped by prompt length into batches of max_batch_size, run
+    with one generate call each, and returned in the original order.
+    """
+
+    processor = MagicMock()
+    processor.tokenizer.padding_side = "right"
+    processor.tokenizer.side_effect = lambda text: MagicMock(input_ids=text.split())
+
+    def collate(text, images, padding, return_tensors):
+        assert padding is True
+        assert processor.tokenizer.padding_side == "left"
+        width = max(len(t.split()) for t in text)
+        return {"input_ids": torch.zeros(len(text), width, dtype=torch.long)}
+
+    processor.side_effect = collate
+    # The decoded text is the number of tokens kept for the row
+    processor.decode.side_effect = lambda tokens, skip_special_tokens: str(len(tokens))
+
+    model = MagicMock()
+    model.generate.side_effect = lambda input_ids, max_new_tokens, **kwargs: (
+        torch.ones(len(input_ids), input_ids.shape[1] + max_new_tokens)
+    )
+
+    mock_processor_cls.from_pretrained.return_value = processor
+    mock_model_cls.from_pretrained.return_value = model
+
+    img = Image.new("RGB", (8, 8))
+    items = [
+        (img, "a b c d e f", 10),
+        (img, "a", 20),
+        (img, "a b c d e", 30),
+        (img, "a b", 40),
+    ]
+
+    with patch("torch.backends.mps.is_available", return_value=False):
+        wv = WeatherVision()
+        texts = wv.generate_forecasts(items, max_batch_size=2)
+
+    # Buckets: the two short prompts (width 2), then the two long ones (width 6)
+    assert [c.kwargs["text"] for c in processor.call_args_list] == [
+        ["a", "a b"],
+        ["a b c d e", "a b c d e f"],
+    ]
+    assert [c.kwargs["max_new_tokens"] for c in model.generate.call_args_list] == [
+        40,
+        30,
+    ]
+    # Each row is cut to its padded prompt plus its own max_tokens
+    assert texts == ["16", "22", "36", "42"]
+    assert processor.tokenizer.padding_side == "right"
+
+
+@patch("src.forecast.generator.AutoProcessor")
+@patch("src.forecast.generator.AutoModelForImageTextToText")
+def test_generate_answers_reuses_image_features(
+    mock_model_cls,
+    mock_processor_cls,
+):
+    """
+    Several prompts share one vision forward pass, and the features are
+    cached by image across calls.
+    """
+
+    image_token_id = 7
+    processor = MagicMock()
+    processor.image_token = "<image>"
+    processor.image_processor.return_value = {"pixel_values": torch.zeros(1, 3, 8, 8)}
+
+    def tokenize(text, return_tensors):
+        tokens = re.findall(r"<image>|[^<|]+", text)
+        ids = [image_token_id if tok == "<image>" else 1 for tok in tokens]
+        return {
+            "input_ids": torch.tensor([ids]),
+            "attention_mask": torch.ones(1, len(ids), dtype=torch.long),
+        }
+
+    processor.tokenizer.side_effect = tokenize
+    processor.decode.return_value = "Answer"
+
+    model = MagicMock()
+    model.dtype = torch.float32
+    model.config.image_token_id = image_token_id
+    model.get_input_embeddings.return_value = torch.nn.Embedding(10, 4)
+    features = torch.full((1, 3, 4), 5.0)  # one image, three vision tokens
+    model.get_image_features.return_value = features
+    model.generate.return_value = torch.tensor([[1, 2, 3]])
+
+    mock_processor_cls.from_pretrained.return_value = processor
+    mock_model_cls.from_pretrained.return_value = model
+
+    img = Image.new("RGB", (64, 64), color="blue")
+
+    with patch("torch.backends.mps.is_available", return_value=False):
+        wv = WeatherVision()
+        answers = wv.generate_answers(
+            img, ["Title|<image>", "Summary|<image>|now", "Hazards|<image>"]
+        )
+        # A fresh copy of the same chart hits the feature cache
+        wv.generate_answers(img.copy(), ["Title|<image>"])
+
+    assert answers == ["Answer", "Answer", "Answer"]
+    model.get_image_features.assert_called_once()
+    assert model.generate.call_count == 4
+
+    kwargs = model.generate.call_args_list[1].kwargs
+    assert "pixel_values" not in kwargs
+    assert kwargs["input_ids"].tolist() == [[1, 7, 7, 7, 1]]
+    assert torch.equal(kwargs["inputs_embeds"][0, 1:4], features[0])
+
+    with pytest.raises(ValueError):
+        wv.generate_answers([img, img], ["Title|<image>"])
+
+
+@pytest.fixture
+def tiny_vision():
+    """
+    WeatherVision on a tiny randomly initialized LLaVA, with a character
+    tokenizer where "@" is the image token.
+    """
+    from transformers import (
+        LlavaConfig,
+        LlavaForConditionalGeneration,
+        Qwen2Config,
+        SiglipVisionConfig,
+    )
+
+    torch.manual_seed(0)
+    config = LlavaConfig(
+        vision_config=SiglipVisionConfig(
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            image_size=28,
+            patch_size=14,
+        ),
+        text_config=Qwen2Config(
+            vocab_size=100,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            num_key_value_heads=2,
+        ),
+        image_token_id=5,
+        vision_feature_select_strategy="full",
+        vision_feature_layer=-1,
+    )
+    model = LlavaForConditionalGeneration(config).eval()
+
+    def tokenize(text, return_tensors):
+        ids = [5 if ch == "@" else 10 + ord(ch) % 80 for ch in text]
+        return {
+            "input_ids": torch.tensor([ids]),
+            "attention_mask": torch.ones(1, len(ids), dtype=torch.long),
+        }
+
+    processor = MagicMock()
+    processor.image_token = "@"
+    processor.tokenizer.side_effect = tokenize
+    processor.tokenizer.eos_token_id = 0
+    processor.image_processor.side_effect = lambda images, return_tensors: {
+        "pixel_values": torch.rand(len(images), 3, 28, 28)
+    }
+    processor.decode.side_effect = lambda tokens, skip_special_tokens: tokens.tolist()
+
+    with (
+        patch("src.forecast.generator.AutoProcessor") as mock_processor_cls,
+        patch("src.forecast.generator.AutoModelForImageTextToText") as mock_model_cls,
+        patch("torch.backends.mps.is_available", return_value=False),
+    ):
+        mock_processor_cls.from_pretrained.return_value = processor
+        mock_model_cls.from_pretrained.return_value = model
+        yield WeatherVision()
+
+
+def test_prefix_cache_only_prefills_the_rest_of_the_prompt(tiny_vision, tmp_path):
+    """
+    A registered prefix gives the same tokens as a full prefill, while the
+    prompt prefill skips the prefix.
+    """
+    img = Image.new("RGB", (28, 28), color="red")
+    prompts = ["Instructions: @ title", "Instructions: @"]  # ends in image tokens
+    expected = tiny_vision.generate_answers(img, prompts, max_tokens=6)
+
+    tiny_vision.register_prefix("Instructions: ", cache_dir=tmp_path)
+
+    prefill_lengths = []
+
+    def record_prefill(module, args, kwargs):
+        embeds = kwargs.get("inputs_embeds")
+        if embeds is not None and not prefill_lengths:
+            prefill_lengths.append(embeds.shape[1])
+
+    hook = tiny_vision.model.register_forward_pre_hook(record_prefill, with_kwargs=True)
+    answers = tiny_vision.generate_answers(img, prompts[:1], max_tokens=6)
+    hook.remove()
+    answers += tiny_vision.generate_answers(img, prompts[1:], max_tokens=6)
+
+    assert answers == expected
+    # "@ title": 4 image tokens (a 2x2 patch grid) and 6 characters
+    assert prefill_lengths == [10]
+    assert tiny_vision.generate_forecast(img, prompts[0], max_tokens=6) == expected[0]
+
+    # The persisted cache is loaded instead of recomputed
+    assert len(list(tmp_path.glob("*.pt"))) == 1
+    tiny_vision._prefixes.clear()
+    calls = []
+    hook = tiny_vision.model.register_forward_pre_hook(
+        lambda module, args: calls.append(1)
+    )
+    tiny_vision.register_prefix("Instructions: ", cache_dir=tmp_path)
+    hook.remove()
+    assert not calls
+    assert tiny_vision.generate_answers(img, prompts, max_tokens=6) == expected
+
+
+def test_full_feature_cache_keeps_the_images_in_use(tiny_vision):
+    """A full cache evicts only after the call's features are read."""
+    tiny_vision.FEATURE_CACHE_SIZE = 2
+    a, b, c = (
+        Image.new("RGB", (28, 28), color=color) for color in ("red", "green", "blue")
+    )
+
+    tiny_vision.generate_answers(a, ["x@"], max_tokens=2)
+    tiny_vision.generate_answers(b, ["x@"], max_tokens=2)
+    # a is the least recently used entry of the full cache
+    answers = tiny_vision.generate_answers([a, c], ["x@@"], max_tokens=2)
+
+    assert len(answers) == 1
+    assert list(tiny_vision._features) == [pixel_hash(a), pixel_hash(c)]
@@ -1,8 +1,20 @@
 # tests/test_image_tools.py
 import pytest
+from io import BytesIO
 from pathlib import Path
 from unittest.mock import patch, MagicMock
-from src.chart.processors.image_tools import resize_png
+from PIL import Image, ImageDraw
+from src.chart.processors.image_tools import (
+    IMAGE_ENCODINGS,
+    ChartImage,
+    compare_images,
+    encode_image,
+    fit_size,
+    perceptual_hash,
+    resize_png,
+    resize_pyramid,
+    tile_image,
+)
 
 
 def test_resize_png(tmp_path):
@@ -28,3 +40,190 @@ def test_resize_png(tmp_path):
     mock_img.resize.assert_called_once_with((300, 200), 99)
     mock_img.save.assert_called_once_with(dst, optimize=True)
     assert output == dst
+
+
+def make_chart(path, lines=()):
+    """Draw a white 'chart' with some black lines and save it."""
+    img = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(img)
+    for box in lines:
+        draw.line(box, fill="black", width=4)
+    img.save(path)
+    return path
+
+
+def test_perceptual_hash_stable_across_encodings(tmp_path):
+    png = make_chart(tmp_path / "a.png", [(0, 0, 800, 600)])
+    jpg = tmp_path / "a.jpg"
+    Image.open(png).save(jpg, quality=90)
+
+    assert perceptual_hash(Image.open(png)) == perceptual_hash(Image.open(jpg))
+
+
+def test_compare_images_identical(tmp_path):
+    a = make_chart(tmp_path / "a.png", [(0, 300, 800, 300)])
+    b = make_chart(tmp_path / "b.png", [(0, 300, 800, 300)])
+
+    diff = compare_images(a, b)
+
+    assert diff.phash_distance == 0
+    assert diff.pixel_diff == 0.0
+
+
+def test_compare_images_detects_new_lines(tmp_path):
+    a = make_chart(tmp_path / "a.png", [(0, 300, 800, 300)])
+    b = make_chart(tmp_path / "b.png", [(0, 300, 800, 300), (400, 0, 400, 600)])
+
+    diff = compare_images(a, b)
+
+    assert diff.pixel_diff > 0.001
+
+
+def test_compare_images_accepts_decoded_images(tmp_path):
+    a = make_chart(tmp_path / "a.png", [(0, 300, 800, 300)])
+
+    diff = compare_images(Image.open(a), a)
+
+    assert diff == (0, 0.0)
+
+
+def test_chart_image_encodes_once_and_saves(tmp_path):
+    img = Image.new("RGB", (30, 20), "red")
+    chart = ChartImage("weather.png", img)
+
+    data = chart.encode()
+    path = chart.save(tmp_path / "weather.png")
+
+    assert chart.encode() is data
+    assert path.read_bytes() == data
+    assert chart.path == path
+    assert chart.image is img
+
+
+def test_chart_image_load_decodes_lazily(tmp_path):
+    Image.new("RGB", (30, 20), "red").save(tmp_path / "weather.png")
+
+    with patch("src.chart.processors.image_tools.Image.open") as mock_open:
+        chart = ChartImage.load(tmp_path / "weather.png")
+        assert chart.encode() == (tmp_path / "weather.png").read_bytes()
+        mock_open.assert_not_called()
+
+    assert chart.name == "weather.png"
+    assert chart.image.size == (30, 20)
+
+
+def test_chart_image_requires_content():
+    with pytest.raises(ValueError):
+        ChartImage("weather.png")
+
+
+def make_flat_chart():
+    """A small RGB chart with a few flat colors, like a JMA weather chart."""
+    img = Image.new("RGB", (120, 80), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 40, 120, 80), fill=(200, 230, 180))  # land
+    draw.line((0, 20, 120, 60), fill=(40, 60, 200), width=2)  # isobar
+    draw.line((60, 0, 60, 80), fill=(220, 30, 30), width=3)  # front
+    return img
+
+
+@pytest.mark.parametrize("encoding", ["png-fast", "png", "png-best", "webp-lossless"])
+def test_encode_image_lossless(encoding):
+    img = make_flat_chart()
+
+    data = encode_image(img, encoding)
+
+    decoded = Image.open(BytesIO(data))
+    assert decoded.format == IMAGE_ENCODINGS[encoding].format
+    assert decoded.convert("RGB").tobytes() == img.tobytes()
+
+
+def test_encode_image_palette_keeps_flat_colors():
+    img = make_flat_chart()
+
+    data = encode_image(img, "png-palette")
+
+    decoded = Image.open(BytesIO(data))
+    assert decoded.mode == "P"
+    # A handful of flat colors fits the palette exactly
+    assert decoded.convert("RGB").tobytes() == img.tobytes()
+
+
+def test_encode_image_lossy_webp():
+    img = make_flat_chart()
+
+    decoded = Image.open(BytesIO(encode_image(img, "webp"))).convert("RGB")
+
+    assert decoded.size == img.size
+    assert compare_images(decoded, img).pixel_diff < 0.05
+
+
+def test_chart_image_encoding():
+    img = Image.new("RGB", (64, 64), "white")
+
+    fast = ChartImage("a.png", img, encoding="png-fast").encode()
+    best = ChartImage("a.png", img, encoding="png-best").encode()
+
+    assert Image.open(BytesIO(fast)).tobytes() == img.tobytes()
+    assert len(best) <= len(fast)
+    with pytest.raises(ValueError):
+        ChartImage("a.png", img, encoding="jpeg2000")
+
+
+@pytest.mark.parametrize(
+    "target, expected",
+    [
+        ((300, None), (300, 212)),
+        ((None, 100), (142, 100)),
+        ((384, 384), (384, 384)),
+        ((None, None), (842, 595)),
+    ],
+)
+def test_fit_size(target, expected):
+    assert fit_size((842, 595), target) == expected
+
+
+def test_resize_pyramid_builds_each_level_from_the_previous(tmp_path):
+    img = Image.open(make_chart(tmp_path / "a.png", [(0, 300, 800, 300)]))
+    targets = {"small": (100, None), "model": (384, 384), "medium": (400, None)}
+
+    sources = []
+    original_resize = Image.Image.resize
+
+    def spy(self, *args, **kwargs):
+        sources.append(self.size)
+        return original_resize(self, *args, **kwargs)
+
+    with patch.object(Image.Image, "resize", spy):
+        result = resize_pyramid(img, targets)
+
+    assert list(result) == ["small", "model", "medium"]
+    assert {k: v.size for k, v in result.items()} == {
+        "small": (100, 75),
+        "model": (384, 384),
+        "medium": (400, 300),
+    }
+    # model is too narrow for medium, so both come from the source; small
+    # is built from the smallest covering level, medium
+    assert sources == [(800, 600), (800, 600), (400, 300)]
+
+
+def test_resize_pyramid_matches_direct_resize(tmp_path):
+    img = Image.open(make_chart(tmp_path / "a.png", [(0, 300, 800, 300)]))
+
+    result = resize_pyramid(img, {"medium": (400, None), "small": (200, None)})
+    direct = img.resize((200, 150), Image.LANCZOS)
+
+    assert compare_images(result["small"], direct).pixel_diff < 0.01
+    assert resize_pyramid(img, {"same": (None, None)})["same"] is img
+
+
+def test_tile_image_row_major():
+    img = Image.new("RGB", (40, 20), "white")
+    img.paste((255, 0, 0), (20, 0, 40, 10))  # top right quadrant
+
+    tiles = tile_image(img, rows=2, cols=2)
+
+    assert [t.size for t in tiles] == [(20, 10)] * 4
+    assert tiles[1].getpixel((0, 0)) == (255, 0, 0)
+    assert tiles[0].getpixel((0, 0)) == (255, 255, 255)
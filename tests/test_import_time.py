@@ -0,0 +1,102 @@
+"""
+Import-time budget for the hourly "chart unchanged" run.
+
+Most cron runs download the chart, find it unchanged and exit. That path
+must not import torch, transformers or the Salesforce client, which take
+seconds; they are imported only once _should_process() returns True. A
+forecast cache hit must not load the model stack either.
+Each check runs in a fresh interpreter so earlier tests' imports do not
+hide a regression.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Modules that only the forecast and publish stages need
+HEAVY_MODULES = (
+    "torch",
+    "transformers",
+    "simple_salesforce",
+    "src.forecast.generator",
+    "src.salesforce.base",
+)
+# Cumulative `import src.main` time; ~0.15 s on a laptop, torch alone is
+# several seconds, so this leaves room for slow CI machines.
+IMPORT_BUDGET_S = 1.0
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Cumulative import time in seconds per module, from -X importtime."""
+    result = run_python("-X", "importtime", "-c", f"import {module}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_main_import_stays_within_budget():
+    times = import_times("src.main")
+
+    assert [m for m in HEAVY_MODULES if m in times] == []
+    assert times["src.main"] < IMPORT_BUDGET_S
+
+
+def test_unchanged_chart_run_skips_heavy_imports():
+    code = f"""
+import sys
+from unittest.mock import patch
+from src.orchestration.pipeline import WeatherPipeline
+
+unchanged = {{"updated": False, "hash": "abc", "path": None,
+              "previous": None, "previous_hash": "abc"}}
+with patch.object(WeatherPipeline, "_download_chart", return_value=unchanged):
+    assert WeatherPipeline().run() is False
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+    result = run_python("-c", code)
+
+    assert result.stdout.strip() == ""
+
+
+def test_forecast_cache_hit_skips_heavy_imports(tmp_path):
+    code = f"""
+import sys
+from pathlib import Path
+from unittest.mock import patch
+from PIL import Image
+from src.chart.processors.image_tools import ChartImage
+from src.orchestration import pipeline
+from src.orchestration.pipeline import WeatherPipeline
+
+img = Image.new("RGB", (384, 384))
+key = WeatherPipeline._forecast_key([img], pipeline.MODEL_PROMPT)
+with patch.object(pipeline, "DATA_DIR", {str(tmp_path)!r}):
+    pipeline.ForecastCache(
+        Path(pipeline.DATA_DIR) / pipeline.FORECAST_CACHE_DIR,
+        pipeline.FORECAST_CACHE_RETENTION,
+    ).put(key, "Title\\nBody")
+    forecast = WeatherPipeline()._generate_forecast(
+        {{"regular": ChartImage("weather.png", img)}}
+    )
+assert forecast == {{"title": "Title", "content": "Body"}}, forecast
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+    result = run_python("-c", code)
+
+    assert result.stdout.strip() == ""
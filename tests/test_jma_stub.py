@@ -0,0 +1,91 @@
+import pytest
+import requests
+
+from benchmarks.jma_stub import JMAStubServer, make_fixture_pdf
+from src.chart.downloader import WeatherPDFDownloader
+
+
+@pytest.fixture
+def server():
+    with JMAStubServer(make_fixture_pdf(200_000)) as s:
+        yield s
+
+
+def test_fixture_pdf_is_valid_and_variants_differ(tmp_path):
+    from src.chart.processors.pdf_tools import validate_pdf
+
+    a = make_fixture_pdf(10_000, variant=0)
+    b = make_fixture_pdf(10_000, variant=1)
+    (tmp_path / "a.pdf").write_bytes(a)
+
+    assert validate_pdf(tmp_path / "a.pdf", expected_length=len(a)) is None
+    assert a != b
+
+
+def test_unchanged_chart_is_a_single_304(server, tmp_path):
+    dl = WeatherPDFDownloader(tmp_path, server.url)
+    updated, pdf_hash, pdf_path = dl.refresh_pdf()
+    assert updated is True
+
+    before = len(server.requests)
+    updated, same_hash, same_path = dl.refresh_pdf()
+
+    assert updated is False
+    assert (same_hash, same_path) == (pdf_hash, pdf_path)
+    assert len(server.requests) - before == 1
+    assert "If-None-Match" in server.requests[-1][2]
+
+
+def test_new_chart_version_is_downloaded(server, tmp_path):
+    dl = WeatherPDFDownloader(tmp_path, server.url)
+    dl.refresh_pdf()
+
+    server.set_pdf(make_fixture_pdf(200_000, variant=1))
+    updated, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert updated is True
+    assert pdf_path.read_bytes() == server.pdf
+
+
+def test_truncated_body_is_resumed_with_range(server, tmp_path):
+    server.truncate = 150_000  # a little over two 64 KiB chunks
+    dl = WeatherPDFDownloader(tmp_path, server.url, backoff=0)
+
+    updated, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert updated is True
+    assert pdf_path.read_bytes() == server.pdf
+    assert server.requests[-1][2]["Range"] == "bytes=131072-"
+
+
+def test_server_errors_are_retried(server, tmp_path):
+    server.status = 503
+    server.error_count = 2
+    dl = WeatherPDFDownloader(tmp_path, server.url, retries=2, backoff=0)
+
+    updated, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert updated is True
+    assert len(server.requests) == 3
+
+
+def test_client_error_is_not_retried(server, tmp_path):
+    server.status = 404
+    dl = WeatherPDFDownloader(tmp_path, server.url, retries=2, backoff=0)
+
+    with pytest.raises(requests.HTTPError):
+        dl.refresh_pdf()
+
+    assert len(server.requests) == 1
+
+
+def test_html_maintenance_page_is_quarantined(server, tmp_path):
+    """A 200 response carrying HTML never becomes a chart version."""
+    server.set_pdf(b"<html><body>Under maintenance</body></html>")
+    dl = WeatherPDFDownloader(tmp_path, server.url)
+
+    updated, pdf_hash, pdf_path = dl.refresh_pdf()
+
+    assert updated is False
+    assert dl.store.entries() == []
+    assert len(list((tmp_path / WeatherPDFDownloader.QUARANTINE_DIR).iterdir())) == 1
@@ -1,8 +1,20 @@
 # tests/test_pdf_tools.py
 import pytest
+from PIL import Image, ImageChops
 from pathlib import Path
 from unittest.mock import patch, MagicMock
-from src.chart.processors.pdf_tools import pdf_to_png
+from src.chart.processors.pdf_tools import (
+    PdfiumRasterizer,
+    PdfInspector,
+    Rasterizer,
+    _pdftoppm_version,
+    get_rasterizer,
+    iter_pdf_pages,
+    pdf_to_png,
+    render_pdf_page,
+    render_pdf_pages,
+    validate_pdf,
+)
 
 
 def test_pdf_to_png(tmp_path):
@@ -22,7 +34,341 @@ def test_pdf_to_png(tmp_path):
     ) as mock_convert:
         output = pdf_to_png(pdf_path, png_path)
 
-    # Assertions
-    mock_convert.assert_called_once_with(pdf_path)
+    # Assertions: only the first page is rendered
+    mock_convert.assert_called_once_with(
+        pdf_path, first_page=1, last_page=1, grayscale=False, thread_count=1
+    )
     mock_image.save.assert_called_once_with(png_path)
     assert output == png_path
+
+
+def test_pdf_to_png_renders_at_target_size(tmp_path):
+    pdf_path = tmp_path / "test.pdf"
+    png_path = tmp_path / "out.png"
+    mock_image = MagicMock()
+
+    with patch(
+        "src.chart.processors.pdf_tools.convert_from_path", return_value=[mock_image]
+    ) as mock_convert:
+        pdf_to_png(
+            pdf_path,
+            png_path,
+            page=2,
+            size=(300, None),
+            grayscale=True,
+            thread_count=2,
+        )
+
+    mock_convert.assert_called_once_with(
+        pdf_path,
+        first_page=2,
+        last_page=2,
+        grayscale=True,
+        thread_count=2,
+        size=(300, None),
+    )
+
+
+def test_render_pdf_pages_range_and_dpi(tmp_path):
+    pdf_path = tmp_path / "test.pdf"
+    pages = [MagicMock(), MagicMock()]
+
+    with patch(
+        "src.chart.processors.pdf_tools.convert_from_path", return_value=pages
+    ) as mock_convert:
+        result = render_pdf_pages(
+            pdf_path, first_page=1, last_page=2, dpi=100, thread_count=2
+        )
+
+    mock_convert.assert_called_once_with(
+        pdf_path, first_page=1, last_page=2, grayscale=False, thread_count=2, dpi=100
+    )
+    assert result == pages
+
+
+MINIMAL_PDF = (
+    b"%PDF-1.4\n"
+    b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+    b"2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >> endobj\n"
+    b"3 0 obj << /Type /Page /Parent 2 0 R >> endobj\n"
+    b"4 0 obj << /Type/Page /Parent 2 0 R >> endobj\n"
+    b"trailer << /Root 1 0 R >>\n%%EOF\n"
+)
+
+
+def test_validate_pdf_ok(tmp_path):
+    pdf_path = tmp_path / "ok.pdf"
+    pdf_path.write_bytes(MINIMAL_PDF)
+
+    assert validate_pdf(pdf_path) is None
+    assert validate_pdf(pdf_path, expected_length=len(MINIMAL_PDF)) is None
+
+
+@pytest.mark.parametrize(
+    "content, expected_length, reason",
+    [
+        (MINIMAL_PDF, len(MINIMAL_PDF) + 1, "Content-Length"),
+        (b"<html>404 Not Found</html>", None, "%PDF-"),
+        (MINIMAL_PDF[:-10], None, "%%EOF"),
+        (b"%PDF-1.4\n<< /Type /Pages /Count 0 >>\n%%EOF\n", None, "page"),
+    ],
+)
+def test_validate_pdf_problems(tmp_path, content, expected_length, reason):
+    pdf_path = tmp_path / "bad.pdf"
+    pdf_path.write_bytes(content)
+
+    assert reason in validate_pdf(pdf_path, expected_length)
+
+
+def test_pdf_inspector_counts_pages_across_chunks():
+    inspector = PdfInspector()
+    for i in range(0, len(MINIMAL_PDF), 7):
+        inspector.update(MINIMAL_PDF[i : i + 7])
+
+    assert inspector.page_count == 2
+    assert inspector.size == len(MINIMAL_PDF)
+    assert inspector.problem() is None
+
+
+def test_render_pdf_page_returns_image_without_saving(tmp_path):
+    pdf_path = tmp_path / "test.pdf"
+    mock_image = MagicMock()
+
+    with patch(
+        "src.chart.processors.pdf_tools.convert_from_path", return_value=[mock_image]
+    ) as mock_convert:
+        result = render_pdf_page(pdf_path, size=(384, 384))
+
+    mock_convert.assert_called_once_with(
+        pdf_path,
+        first_page=1,
+        last_page=1,
+        grayscale=False,
+        thread_count=1,
+        size=(384, 384),
+    )
+    assert result is mock_image
+    mock_image.save.assert_not_called()
+
+
+def test_pdfium_renders_page_range_in_process(tmp_path):
+    pdf_path = tmp_path / "two_pages.pdf"
+    pdf_path.write_bytes(MINIMAL_PDF)  # two US Letter pages (612x792 pt)
+
+    with patch("src.chart.processors.pdf_tools.convert_from_path") as mock_convert:
+        pages = render_pdf_pages(
+            pdf_path, first_page=1, last_page=2, dpi=72, backend="pdfium"
+        )
+
+    mock_convert.assert_not_called()
+    assert [page.size for page in pages] == [(612, 792), (612, 792)]
+    assert pages[0].mode == "RGB"
+
+
+def test_pdfium_renders_at_target_size(tmp_path):
+    pdf_path = tmp_path / "two_pages.pdf"
+    pdf_path.write_bytes(MINIMAL_PDF)
+
+    exact = render_pdf_page(pdf_path, size=(384, 384), backend="pdfium")
+    preview = render_pdf_page(
+        pdf_path, page=2, size=(300, None), grayscale=True, backend="pdfium"
+    )
+
+    assert exact.size == (384, 384)
+    assert preview.size == (300, 388)
+    assert preview.mode == "L"
+    assert preview.getextrema() == (255, 255)  # blank white page
+
+
+@pytest.mark.parametrize(
+    "dpi, size, expected",
+    [
+        (None, None, (2339, 1653)),  # pdf2image default of 200 dpi
+        (72, None, (842, 595)),
+        (72, (300, None), (300, 212)),
+        (None, (None, 100), (142, 100)),
+        (None, (384, 384), (384, 384)),
+        (None, 500, (500, 353)),  # longest side
+    ],
+)
+def test_pdfium_pixel_size_matches_pdf2image_semantics(dpi, size, expected):
+    assert PdfiumRasterizer._pixel_size((842, 595), dpi, size) == expected
+
+
+def test_poppler_version_includes_pdftoppm():
+    _pdftoppm_version.cache_clear()
+    with patch("src.chart.processors.pdf_tools.subprocess.run") as mock_run:
+        mock_run.return_value.stdout = ""
+        mock_run.return_value.stderr = "pdftoppm version 24.02.0\nCopyright ...\n"
+        first = get_rasterizer("poppler").version
+        second = get_rasterizer("poppler").version
+    _pdftoppm_version.cache_clear()
+
+    assert first == second
+    assert first.startswith("poppler-24.02.0/pdf2image-")
+    mock_run.assert_called_once()
+
+
+def test_get_rasterizer():
+    custom = MagicMock(spec=Rasterizer)
+
+    assert isinstance(get_rasterizer("pdfium"), PdfiumRasterizer)
+    assert get_rasterizer("pdfium").version.startswith("pdfium-")
+    assert get_rasterizer("poppler").version.startswith("poppler-")
+    assert get_rasterizer(custom) is custom
+    with pytest.raises(ValueError):
+        get_rasterizer("ghostscript")
+
+
+def test_pdfium_crop_matches_crop_of_full_render(tmp_path):
+    from benchmarks.jma_stub import make_chart_pdf
+
+    pdf_path = tmp_path / "chart.pdf"
+    pdf_path.write_bytes(make_chart_pdf())
+    roi = (0.25, 0.2, 0.75, 0.7)
+
+    full = render_pdf_page(pdf_path, dpi=50, backend="pdfium")
+    region = render_pdf_page(pdf_path, dpi=50, crop=roi, backend="pdfium")
+    sized = render_pdf_page(pdf_path, size=(384, 384), crop=roi, backend="pdfium")
+
+    # Same pixels up to anti-aliasing noise
+    diff = ImageChops.difference(region, full.crop((146, 83, 439, 289)))
+    assert max(high for _, high in diff.getextrema()) < 32
+    assert sized.size == (384, 384)
+
+
+def test_poppler_crop_renders_page_at_region_scale(tmp_path):
+    pdf_path = tmp_path / "test.pdf"
+    page = Image.new("RGB", (800, 400), "white")
+    page.paste((0, 0, 0), (200, 100, 600, 300))
+
+    with patch(
+        "src.chart.processors.pdf_tools.convert_from_path", return_value=[page]
+    ) as mock_convert:
+        region = render_pdf_page(
+            pdf_path, size=(400, None), crop=(0.25, 0.25, 0.75, 0.75)
+        )
+
+    assert mock_convert.call_args.kwargs["size"] == (800, None)
+    assert region.size == (400, 200)
+    assert region.getextrema() == ((0, 0), (0, 0), (0, 0))
+
+
+def test_int_size_with_crop_matches_across_backends(tmp_path):
+    """An int size is the region's longest edge with either backend."""
+    import pypdfium2 as pdfium
+    from benchmarks.jma_stub import make_chart_pdf
+
+    pdf_path = tmp_path / "chart.pdf"
+    pdf_path.write_bytes(make_chart_pdf())
+    page_w, page_h = pdfium.PdfDocument(pdf_path)[0].get_size()
+    roi = (0.0, 0.0, 0.4, 1.0)  # taller than wide, on a landscape page
+
+    def fake_pdftoppm(pdf_path, size, **kwargs):
+        # Whole-page render at the requested size, as pdftoppm would give
+        return [render_pdf_page(pdf_path, size=size, backend="pdfium")]
+
+    pdfium_region = render_pdf_page(pdf_path, size=300, crop=roi, backend="pdfium")
+    with (
+        patch(
+            "src.chart.processors.pdf_tools.convert_from_path",
+            side_effect=fake_pdftoppm,
+        ),
+        patch(
+            "src.chart.processors.pdf_tools.pdfinfo_from_path",
+            return_value={"Page size": f"{page_w} x {page_h} pts"},
+        ),
+    ):
+        poppler_region = render_pdf_page(
+            pdf_path, size=300, crop=roi, backend="poppler"
+        )
+
+    assert page_w > page_h
+    assert pdfium_region.size[1] == 300
+    assert poppler_region.size == pdfium_region.size
+
+
+def test_render_rejects_invalid_crop(tmp_path):
+    with pytest.raises(ValueError):
+        render_pdf_page(tmp_path / "x.pdf", crop=(0.5, 0, 0.2, 1))
+
+
+def test_iter_pdf_pages_matches_serial_render_in_order(tmp_path):
+    from benchmarks.jma_stub import make_chart_pdf
+
+    pdf_path = tmp_path / "chart_set.pdf"
+    pdf_path.write_bytes(make_chart_pdf(pages=4))
+
+    serial = render_pdf_pages(pdf_path, 1, 4, dpi=36, backend="pdfium")
+    parallel = list(iter_pdf_pages(pdf_path, dpi=36, backend="pdfium", workers=2))
+
+    assert len(parallel) == 4
+    for expected, page in zip(serial, parallel):
+        assert page.tobytes() == expected.tobytes()
+
+
+class PageNumberRasterizer(Rasterizer):
+    """Renders each page as a 1x1 image whose pixel value is the page number."""
+
+    def render(self, pdf_path, first_page, last_page, *args, crop=None):
+        return [Image.new("L", (1, 1), n) for n in range(first_page, last_page + 1)]
+
+    def page_count(self, pdf_path):
+        return 10
+
+
+class InlinePool:
+    """ProcessPoolExecutor stand-in that runs tasks on submit."""
+
+    def __init__(self, max_workers):
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        from concurrent.futures import Future
+
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+    def shutdown(self, cancel_futures=False):
+        pass
+
+
+def test_iter_pdf_pages_bounds_pages_in_flight():
+    pools = []
+
+    def make_pool(max_workers):
+        pools.append(InlinePool(max_workers))
+        return pools[-1]
+
+    with patch(
+        "src.chart.processors.pdf_tools.ProcessPoolExecutor", side_effect=make_pool
+    ):
+        pages = iter_pdf_pages(
+            "set.pdf",
+            backend=PageNumberRasterizer(),
+            workers=2,
+            pages_per_task=2,
+            max_in_flight=4,
+        )
+        numbers = []
+        for page in pages:
+            numbers.append(page.getpixel((0, 0)))
+            # Pages submitted but not yet consumed never exceed the limit
+            assert pools[0].submitted * 2 - len(numbers) <= 4
+
+    assert numbers == list(range(1, 11))
+    assert pools[0].submitted == 5
+
+
+def test_iter_pdf_pages_single_worker_renders_in_process():
+    with patch("src.chart.processors.pdf_tools.ProcessPoolExecutor") as mock_pool:
+        pages = list(
+            iter_pdf_pages(
+                "set.pdf", first_page=3, backend=PageNumberRasterizer(), workers=1
+            )
+        )
+
+    mock_pool.assert_not_called()
+    assert [page.getpixel((0, 0)) for page in pages] == list(range(3, 11))
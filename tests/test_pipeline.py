@@ -1,5 +1,8 @@
 from pathlib import Path
 from unittest.mock import MagicMock
+from PIL import Image
+from src.chart.processors.image_tools import ChartImage, ImageDiff
+from src.forecast.service import ForecastServiceError
 from src.orchestration.pipeline import WeatherPipeline
 
 
@@ -35,6 +38,24 @@ def test_run_happy_path(mocker):
     mock_publish.assert_called_once_with(fake_chart, fake_images, fake_forecast)
 
 
+def test_run_stops_when_no_valid_chart_is_stored(mocker):
+    pipeline = WeatherPipeline(force=True)
+
+    # An invalid first download: nothing to fall back to
+    no_chart = {
+        "updated": False,
+        "hash": None,
+        "path": None,
+        "previous": None,
+        "previous_hash": None,
+    }
+    mocker.patch.object(pipeline, "_download_chart", return_value=no_chart)
+    mock_prepare = mocker.patch.object(pipeline, "_prepare_images")
+
+    assert pipeline.run() is False
+    mock_prepare.assert_not_called()
+
+
 def test_run_skips_when_should_process_is_false(mocker):
     pipeline = WeatherPipeline()
 
@@ -94,43 +115,239 @@ def test_should_process():
     assert pipeline._should_process(chart2) is False
 
 
-def test_prepare_images(mocker):
+def test_should_process_skips_cosmetic_change(mocker):
     pipeline = WeatherPipeline()
+    chart = {"updated": True, "previous": Path("/fake/old/chart.pdf")}
 
-    # Arrange
-    mock_pdf_to_png = mocker.patch(
-        "src.orchestration.pipeline.pdf_to_png",
-        return_value=Path("/fake/weather.png"),
+    mock_check = mocker.patch.object(
+        pipeline, "_is_material_change", return_value=False
+    )
+
+    assert pipeline._should_process(chart) is False
+    mock_check.assert_called_once_with(chart)
+
+
+def test_is_material_change(mocker):
+    pipeline = WeatherPipeline()
+    chart = {
+        "hash": "new",
+        "path": Path("/fake/new/chart.pdf"),
+        "previous": Path("/fake/old/chart.pdf"),
+        "previous_hash": "old",
+    }
+
+    renders = {
+        Path("/fake/new/chart.pdf"): Image.new("RGB", (8, 8), "white"),
+        Path("/fake/old/chart.pdf"): Image.new("RGB", (8, 8), "black"),
+    }
+    mocker.patch.object(
+        pipeline,
+        "_prepare_images",
+        side_effect=lambda c: {
+            "regular": ChartImage("weather.png", renders[c["path"]])
+        },
     )
-    mock_resize_png = mocker.patch(
-        "src.orchestration.pipeline.resize_png",
-        return_value=Path("/fake/weather_small.png"),
+    mock_compare = mocker.patch(
+        "src.orchestration.pipeline.compare_images",
+        return_value=ImageDiff(phash_distance=0, pixel_diff=0.0),
+    )
+
+    assert pipeline._is_material_change(chart) is False
+    mock_compare.assert_called_once_with(
+        renders[Path("/fake/old/chart.pdf")], renders[Path("/fake/new/chart.pdf")]
+    )
+
+    mock_compare.return_value = ImageDiff(phash_distance=1, pixel_diff=0.05)
+    assert pipeline._is_material_change(chart) is True
+
+
+def test_prepare_images(mocker, tmp_path):
+    pipeline = WeatherPipeline()
+
+    # Arrange
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    page = Image.new("RGB", (1024, 723), "white")
+    mock_render = mocker.patch(
+        "src.orchestration.pipeline.render_pdf_page", return_value=page
     )
 
-    fake_chart = {"path": Path("/fake/test.pdf")}
+    fake_chart = {"hash": "abc123", "path": tmp_path / "chart.pdf"}
 
     # Act
     result = pipeline._prepare_images(fake_chart)
 
-    mock_pdf_to_png.assert_called_once_with(
-        fake_chart["path"], Path("./data") / "weather.png"
+    # The PDF is rendered once, at the largest (dashboard) size...
+    mock_render.assert_called_once_with(
+        fake_chart["path"], page=1, size=(1024, None), backend="pdfium"
+    )
+
+    # ...and the other sizes are derived from that frame in memory
+    assert result["medium"].image is page
+    assert result["regular"].image.size == (384, 384)
+    assert result["small"].image.size == (300, 212)
+    assert result["small"].name == "weather_small.png"
+    assert result["regular"].encoding == "png-fast"
+    assert result["small"].encoding == "png-palette"
+
+    # ...and stored in the render cache for the next run
+    cached = result["small"].path
+    assert cached.parent.parent == tmp_path / "renders"
+    assert cached.read_bytes() == result["small"].encode()
+
+
+def test_prepare_images_with_height_only_derivative(mocker, tmp_path):
+    pipeline = WeatherPipeline()
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    mocker.patch.dict(
+        "src.orchestration.pipeline.IMAGE_DERIVATIVES",
+        {"medium": ("weather_medium", (None, 723), "png")},
     )
-    mock_resize_png.assert_called_once_with(
-        Path("/fake/weather.png"), Path("./data") / "weather_small.png", width=300
+    page = Image.new("RGB", (1024, 723), "white")
+    mock_render = mocker.patch(
+        "src.orchestration.pipeline.render_pdf_page", return_value=page
     )
 
-    # Assert
-    assert result["regular"] == Path("/fake/weather.png")
-    assert result["small"] == Path("/fake/weather_small.png")
+    result = pipeline._prepare_images({"hash": "abc123", "path": tmp_path / "c.pdf"})
+
+    mock_render.assert_called_once_with(
+        tmp_path / "c.pdf", page=1, size=(None, 723), backend="pdfium"
+    )
+    assert result["medium"].image is page
+    assert result["small"].image.size == (300, 212)
+
+
+def test_prepare_images_without_render_cache(mocker, tmp_path):
+    pipeline = WeatherPipeline()
+
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    mocker.patch("src.orchestration.pipeline.CACHE_RENDERS", False)
+    mocker.patch(
+        "src.orchestration.pipeline.render_pdf_page",
+        return_value=Image.new("RGB", (1024, 723)),
+    )
+
+    result = pipeline._prepare_images({"hash": "abc123", "path": tmp_path / "x.pdf"})
+
+    assert result["regular"].path is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_prepare_images_reuses_cached(mocker, tmp_path):
+    pipeline = WeatherPipeline()
+
+    # Arrange: a forced re-run of a chart that was rendered before
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    mock_render = mocker.patch(
+        "src.orchestration.pipeline.render_pdf_page",
+        return_value=Image.new("RGB", (1024, 723)),
+    )
+    chart = {"hash": "abc123", "path": tmp_path / "chart.pdf"}
+    first = pipeline._prepare_images(chart)
+
+    # Act
+    result = pipeline._prepare_images(chart)
+
+    # Assert: the PDF is not rendered again
+    mock_render.assert_called_once()
+    assert result["small"].encode() == first["small"].encode()
+    assert result["regular"].path == first["regular"].path
+
+
+def test_prepare_images_rerenders_when_parameters_change(mocker, tmp_path):
+    pipeline = WeatherPipeline()
+
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    mock_render = mocker.patch(
+        "src.orchestration.pipeline.render_pdf_page",
+        return_value=Image.new("RGB", (1024, 723)),
+    )
+    chart = {"hash": "abc123", "path": tmp_path / "chart.pdf"}
+    pipeline._prepare_images(chart)
+
+    mocker.patch.dict(
+        "src.orchestration.pipeline.IMAGE_DERIVATIVES",
+        {"small": ("weather_small", (200, None), "webp")},
+    )
+    result = pipeline._prepare_images(chart)
+
+    assert mock_render.call_count == 2
+    assert result["small"].image.size == (200, 141)
+    assert result["small"].name == "weather_small.webp"
+
+
+def test_prepare_images_with_roi_tiles(mocker, tmp_path):
+    pipeline = WeatherPipeline()
+
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    mocker.patch("src.orchestration.pipeline.MODEL_ROI", (0.3, 0.2, 0.7, 0.6))
+    mocker.patch("src.orchestration.pipeline.MODEL_TILES", (2, 2))
+    page = Image.new("RGB", (1024, 723), "white")
+    region = Image.new("RGB", (768, 768), "white")
+    mock_render = mocker.patch(
+        "src.orchestration.pipeline.render_pdf_page", side_effect=[page, region]
+    )
+
+    result = pipeline._prepare_images({"hash": "abc123", "path": tmp_path / "x.pdf"})
+
+    # The region is rendered once at full tile resolution
+    assert mock_render.call_args_list[1] == mocker.call(
+        tmp_path / "x.pdf",
+        page=1,
+        size=(768, 768),
+        crop=(0.3, 0.2, 0.7, 0.6),
+        backend="pdfium",
+    )
+    tiles = sorted(k for k in result if k.startswith("tile_"))
+    assert tiles == ["tile_00", "tile_01", "tile_02", "tile_03"]
+    assert all(result[k].image.size == (384, 384) for k in tiles)
+    assert result["regular"].image.size == (384, 384)
+    assert result["tile_03"].name == "weather_tile_03.png"
+    assert result["medium"].image is page
+
+    # Tiles are cached with the rest
+    assert pipeline._prepare_images({"hash": "abc123", "path": tmp_path / "x.pdf"})
+    assert mock_render.call_count == 2
+
+
+def test_generate_forecast_with_tiles(mocker):
+    pipeline = WeatherPipeline()
+    mocker.patch("src.orchestration.pipeline.CACHE_FORECASTS", False)
+
+    overview = Image.new("RGB", (384, 384))
+    tiles = [Image.new("RGB", (384, 384)) for _ in range(2)]
+    images = {
+        "regular": ChartImage("weather.png", overview),
+        "tile_01": ChartImage("weather_tile_01.png", tiles[1]),
+        "tile_00": ChartImage("weather_tile_00.png", tiles[0]),
+    }
+    mocker.patch(
+        "src.orchestration.pipeline.ForecastServiceClient.is_available",
+        return_value=False,
+    )
+    mock_weather_vision = mocker.patch(
+        "src.forecast.generator.WeatherVision", autospec=True
+    )
+    mock_weather_vision.return_value.generate_forecast.return_value = "Title\nBody"
+
+    pipeline._generate_forecast(images)
+
+    # Overview then tiles in order, one <image> placeholder each
+    mock_weather_vision.return_value.generate_forecast.assert_called_once_with(
+        [overview, tiles[0], tiles[1]],
+        "Title and description\n<image><image><image>",
+        max_tokens=150,
+    )
 
 
 def test_generate_forecast(mocker):
     pipeline = WeatherPipeline()
+    mocker.patch("src.orchestration.pipeline.CACHE_FORECASTS", False)
 
     # Arrange
+    regular = Image.new("RGB", (384, 384))
     fake_images = {
-        "regular": Path("/fake/weather.png"),
-        "small": Path("/fake/weather_small.png"),
+        "regular": ChartImage("weather.png", regular),
+        "small": ChartImage("weather_small.png", data=b"png"),
     }
 
     fake_forecast = "Today's weather forecast:\nSunny with scattered clouds"
@@ -139,8 +356,12 @@ def test_generate_forecast(mocker):
         "content": "Sunny with scattered clouds",
     }
 
+    mocker.patch(
+        "src.orchestration.pipeline.ForecastServiceClient.is_available",
+        return_value=False,
+    )
     mock_weather_vision = mocker.patch(
-        "src.orchestration.pipeline.WeatherVision", autospec=True
+        "src.forecast.generator.WeatherVision", autospec=True
     )
     mock_weather_vision.return_value.generate_forecast.return_value = fake_forecast
 
@@ -149,15 +370,108 @@ def test_generate_forecast(mocker):
 
     # Assert
     assert result == expected
+    mock_weather_vision.return_value.generate_forecast.assert_called_once_with(
+        regular, "Title and description\n<image>", max_tokens=150
+    )
+
+
+def test_generate_forecast_uses_running_service(mocker):
+    pipeline = WeatherPipeline()
+    mocker.patch("src.orchestration.pipeline.CACHE_FORECASTS", False)
+    regular = Image.new("RGB", (384, 384))
+
+    mock_client = mocker.patch(
+        "src.orchestration.pipeline.ForecastServiceClient", autospec=True
+    )
+    mock_client.return_value.is_available.return_value = True
+    mock_client.return_value.generate_forecast.return_value = "Title\nBody"
+    mock_weather_vision = mocker.patch(
+        "src.forecast.generator.WeatherVision", autospec=True
+    )
+    # The limit in the forecast cache key is the one generation uses
+    mocker.patch("src.forecast.config.MAX_TOKENS", 80)
+
+    result = pipeline._generate_forecast(
+        {"regular": ChartImage("weather.png", regular)}
+    )
+
+    assert result == {"title": "Title", "content": "Body"}
+    mock_client.return_value.generate_forecast.assert_called_once_with(
+        regular, "Title and description\n<image>", max_tokens=80
+    )
+    mock_weather_vision.assert_not_called()
+
+
+def test_generate_forecast_falls_back_when_service_fails(mocker):
+    pipeline = WeatherPipeline()
+    mocker.patch("src.orchestration.pipeline.CACHE_FORECASTS", False)
+    regular = Image.new("RGB", (384, 384))
+
+    mock_client = mocker.patch(
+        "src.orchestration.pipeline.ForecastServiceClient", autospec=True
+    )
+    mock_client.return_value.is_available.return_value = True
+    mock_client.return_value.generate_forecast.side_effect = ForecastServiceError(
+        "connection reset"
+    )
+    mock_weather_vision = mocker.patch(
+        "src.forecast.generator.WeatherVision", autospec=True
+    )
+    mock_weather_vision.return_value.generate_forecast.return_value = "Title\nBody"
+
+    result = pipeline._generate_forecast(
+        {"regular": ChartImage("weather.png", regular)}
+    )
+
+    assert result == {"title": "Title", "content": "Body"}
+    mock_weather_vision.return_value.generate_forecast.assert_called_once()
+
+
+def test_generate_forecast_is_cached(mocker, tmp_path):
+    mocker.patch("src.orchestration.pipeline.DATA_DIR", str(tmp_path))
+    mocker.patch(
+        "src.orchestration.pipeline.ForecastServiceClient.is_available",
+        return_value=False,
+    )
+    mock_weather_vision = mocker.patch(
+        "src.forecast.generator.WeatherVision", autospec=True
+    )
+    mock_weather_vision.return_value.generate_forecast.return_value = "Title\nBody"
+
+    def images():
+        # A fresh decode of the same chart, as on a --force re-run
+        return {"regular": ChartImage("weather.png", Image.new("RGB", (384, 384)))}
+
+    first = WeatherPipeline()._generate_forecast(images())
+    second = WeatherPipeline(force=True)._generate_forecast(images())
+
+    assert first == second == {"title": "Title", "content": "Body"}
     mock_weather_vision.return_value.generate_forecast.assert_called_once()
 
+    # A different chart is a miss
+    other = {"regular": ChartImage("weather.png", Image.new("RGB", (384, 384), 1))}
+    WeatherPipeline()._generate_forecast(other)
+    assert mock_weather_vision.return_value.generate_forecast.call_count == 2
+
+    # The bypass flag runs the model again and refreshes the entry
+    mock_weather_vision.return_value.generate_forecast.return_value = "New\nText"
+    refreshed = WeatherPipeline(refresh_forecast=True)._generate_forecast(images())
+    assert refreshed == {"title": "New", "content": "Text"}
+    assert WeatherPipeline()._generate_forecast(images()) == refreshed
+    assert mock_weather_vision.return_value.generate_forecast.call_count == 3
+
+    # Another model setting is a miss too
+    mocker.patch("src.forecast.config.DTYPE", "float16")
+    WeatherPipeline()._generate_forecast(images())
+    assert mock_weather_vision.return_value.generate_forecast.call_count == 4
+
 
 def test_publish_salesforce(mocker):
     pipeline = WeatherPipeline()
 
     # Arrange
     fake_sf = mocker.patch(
-        "src.orchestration.pipeline.SFWeatherClient",
+        "src.salesforce.weather.SFWeatherClient",
         autospec=True,
     ).return_value
 
@@ -166,7 +480,7 @@ def test_publish_salesforce(mocker):
     fake_sf.upsert_report.return_value = fake_report
 
     chart = {"hash": "abc123"}
-    images = {"small": Path("/fake/small.png")}
+    images = {"small": ChartImage("weather_small.png", data=b"png-bytes")}
     forecast = {"content": "Sunny"}
 
     # Act
@@ -176,6 +490,7 @@ def test_publish_salesforce(mocker):
     fake_sf.upsert_report.assert_called_once_with("abc123", "Sunny")
     fake_sf.ensure_preview_image.assert_called_once_with(
         "REPORT123",
-        images["small"],
+        "weather_small.png",
+        data=b"png-bytes",
     )
     assert result is fake_report
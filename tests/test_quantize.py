@@ -0,0 +1,113 @@
+import pytest
+import torch
+from torch import nn
+from unittest.mock import patch
+
+from src.forecast.quantize import (
+    QUANTIZATIONS,
+    Int4WeightOnlyLinear,
+    Int8WeightOnlyLinear,
+    quantize_model,
+)
+
+
+def tiny_llava():
+    """A tiny randomly initialized LLaVA; "5" is the image token."""
+    from transformers import (
+        LlavaConfig,
+        LlavaForConditionalGeneration,
+        Qwen2Config,
+        SiglipVisionConfig,
+    )
+
+    torch.manual_seed(0)
+    config = LlavaConfig(
+        vision_config=SiglipVisionConfig(
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            image_size=28,
+            patch_size=14,
+        ),
+        text_config=Qwen2Config(
+            vocab_size=96,
+            hidden_size=64,
+            intermediate_size=128,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            num_key_value_heads=2,
+        ),
+        image_token_id=5,
+        vision_feature_select_strategy="full",
+        vision_feature_layer=-1,
+    )
+    return LlavaForConditionalGeneration(config).eval()
+
+
+def generate(model):
+    torch.manual_seed(1)
+    input_ids = torch.tensor([[1, 2] + [5] * 4 + [3]])
+    with torch.no_grad():
+        return model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            pixel_values=torch.rand(1, 3, 28, 28),
+            max_new_tokens=5,
+            do_sample=False,
+            output_scores=True,
+            return_dict_in_generate=True,
+        )
+
+
+@pytest.mark.parametrize(
+    "layer_cls, tolerance", [(Int8WeightOnlyLinear, 0.05), (Int4WeightOnlyLinear, 0.5)]
+)
+def test_weight_only_linear_close_to_float(layer_cls, tolerance):
+    torch.manual_seed(0)
+    linear = nn.Linear(128, 64)
+    x = torch.randn(2, 3, 128)
+
+    layer = layer_cls.from_linear(linear)
+
+    assert layer(x).shape == (2, 3, 64)
+    assert torch.allclose(layer(x), linear(x), atol=tolerance)
+
+
+@pytest.mark.parametrize("quantization", QUANTIZATIONS)
+def test_quantized_model_generates_like_float_model(quantization):
+    expected = generate(tiny_llava())
+
+    model = quantize_model(tiny_llava(), quantization)
+    out = generate(model)
+
+    assert torch.allclose(out.scores[0], expected.scores[0], atol=0.2)
+    if quantization != "int4":  # 4-bit rounding may flip later tokens
+        assert out.sequences.tolist() == expected.sequences.tolist()
+    assert not isinstance(model.get_decoder().layers[0].mlp.up_proj, nn.Linear)
+    # The vision tower is left in full precision
+    assert all(
+        isinstance(m, nn.Linear)
+        for m in model.model.vision_tower.modules()
+        if "Linear" in type(m).__name__
+    )
+
+
+@pytest.mark.parametrize("quantization", QUANTIZATIONS)
+def test_quantized_layers_are_saved_and_reloaded(quantization, tmp_path):
+    path = tmp_path / "quantized" / "model.pt"
+    expected = generate(quantize_model(tiny_llava(), quantization, path))
+    assert path.exists()
+
+    with patch("src.forecast.quantize._quantize_layer") as quantize_layer:
+        model = quantize_model(tiny_llava(), quantization, path)
+    out = generate(model)
+
+    quantize_layer.assert_not_called()
+    assert out.sequences.tolist() == expected.sequences.tolist()
+    assert torch.allclose(out.scores[0], expected.scores[0])
+
+
+def test_unknown_quantization():
+    with pytest.raises(ValueError):
+        quantize_model(tiny_llava(), "int2")
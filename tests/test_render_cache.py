@@ -0,0 +1,58 @@
+from PIL import Image
+
+from src.chart.processors.image_tools import ChartImage
+from src.chart.render_cache import RenderCache, RenderKey
+
+
+def make_key(pdf_hash="abc", backend="pdfium-1"):
+    return RenderKey(
+        pdf_hash=pdf_hash,
+        page=1,
+        dpi=None,
+        derivatives=(("small", "weather_small", (300, None), "png-fast"),),
+        backend=backend,
+    )
+
+
+def make_images(color="red"):
+    return {
+        "small": ChartImage(
+            "weather_small.png", Image.new("RGB", (30, 20), color), encoding="png-fast"
+        )
+    }
+
+
+def test_put_then_get_round_trip(tmp_path):
+    cache = RenderCache(tmp_path)
+    images = make_images()
+
+    cache.put(make_key(), images)
+    cached = cache.get(make_key())
+
+    assert cached["small"].encode() == images["small"].encode()
+    assert cached["small"].path == images["small"].path
+    assert cached["small"].path.parent == cache.entry_path(cache.digest(make_key()))
+    assert cached["small"].encoding == "png-fast"
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_truncated_file_is_discarded(tmp_path):
+    cache = RenderCache(tmp_path)
+    images = make_images()
+    cache.put(make_key(), images)
+
+    # Truncate one derivative on disk
+    path = images["small"].path
+    path.write_bytes(path.read_bytes()[:10])
+
+    assert cache.get(make_key()) is None
+    assert not cache.entry_path(cache.digest(make_key())).exists()
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = RenderCache(tmp_path)
+    images = make_images()
+    cache.put(make_key(), images)
+    images["small"].path.unlink()
+
+    assert cache.get(make_key()) is None
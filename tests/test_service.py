@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+from PIL import Image
+from unittest.mock import MagicMock
+
+from src.forecast.service import (
+    ForecastServer,
+    ForecastService,
+    ForecastServiceClient,
+    ForecastServiceError,
+)
+
+
+@pytest.fixture
+def vision():
+    vision = MagicMock()
+    vision.generate_forecast.return_value = "Sunny\nClear skies"
+    return vision
+
+
+@pytest.fixture
+def server(vision):
+    """A ForecastServer on a free localhost port, with a fake model."""
+    service = ForecastService(model_factory=lambda: vision)
+    service.load()
+    server = ForecastServer(("127.0.0.1", 0), service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def unused_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_client_round_trip(server, vision):
+    client = ForecastServiceClient(f"http://127.0.0.1:{server.server_port}")
+    img = Image.new("RGB", (32, 32), color=(10, 20, 30))
+
+    assert client.is_available()
+    text = client.generate_forecast(img, "Title and description\n<image>", 50)
+
+    assert text == "Sunny\nClear skies"
+    sent, prompt, max_tokens = vision.generate_forecast.call_args.args
+    assert sent.tobytes() == img.tobytes()  # lossless transfer
+    assert (prompt, max_tokens) == ("Title and description\n<image>", 50)
+    assert server.service.health()["served"] == 1
+
+
+def test_client_sends_several_images_as_one_request(server, vision):
+    client = ForecastServiceClient(f"http://127.0.0.1:{server.server_port}")
+    images = [Image.new("RGB", (8, 8), color=c) for c in ("red", "blue")]
+
+    client.generate_forecast(images, "<image><image>")
+
+    sent = vision.generate_forecast.call_args.args[0]
+    assert [img.getpixel((0, 0)) for img in sent] == [(255, 0, 0), (0, 0, 255)]
+
+
+def test_client_answers_several_prompts(server, vision):
+    vision.generate_answers.return_value = ["Title", "Summary"]
+    client = ForecastServiceClient(f"http://127.0.0.1:{server.server_port}")
+    img = Image.new("RGB", (8, 8), color="red")
+
+    texts = client.generate_answers(img, ["Title <image>", "Summary <image>"], 40)
+
+    assert texts == ["Title", "Summary"]
+    sent, prompts, max_tokens = vision.generate_answers.call_args.args
+    assert [i.tobytes() for i in sent] == [img.tobytes()]
+    assert (prompts, max_tokens) == (["Title <image>", "Summary <image>"], 40)
+
+
+def test_client_reports_service_errors(server, vision):
+    vision.generate_forecast.side_effect = RuntimeError("out of memory")
+    client = ForecastServiceClient(f"http://127.0.0.1:{server.server_port}")
+
+    with pytest.raises(ForecastServiceError, match="500"):
+        client.generate_forecast(Image.new("RGB", (8, 8)), "<image>")
+
+
+def test_client_without_service(unused_port):
+    client = ForecastServiceClient(f"http://127.0.0.1:{unused_port}")
+
+    assert not client.is_available()
+    with pytest.raises(ForecastServiceError):
+        client.generate_forecast(Image.new("RGB", (8, 8)), "<image>")
+
+
+def test_service_is_not_ready_before_load():
+    service = ForecastService(model_factory=MagicMock())
+
+    assert service.health()["status"] == "loading"
+    with pytest.raises(ForecastServiceError):
+        service.generate([Image.new("RGB", (8, 8))], "<image>")
+
+
+def test_reload_swaps_in_a_new_model():
+    old, new = MagicMock(), MagicMock()
+    factory = MagicMock(side_effect=[old, new])
+    service = ForecastService(model_factory=factory)
+    service.load()
+
+    service.load()
+    service.generate([Image.new("RGB", (8, 8))], "<image>")
+
+    assert service.vision is new
+    new.generate_forecast.assert_called_once()
+    old.generate_forecast.assert_not_called()
+
+
+def test_load_registers_prefixes_on_every_model(tmp_path):
+    models = [MagicMock(), MagicMock()]
+    service = ForecastService(
+        model_factory=MagicMock(side_effect=models),
+        prefixes=["System prompt\n"],
+        prefix_cache_dir=tmp_path,
+    )
+
+    service.load()
+    service.load()  # reload
+
+    for model in models:
+        model.register_prefix.assert_called_once_with("System prompt\n", tmp_path)
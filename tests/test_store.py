@@ -0,0 +1,144 @@
+import os
+import time
+from typing import NamedTuple
+
+from src.chart.store import (
+    ChartStore,
+    KeyedCache,
+    LRUDirectoryStore,
+    RetentionPolicy,
+)
+
+
+def add_entry(store, pdf_hash, data=b"PDF", last_used=None):
+    """Put a PDF into the store and optionally backdate its last use."""
+    src = store.root / f"{pdf_hash}.part"
+    store.root.mkdir(parents=True, exist_ok=True)
+    src.write_bytes(data)
+    store.add(src, pdf_hash)
+    if last_used is not None:
+        os.utime(store.entry_path(pdf_hash), (last_used, last_used))
+
+
+def test_add_and_contains(tmp_path):
+    store = ChartStore(tmp_path)
+    add_entry(store, "aaa", b"PDF-A")
+
+    assert store.contains("aaa")
+    assert not store.contains("bbb")
+    assert not store.contains(None)
+    assert store.pdf_path("aaa").read_bytes() == b"PDF-A"
+
+
+def test_evict_keeps_n_most_recently_used(tmp_path):
+    now = time.time()
+    store = ChartStore(tmp_path, RetentionPolicy(keep=2, max_bytes=None, max_age=None))
+    add_entry(store, "old", last_used=now - 30)
+    add_entry(store, "mid", last_used=now - 20)
+    add_entry(store, "new", last_used=now - 10)
+
+    evicted = store.evict()
+
+    assert evicted == ["old"]
+    assert [e.name for e in store.entries()] == ["mid", "new"]
+
+
+def test_touch_refreshes_lru_order(tmp_path):
+    now = time.time()
+    store = ChartStore(tmp_path, RetentionPolicy(keep=1, max_bytes=None, max_age=None))
+    add_entry(store, "first", last_used=now - 20)
+    add_entry(store, "second", last_used=now - 10)
+
+    store.touch("first")
+    store.evict()
+
+    assert [e.name for e in store.entries()] == ["first"]
+
+
+def test_evict_by_bytes_counts_every_file_of_an_entry(tmp_path):
+    now = time.time()
+    store = LRUDirectoryStore(
+        tmp_path, RetentionPolicy(keep=None, max_bytes=15, max_age=None)
+    )
+    for name, files, last_used in [
+        ("a", {"one.bin": 5}, now - 20),
+        ("b", {"one.bin": 5, "two.bin": 8}, now - 10),
+    ]:
+        store.entry_path(name).mkdir(parents=True)
+        for file, size in files.items():
+            (store.entry_path(name) / file).write_bytes(b"x" * size)
+        os.utime(store.entry_path(name), (last_used, last_used))
+
+    assert store.evict() == ["a"]
+
+
+def test_entries_skip_entries_being_written(tmp_path):
+    store = ChartStore(tmp_path, RetentionPolicy(keep=0, max_bytes=None, max_age=None))
+    add_entry(store, "done")
+    (tmp_path / "abc.part").mkdir()
+
+    assert [e.name for e in store.entries()] == ["done"]
+    assert store.evict() == ["done"]
+    assert (tmp_path / "abc.part").exists()
+
+
+def test_evict_by_age_respects_protect(tmp_path):
+    now = time.time()
+    store = ChartStore(tmp_path, RetentionPolicy(keep=None, max_bytes=None, max_age=60))
+    add_entry(store, "stale", last_used=now - 3600)
+    add_entry(store, "current", last_used=now - 3600)
+
+    assert store.evict(protect={"current"}) == ["stale"]
+    assert store.contains("current")
+
+
+class TextKey(NamedTuple):
+    name: str
+    options: tuple = ()
+
+
+class TextCache(KeyedCache):
+    def _encode(self, directory, text):
+        return {"text": text}
+
+    def _decode(self, entry, record):
+        return record["text"]
+
+
+def test_keyed_cache_round_trip(tmp_path):
+    cache = TextCache(tmp_path)
+
+    assert cache.get(TextKey("a")) is None
+    entry = cache.put(TextKey("a", (("size", 1),)), "text")
+
+    assert entry == cache.entry_path(cache.digest(TextKey("a", (("size", 1),))))
+    assert cache.get(TextKey("a", (("size", 1),))) == "text"
+    # Every key field selects the entry
+    assert cache.get(TextKey("b", (("size", 1),))) is None
+    assert cache.get(TextKey("a", (("size", 2),))) is None
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_keyed_cache_discards_corrupt_entry(tmp_path):
+    cache = TextCache(tmp_path)
+    entry = cache.put(TextKey("a"), "text")
+    (entry / TextCache.RECORD_JSON).write_text('{"key": ')
+
+    assert cache.get(TextKey("a")) is None
+    assert not entry.exists()
+
+
+def test_keyed_cache_get_refreshes_lru_order(tmp_path):
+    cache = TextCache(tmp_path, RetentionPolicy(keep=2, max_bytes=None, max_age=None))
+    now = time.time()
+    for n, name in enumerate(["old", "mid"]):
+        entry = cache.put(TextKey(name), name)
+        os.utime(entry, (now - 30 + n, now - 30 + n))
+
+    # Reading "old" makes it the most recently used entry
+    assert cache.get(TextKey("old")) == "old"
+    cache.put(TextKey("new"), "new")
+
+    assert cache.get(TextKey("mid")) is None
+    assert cache.get(TextKey("old")) == "old"
+    assert cache.get(TextKey("new")) == "new"
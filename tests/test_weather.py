@@ -1,3 +1,4 @@
+import base64
 import builtins
 import pytest
 from unittest.mock import patch, MagicMock
@@ -184,3 +185,26 @@ def test_ensure_preview_image_uploads_if_missing(mock_env, tmp_path):
 
             assert result == "CV_NEW"
             fake_sf.ContentVersion.create.assert_called_once()
+
+
+def test_ensure_preview_image_uploads_in_memory_data(mock_env):
+    """Encoded bytes are uploaded without reading the file."""
+    fake_sf = MagicMock()
+    fake_sf.ContentVersion.create.return_value = {"id": "CV_NEW"}
+
+    with patch.object(SFWeatherClient, "__init__", lambda self: None):
+        client = SFWeatherClient()
+        client.sf = fake_sf
+        client.query = MagicMock(return_value=[])
+
+        result = client.ensure_preview_image(
+            record_id="REC123",
+            file_path="weather_small.png",
+            data=b"png-bytes",
+        )
+
+    assert result == "CV_NEW"
+    body = fake_sf.ContentVersion.create.call_args.args[0]
+    assert body["Title"] == "weather_small"
+    assert body["PathOnClient"] == "weather_small.png"
+    assert body["VersionData"] == base64.b64encode(b"png-bytes").decode()